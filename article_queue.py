@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+事前リサーチ結果のキュー
+バックグラウンドで集めて分析済みの素材をSQLiteに有効期限付きで保存し、投稿時は最新のものを取り出すだけにする
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# キューの設定（環境変数で上書き可能）
+ARTICLE_QUEUE_DB = os.getenv('ARTICLE_QUEUE_DB', os.path.join('.cache', 'article_queue.sqlite3'))
+# 事前リサーチ結果を投稿に使える時間
+ARTICLE_QUEUE_TTL_HOURS = float(os.getenv('ARTICLE_QUEUE_TTL_HOURS', '6'))
+# 期限切れの素材を削除せずに残しておく時間（後から調べる用）
+ARTICLE_QUEUE_KEEP_DAYS = float(os.getenv('ARTICLE_QUEUE_KEEP_DAYS', '7'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS research (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    summary TEXT NOT NULL,
+    articles TEXT NOT NULL DEFAULT '[]',
+    source TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS taken (
+    research_id INTEGER NOT NULL REFERENCES research(id) ON DELETE CASCADE,
+    consumer TEXT NOT NULL,
+    taken_at REAL NOT NULL,
+    PRIMARY KEY (research_id, consumer)
+);
+CREATE INDEX IF NOT EXISTS idx_research_expires ON research(expires_at);
+"""
+
+
+class ArticleQueue:
+    """
+    事前リサーチ結果のキュー
+
+    素材は利用者（スクリプト名）ごとに1回だけ取り出せる。
+    generate_tweet と x_ai_smart_post が同じキューを使っても、それぞれが最新の素材を受け取る。
+
+    Args:
+        path: SQLiteファイルのパス
+        ttl_hours: 追加した素材の有効期限（時間）
+    """
+
+    def __init__(self, path: str = ARTICLE_QUEUE_DB, ttl_hours: float = ARTICLE_QUEUE_TTL_HOURS):
+        self.path = path
+        self.ttl_hours = ttl_hours
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA foreign_keys = ON')
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def put(self, summary: str, articles: list = None, source: str = '') -> int:
+        """
+        分析済みの素材を追加する
+
+        Args:
+            summary: 分析結果（選別した話題とバズりそうな理由）
+            articles: 分析に使った記事のリスト
+            source: 追加元（スクリプト名など）
+
+        Returns:
+            int: 追加した素材のID
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'INSERT INTO research (summary, articles, source, created_at, expires_at) VALUES (?, ?, ?, ?, ?)',
+                (summary, json.dumps(articles or [], ensure_ascii=False), source,
+                 now, now + self.ttl_hours * 3600)
+            )
+        return cursor.lastrowid
+
+    def take(self, consumer: str, allow_expired: bool = False) -> dict:
+        """
+        有効期限内で最新の、まだ取り出していない素材を取り出す
+
+        Args:
+            consumer: 利用者名
+            allow_expired: 期限切れ（削除前）の素材も対象にする。その場でのリサーチも失敗したとき用
+
+        Returns:
+            dict: {"id", "summary", "articles", "age_seconds"}。なければNone
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                """
+                SELECT r.id, r.summary, r.articles, r.created_at
+                FROM research r
+                WHERE r.expires_at > ?
+                  AND NOT EXISTS (SELECT 1 FROM taken t WHERE t.research_id = r.id AND t.consumer = ?)
+                ORDER BY r.created_at DESC
+                LIMIT 1
+                """,
+                (0 if allow_expired else now, consumer)
+            ).fetchone()
+            if row is None:
+                return None
+            research_id, summary, articles, created_at = row
+            self._conn.execute(
+                'INSERT INTO taken (research_id, consumer, taken_at) VALUES (?, ?, ?)',
+                (research_id, consumer, now)
+            )
+        return {
+            "id": research_id,
+            "summary": summary,
+            "articles": json.loads(articles),
+            "age_seconds": now - created_at,
+        }
+
+    def pending(self, consumer: str) -> int:
+        """利用者がまだ取り出していない有効な素材の数"""
+        with self._lock:
+            (count,) = self._conn.execute(
+                """
+                SELECT COUNT(*) FROM research r
+                WHERE r.expires_at > ?
+                  AND NOT EXISTS (SELECT 1 FROM taken t WHERE t.research_id = r.id AND t.consumer = ?)
+                """,
+                (time.time(), consumer)
+            ).fetchone()
+        return count
+
+    def prune(self, keep_days: float = ARTICLE_QUEUE_KEEP_DAYS) -> int:
+        """
+        期限切れから一定期間たった素材を削除する
+
+        Args:
+            keep_days: 期限切れ後に残しておく日数
+
+        Returns:
+            int: 削除した件数
+        """
+        cutoff = time.time() - keep_days * 86400
+        with self._lock, self._conn:
+            cursor = self._conn.execute('DELETE FROM research WHERE expires_at < ?', (cutoff,))
+        if cursor.rowcount:
+            logger.info(f"事前リサーチ結果を{cursor.rowcount}件削除しました")
+        return cursor.rowcount
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue() -> ArticleQueue:
+    """
+    プロセス内で共有するキューを返す（初回に古い素材を削除する）
+
+    Returns:
+        ArticleQueue: キュー
+    """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = ArticleQueue()
+            _queue.prune()
+        return _queue
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+記事のローカル事前ランキング
+AI分野の語彙とのTF-IDF関連度・新しさ・報道の広がり・過去ツイートに対する新規性をNumPyの行列演算でまとめて計算し、
+上位の記事だけをLLMに渡す
+"""
+
+import logging
+import os
+import re
+import unicodedata
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# 事前ランキングの設定（環境変数で上書き可能）
+PRERANK_TOP_K = int(os.getenv('PRERANK_TOP_K', '15'))
+# 新しさの点数が半分になる記事の経過時間
+PRERANK_HALF_LIFE_HOURS = float(os.getenv('PRERANK_HALF_LIFE_HOURS', '12'))
+# 同じソースの2件目以降にかける係数（2件目は0.8倍、3件目は0.64倍…）
+PRERANK_SOURCE_DECAY = float(os.getenv('PRERANK_SOURCE_DECAY', '0.8'))
+
+# 評価項目の重み
+PRERANK_WEIGHTS = {
+    'relevance': 0.4,
+    'recency': 0.25,
+    'novelty': 0.2,
+    'coverage': 0.15,
+}
+
+# AI分野の語彙（重み付き）。関連度はこの語彙を1つの文書とみなしたTF-IDFのコサイン類似度
+AI_TOPIC_VOCABULARY = {
+    '生成AI': 3.0, 'AI': 2.0, '人工知能': 2.0, 'LLM': 2.5, '大規模言語モデル': 2.5,
+    'ChatGPT': 2.5, 'GPT': 2.5, 'OpenAI': 2.5, 'Claude': 2.0, 'Anthropic': 2.0,
+    'Gemini': 2.0, 'Google': 1.0, 'DeepMind': 1.5, 'Llama': 1.5, 'Meta': 1.0,
+    'Microsoft': 1.0, 'Copilot': 1.5, 'NVIDIA': 1.5, 'エージェント': 2.0, 'マルチモーダル': 1.5,
+    '画像生成': 2.0, '動画生成': 2.0, '音声': 1.0, 'モデル': 1.5, 'API': 1.0,
+    '発表': 1.0, '公開': 1.0, 'リリース': 1.0, '新機能': 1.5, 'ベンチマーク': 1.0,
+    'オープンソース': 1.0, '推論': 1.0, '学習': 0.5,
+}
+
+# 特徴量ハッシュの次元数（語彙を持たずに行列の大きさを固定する）
+FEATURE_DIM = 4096
+NGRAM_SIZE = 2
+
+_ASCII_WORD = re.compile(r'[a-z0-9]+')
+_WORD_CHUNK = re.compile(r'[^\W_]+')
+_RELATIVE_AGE = re.compile(r'(\d+)\s*(秒|分|時間|日|週間|か月|ヶ月|年)前')
+_DATE = re.compile(r'(\d{4})[/年.-](\d{1,2})[/月.-](\d{1,2})')
+_AGE_UNITS = {
+    '秒': 1 / 3600, '分': 1 / 60, '時間': 1, '日': 24, '週間': 24 * 7,
+    'か月': 24 * 30, 'ヶ月': 24 * 30, '年': 24 * 365,
+}
+
+
+def text_features(text: str) -> list:
+    """
+    テキストの特徴量（ハッシュした列番号）のリスト
+
+    日本語は文字bigram、英数字は単語単位にする。
+    """
+    normalized = unicodedata.normalize('NFKC', text or '').lower()
+    features = [f"w:{word}" for word in _ASCII_WORD.findall(normalized)]
+    body = _ASCII_WORD.sub(' ', normalized)
+    for chunk in _WORD_CHUNK.findall(body):
+        if len(chunk) < NGRAM_SIZE:
+            features.append(f"c:{chunk}")
+        else:
+            features.extend(f"c:{chunk[i:i + NGRAM_SIZE]}" for i in range(len(chunk) - NGRAM_SIZE + 1))
+    return [zlib.crc32(feature.encode('utf-8')) % FEATURE_DIM for feature in features]
+
+
+def term_matrix(texts: list, weights: list = None) -> np.ndarray:
+    """
+    テキストの出現回数行列（テキスト数 × FEATURE_DIM）
+
+    Args:
+        texts: テキストのリスト
+        weights: テキストごとの重み（Noneなら1）
+
+    Returns:
+        np.ndarray: 出現回数（float32）
+    """
+    features = [text_features(text) for text in texts]
+    lengths = np.fromiter((len(f) for f in features), dtype=np.int64, count=len(features))
+    rows = np.repeat(np.arange(len(texts)), lengths)
+    cols = np.fromiter((col for f in features for col in f), dtype=np.int64, count=int(lengths.sum()))
+    values = np.repeat(np.asarray(weights, dtype=np.float32), lengths) if weights else np.float32(1.0)
+    matrix = np.zeros((len(texts), FEATURE_DIM), dtype=np.float32)
+    np.add.at(matrix, (rows, cols), values)
+    return matrix
+
+
+def _l2_normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def article_age_hours(published: str, now: datetime = None) -> float:
+    """
+    記事の経過時間（時間）
+
+    フィードのISO 8601日時と、検索結果の「3 時間前」「2025/04/15」形式に対応する。
+
+    Returns:
+        float: 経過時間。読めなければNone
+    """
+    if not published:
+        return None
+    now = now or datetime.now(timezone.utc)
+    try:
+        parsed = datetime.fromisoformat(published)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return max((now - parsed).total_seconds() / 3600, 0.0)
+    except ValueError:
+        pass
+    match = _RELATIVE_AGE.search(published)
+    if match:
+        return int(match.group(1)) * _AGE_UNITS[match.group(2)]
+    match = _DATE.search(published)
+    if match:
+        try:
+            parsed = datetime(*map(int, match.groups()), tzinfo=timezone(timedelta(hours=9)))
+        except ValueError:
+            return None
+        return max((now - parsed).total_seconds() / 3600, 0.0)
+    return None
+
+
+def _source_ranks(sources: list, scores: np.ndarray) -> np.ndarray:
+    """同じソースの中での順位（点数の高い順に0, 1, 2, …）"""
+    _, codes = np.unique(np.asarray(sources, dtype=object).astype(str), return_inverse=True)
+    order = np.lexsort((-scores, codes))
+    sorted_codes = codes[order]
+    # ソースが切り替わる位置からの距離が順位になる
+    starts = np.r_[0, np.flatnonzero(np.diff(sorted_codes)) + 1]
+    group_start = np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order)) - group_start
+    return ranks
+
+
+def score_articles(articles: list, history_texts: list = None, now: datetime = None) -> np.ndarray:
+    """
+    記事ごとの事前スコア（0〜1）を計算する
+
+    Args:
+        articles: ニュース記事のリスト
+        history_texts: 新規性の比較対象（最近のツイート本文）
+        now: 現在時刻（Noneなら現在）
+
+    Returns:
+        np.ndarray: 記事ごとのスコア
+    """
+    texts = [f"{article.get('title', '')} {article.get('snippet', '')}" for article in articles]
+    counts = term_matrix(texts)
+
+    # TF-IDF（文書頻度は候補記事全体で数える）
+    document_frequency = (counts > 0).sum(axis=0)
+    idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+    documents = _l2_normalize(np.log1p(counts) * idf)
+
+    # 関連度: AI語彙とのコサイン類似度を最大値で割って0〜1にする
+    topic = term_matrix(list(AI_TOPIC_VOCABULARY), list(AI_TOPIC_VOCABULARY.values())).sum(axis=0, keepdims=True)
+    topic = _l2_normalize(np.log1p(topic) * idf)
+    relevance = (documents @ topic.T).ravel()
+    relevance = relevance / max(relevance.max(), 1e-12)
+
+    # 新しさ: 半減期で減衰する。日時が読めない記事は中間の点数
+    ages = [article_age_hours(article.get('published'), now) for article in articles]
+    ages = np.array([np.nan if age is None else age for age in ages], dtype=np.float64)
+    recency = np.where(np.isnan(ages), 0.5, np.exp2(-np.nan_to_num(ages) / PRERANK_HALF_LIFE_HOURS))
+
+    # 新規性: 最近のツイートとのコサイン類似度の最大値が高いほど低い
+    if history_texts:
+        history = _l2_normalize(np.log1p(term_matrix(history_texts)) * idf)
+        novelty = 1.0 - (documents @ history.T).max(axis=1)
+    else:
+        novelty = np.ones(len(articles))
+
+    # 報道の広がり: 重複除去でまとめられた記事数（複数ソースで報じられた話題ほど高い）
+    duplicates = np.array([article.get('duplicates') or 0 for article in articles], dtype=np.float64)
+    coverage = np.log1p(duplicates) / max(np.log1p(duplicates).max(), 1e-12) if duplicates.any() else np.zeros(len(articles))
+
+    scores = (
+        PRERANK_WEIGHTS['relevance'] * relevance
+        + PRERANK_WEIGHTS['recency'] * recency
+        + PRERANK_WEIGHTS['novelty'] * np.clip(novelty, 0.0, 1.0)
+        + PRERANK_WEIGHTS['coverage'] * coverage
+    )
+
+    # ソースの多様性: 同じソースの記事が上位を占めないように、ソース内の順位で減衰させる
+    sources = [article.get('source') or '' for article in articles]
+    return scores * np.power(PRERANK_SOURCE_DECAY, _source_ranks(sources, scores))
+
+
+def prerank_articles(articles: list, history_texts: list = None, top_k: int = PRERANK_TOP_K) -> list:
+    """
+    記事を事前スコアの高い順に並べ、上位top_k件を返す
+
+    各記事には "score" を付ける（プロンプトの詰め込み順にも使われる）。
+
+    Args:
+        articles: ニュース記事のリスト
+        history_texts: 新規性の比較対象（最近のツイート本文）
+        top_k: 返す最大件数
+
+    Returns:
+        list: 上位の記事のリスト
+    """
+    if not articles:
+        return []
+    scores = score_articles(articles, history_texts)
+    order = np.argsort(-scores, kind='stable')[:top_k]
+    ranked = [dict(articles[i], score=round(float(scores[i]), 4)) for i in order]
+    logger.info(f"事前ランキング: {len(articles)}件から上位{len(ranked)}件を選択")
+    return ranked
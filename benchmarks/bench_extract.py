@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+検索結果ページの記事抽出マイクロベンチマーク
+
+保存済みのページに対して、従来のBeautifulSoup（html.parser）による全体パースと、
+news_extract のlxml抽出・SoupStrainer抽出の1ページあたりの所要時間を比較する。
+
+使い方:
+    python benchmarks/bench_extract.py --repeat 200
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import news_extract  # noqa: E402
+from stand_ins import load_fixture_pages  # noqa: E402
+
+
+def baseline_extract(page: str, max_results: int = 5) -> list:
+    """従来の抽出方法（ページ全体をhtml.parserでパースしてCSSセレクタで探す）"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(page, 'html.parser')
+    articles = []
+    for item in soup.select('div.SoaBEf')[:max_results]:
+        title_elem = item.select_one('div.n0jPhd')
+        snippet_elem = item.select_one('div.GI74Re')
+        if title_elem:
+            articles.append({
+                "title": title_elem.get_text(strip=True),
+                "snippet": snippet_elem.get_text(strip=True) if snippet_elem else "",
+            })
+    return articles
+
+
+def strainer_extract(page: str, max_results: int = 5) -> list:
+    """SoupStrainerで結果コンテナだけをパースする抽出"""
+    return news_extract._extract_soup(page, news_extract.SELECTOR_PROFILES[0], max_results)
+
+
+def lxml_extract(page: str, max_results: int = 5) -> list:
+    """lxmlによる抽出（news_extract.extract_articles）"""
+    return news_extract.extract_articles(page, max_results=max_results)
+
+
+def measure(func, pages: list, repeat: int) -> float:
+    """1ページあたりの平均所要時間（ミリ秒）"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            func(page)
+    return (time.perf_counter() - started) / (repeat * len(pages)) * 1000
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="記事抽出のマイクロベンチマーク")
+    parser.add_argument('--repeat', type=int, default=100, help="ページごとの繰り返し回数")
+    args = parser.parse_args(argv)
+
+    pages = [page.decode('utf-8') for page in load_fixture_pages()]
+    extractors = [('bs4 html.parser (従来)', baseline_extract), ('bs4 SoupStrainer', strainer_extract)]
+    if news_extract.lxml_html is not None:
+        extractors.append(('lxml', lxml_extract))
+
+    # 抽出結果のタイトルが従来方式と一致することを確認する
+    expected = [[a['title'].replace('　', ' ') for a in baseline_extract(page)] for page in pages]
+    for name, func in extractors[1:]:
+        got = [[a['title'] for a in func(page)] for page in pages]
+        if got != expected:
+            print(f"警告: {name} の抽出結果が従来方式と一致しません")
+
+    baseline_ms = None
+    print(f"pages={len(pages)} repeat={args.repeat}")
+    print(f"{'extractor':<28}{'ms/page':>10}{'speedup':>10}")
+    for name, func in extractors:
+        ms = measure(func, pages, args.repeat)
+        baseline_ms = baseline_ms or ms
+        print(f"{name:<28}{ms:>10.3f}{baseline_ms / ms:>9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
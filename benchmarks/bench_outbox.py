@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+送信箱と投稿ワーカーのオフラインベンチマーク
+
+X API v2 のモックサーバー（アカウントごとのレート制限・503・応答の消失を注入）に向けて、
+複数アカウント分のツイートを送信箱に入れて空にし、所要時間・スループットと、
+二重投稿がないこと・全件が投稿されたことを確認する。同時投稿アカウント数1と並行の場合を比べる。
+
+使い方:
+    python benchmarks/bench_outbox.py --tweets 60 --accounts 3 --rate-limit 10 --window 2 --failure-rate 0.1
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stand_ins import x_api_server  # noqa: E402
+
+
+def parse_args(argv: list = None):
+    parser = argparse.ArgumentParser(description="送信箱と投稿ワーカーのベンチマーク")
+    parser.add_argument('--tweets', type=int, default=60, help="送信箱に入れるツイート数（全アカウントの合計）")
+    parser.add_argument('--accounts', type=int, default=3, help="投稿先のアカウント数")
+    parser.add_argument('--rate-limit', type=int, default=10, help="アカウントごとの窓あたりの投稿上限")
+    parser.add_argument('--window', type=float, default=2.0, help="レート制限の窓の長さ（秒）")
+    parser.add_argument('--failure-rate', type=float, default=0.1, help="処理せずに503を返す割合")
+    parser.add_argument('--lost-rate', type=float, default=0.05, help="投稿を処理したのに503を返す割合")
+    parser.add_argument('--latency', type=float, default=0.02, help="モックサーバーの応答遅延（秒）")
+    parser.add_argument('--seed', type=int, default=1, help="障害注入の乱数の種")
+    parser.add_argument('--json', metavar='PATH', help="結果をJSONで保存するパス")
+    return parser.parse_args(argv)
+
+
+def run_case(args, max_workers: int) -> dict:
+    from post_outbox import PostOutbox, drain_outbox
+    from telemetry import metrics
+    from x_api import XApiClient
+
+    workdir = tempfile.mkdtemp(prefix='bench_outbox_')
+    accounts = [f"account{i + 1}" for i in range(args.accounts)]
+    try:
+        with x_api_server(args.latency, args.rate_limit, args.window, args.failure_rate,
+                          args.lost_rate, args.seed) as server:
+            clients = {
+                account: XApiClient({
+                    'api_key': 'bench-key', 'api_secret': 'bench-secret',
+                    'access_token': f"token-{account}", 'access_token_secret': 'bench-token-secret',
+                }, base_url=server.base_url)
+                for account in accounts
+            }
+            outbox = PostOutbox(os.path.join(workdir, 'post_outbox.sqlite3'))
+            for i in range(args.tweets):
+                outbox.enqueue(f"ベンチマーク投稿 {i + 1} #生成AI #AI", account=accounts[i % len(accounts)])
+
+            metrics.reset()
+            started = time.perf_counter()
+            drain_outbox(outbox, accounts, clients, max_wait=args.window * 3, max_workers=max_workers)
+            elapsed = time.perf_counter() - started
+
+            counts = outbox.counts()
+            server_stats = server.options['state'].as_dict()
+            outbox.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    counters = metrics.summary()['counters']
+    return {
+        'max_workers': max_workers,
+        'seconds': elapsed,
+        'tweets_per_second': counts.get('posted', 0) / elapsed if elapsed else 0.0,
+        'outbox': counts,
+        'server_posted': sum(server_stats['posted'].values()),
+        'duplicates_posted': server_stats['duplicates_posted'],
+        'responses': server_stats['responses'],
+        'retries': counters.get('outbox.retries', 0),
+        'rate_limited': counters.get('outbox.rate_limited', 0),
+        'rate_limit_waits': counters.get('outbox.rate_limit_waits', 0),
+        'recovered_duplicates': counters.get('outbox.duplicates', 0),
+    }
+
+
+def run(args) -> dict:
+    # 再送の待ち時間はベンチマーク用に短くする（モジュールの読み込み前に設定する）
+    os.environ.setdefault('POST_BACKOFF_BASE', '0.05')
+    os.environ.setdefault('POST_BACKOFF_MAX', '0.5')
+    os.environ.setdefault('POST_MAX_ATTEMPTS', '20')
+    logging.getLogger().setLevel(logging.WARNING)
+    cases = [run_case(args, 1)]
+    if args.accounts > 1:
+        cases.append(run_case(args, args.accounts))
+    return {'tweets': args.tweets, 'accounts': args.accounts, 'rate_limit': args.rate_limit,
+            'window': args.window, 'cases': cases}
+
+
+def print_report(report: dict) -> None:
+    print(f"tweets={report['tweets']} accounts={report['accounts']} "
+          f"rate_limit={report['rate_limit']}/{report['window']}s")
+    print(f"{'workers':>8}{'seconds':>10}{'tweets/s':>10}{'posted':>8}{'failed':>8}"
+          f"{'dup':>6}{'retries':>9}{'429':>6}{'waits':>7}{'recovered':>11}")
+    for case in report['cases']:
+        print(f"{case['max_workers']:>8}{case['seconds']:>10.2f}{case['tweets_per_second']:>10.1f}"
+              f"{case['outbox'].get('posted', 0):>8}{case['outbox'].get('failed', 0):>8}"
+              f"{case['duplicates_posted']:>6}{case['retries']:>9}{case['rate_limited']:>6}"
+              f"{case['rate_limit_waits']:>7}{case['recovered_duplicates']:>11}")
+
+
+def main(argv: list = None) -> int:
+    args = parse_args(argv)
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    # 全件が投稿され、二重投稿がないこと
+    ok = all(
+        case['outbox'].get('posted', 0) == report['tweets'] and case['server_posted'] == report['tweets']
+        and case['duplicates_posted'] == 0
+        for case in report['cases']
+    )
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+generate_tweet.main のオフライン・エンドツーエンドベンチマーク
+
+ローカルの代替サーバー（Googleニュース検索ページ・RSS/Atomフィード・chat.completions）を起動し、
+ネットワークなしでパイプライン全体を繰り返し実行して、段階ごとのp50/p95と
+リクエスト数・転送量を表示する。
+
+使い方:
+    python benchmarks/bench_pipeline.py --iterations 20 --google-latency 0.2 --llm-latency 0.5
+"""
+
+import argparse
+import contextlib
+import functools
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stand_ins import chat_completions_server, feed_server, google_news_server, pipeline_environment  # noqa: E402
+
+STAGES = (
+    'scrape_google_news',
+    'fetch_feeds',
+    'search_ai_news_multi_source',
+    'dedupe_articles',
+    'analyze_and_select_viral_content',
+    'generate_kuma_sensei_tweet',
+)
+
+
+def percentile(values: list, pct: float) -> float:
+    """最近接順位法によるパーセンタイル"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class StageTimer:
+    """モジュールの関数を差し替えて、呼び出しごとの所要時間を記録する"""
+
+    def __init__(self):
+        self.durations = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.durations.setdefault(name, []).append(seconds)
+
+    def wrap(self, module, name: str, label: str = None) -> None:
+        original = getattr(module, name)
+        label = label or name
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.record(label, time.perf_counter() - started)
+
+        setattr(module, name, timed)
+
+
+def parse_args(argv: list = None):
+    parser = argparse.ArgumentParser(description="generate_tweet.main のオフラインベンチマーク")
+    parser.add_argument('--iterations', type=int, default=10, help="パイプラインの実行回数")
+    parser.add_argument('--google-latency', type=float, default=0.1, help="検索代替サーバーの応答遅延（秒）")
+    parser.add_argument('--llm-latency', type=float, default=0.3, help="LLM代替サーバーの応答遅延（秒）")
+    parser.add_argument('--warm-cache', action='store_true', help="HTTPキャッシュを実行ごとに消さない")
+    parser.add_argument('--json', metavar='PATH', help="結果をJSONで保存するパス")
+    return parser.parse_args(argv)
+
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    http_cache_dir = os.path.join(workdir, 'http')
+    os.chdir(workdir)
+
+    with google_news_server(args.google_latency) as google, \
+            feed_server(args.google_latency) as feeds, \
+            chat_completions_server(args.llm_latency) as llm:
+        os.environ.update(pipeline_environment(workdir, google, feeds, llm))
+        # 繰り返し実行でも制限やリトライに左右されないようにする（明示指定があればそちらを使う）
+        os.environ.setdefault('NEWS_RATE_PER_SEC', '1000')
+        os.environ.setdefault('NEWS_RATE_BURST', '1000')
+        os.environ.setdefault('TWEET_SIMILARITY_THRESHOLD', '1.01')
+        # 保存済みフィードの日付が古くても初回に読めるようにする
+        os.environ.setdefault('FEED_MAX_AGE_HOURS', str(24 * 365 * 10))
+
+        import generate_tweet
+        import news_sources
+        logging.getLogger().setLevel(logging.WARNING)
+
+        timer = StageTimer()
+        for name in STAGES:
+            if name == 'fetch_feeds':
+                timer.wrap(news_sources.FeedSource, 'fetch', name)
+            else:
+                timer.wrap(generate_tweet, name)
+
+        failures = 0
+        for _ in range(args.iterations):
+            if not args.warm_cache:
+                shutil.rmtree(http_cache_dir, ignore_errors=True)
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                if generate_tweet.main() != 0:
+                    failures += 1
+            timer.record('main', time.perf_counter() - started)
+
+        servers = {
+            'google_news': google.stats.as_dict(),
+            'feeds': feeds.stats.as_dict(),
+            'chat_completions': llm.stats.as_dict(),
+        }
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    stages = {}
+    for name in STAGES + ('main',):
+        values = timer.durations.get(name, [])
+        stages[name] = {
+            'calls': len(values),
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'mean_ms': (sum(values) / len(values) * 1000) if values else 0.0,
+        }
+    return {
+        'iterations': args.iterations,
+        'failures': failures,
+        'stages': stages,
+        'servers': servers,
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"iterations={report['iterations']} failures={report['failures']}")
+    print(f"{'stage':<36}{'calls':>7}{'p50 ms':>11}{'p95 ms':>11}{'mean ms':>11}")
+    for name, row in report['stages'].items():
+        print(f"{name:<36}{row['calls']:>7}{row['p50_ms']:>11.1f}{row['p95_ms']:>11.1f}{row['mean_ms']:>11.1f}")
+    print()
+    print(f"{'server':<36}{'requests':>9}{'bytes in':>12}{'bytes out':>12}")
+    for name, row in report['servers'].items():
+        print(f"{name:<36}{row['requests']:>9}{row['bytes_in']:>12}{row['bytes_out']:>12}")
+
+
+def main(argv: list = None) -> int:
+    args = parse_args(argv)
+    json_path = os.path.abspath(args.json) if args.json else None
+    report = run(args)
+    print_report(report)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if report['failures'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
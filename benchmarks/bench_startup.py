@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+コマンドの起動時間のベンチマーク
+
+cli.py の各サブコマンドと従来のスクリプトを `python -X importtime` 付きの別プロセスで起動し、
+起動にかかった時間（中央値）・モジュールの読み込み時間・読み込んだ重いモジュールを比べる。
+表示・確認だけのコマンド（--help、replay、runs）が重いモジュールを読み込んでいたら失敗する。
+
+使い方:
+    python benchmarks/bench_startup.py --repeat 5
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 読み込みに時間がかかるモジュール（サブコマンドで必要になるまで読み込まないもの）
+HEAVY_MODULES = ('openai', 'lxml', 'bs4', 'numpy', 'requests', 'requests_oauthlib', 'tiktoken')
+
+# (名前, コマンドライン引数, 重いモジュールを読み込んではいけないか)
+CASES = [
+    ('cli --help', ['cli.py', '--help'], True),
+    ('cli replay', ['cli.py', 'replay', '--limit', '3'], True),
+    ('cli post --help', ['cli.py', 'post', '--help'], True),
+    ('cli runs', ['cli.py', 'runs', '--limit', '3'], True),
+    ('import generate_tweet', ['-c', 'import generate_tweet'], False),
+    ('import x_ai_smart_post', ['-c', 'import x_ai_smart_post'], False),
+]
+
+
+def parse_args(argv: list = None):
+    parser = argparse.ArgumentParser(description="コマンドの起動時間のベンチマーク")
+    parser.add_argument('--repeat', type=int, default=5, help="1コマンドあたりの起動回数")
+    parser.add_argument('--top', type=int, default=5, help="表示する読み込みの遅いモジュール数")
+    parser.add_argument('--json', metavar='PATH', help="結果をJSONで保存するパス")
+    return parser.parse_args(argv)
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    -X importtime の出力を集計する
+
+    Returns:
+        dict: {"total_ms": トップレベルの読み込み時間の合計, "modules": {名前: 累積ms}}
+    """
+    modules = {}
+    total_us = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        package = name.strip()
+        modules[package] = int(cumulative) / 1000
+        # 字下げのない行がトップレベルの読み込み（累積時間に依存モジュールを含む）
+        if not name[1:].startswith(' '):
+            total_us += int(cumulative)
+    return {'total_ms': total_us / 1000, 'modules': modules}
+
+
+def run_case(name: str, argv: list, must_be_light: bool, repeat: int, env: dict, top: int) -> dict:
+    wall_ms = []
+    imports = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime'] + argv, cwd=ROOT, env=env,
+                                capture_output=True, text=True)
+        wall_ms.append((time.perf_counter() - started) * 1000)
+        imports = parse_importtime(result.stderr)
+    heavy = sorted({module.split('.')[0] for module in imports['modules']} & set(HEAVY_MODULES))
+    slowest = sorted(imports['modules'].items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        'name': name,
+        'wall_ms': statistics.median(wall_ms),
+        'import_ms': imports['total_ms'],
+        'modules': len(imports['modules']),
+        'heavy_modules': heavy,
+        'must_be_light': must_be_light,
+        'ok': not (must_be_light and heavy),
+        'slowest': slowest,
+    }
+
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+    env = dict(os.environ, TWEET_HISTORY_DB=os.path.join(workdir, 'tweet_history.sqlite3'),
+               RUN_ARCHIVE_DIR=os.path.join(workdir, 'run_archive'), PYTHONDONTWRITEBYTECODE='1')
+    try:
+        cases = [run_case(name, argv, light, args.repeat, env, args.top) for name, argv, light in CASES]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {'repeat': args.repeat, 'cases': cases}
+
+
+def print_report(report: dict) -> None:
+    print(f"{'command':<26}{'wall ms':>10}{'import ms':>11}{'modules':>9}  heavy")
+    for case in report['cases']:
+        mark = '' if case['ok'] else '  ← 重いモジュールを読み込んでいます'
+        print(f"{case['name']:<26}{case['wall_ms']:>10.1f}{case['import_ms']:>11.1f}{case['modules']:>9}  "
+              f"{','.join(case['heavy_modules']) or '-'}{mark}")
+    for case in report['cases']:
+        slowest = ', '.join(f"{name} {ms:.1f}" for name, ms in case['slowest'])
+        print(f"  {case['name']}: {slowest}")
+
+
+def main(argv: list = None) -> int:
+    args = parse_args(argv)
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if all(case['ok'] for case in report['cases']) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+2段階方式（選別→ツイート生成）と融合方式（1回の構造化出力）の比較
+
+ローカルの代替サーバーで同じ記事を使い、方式ごとにパイプライン全体を繰り返し実行して、
+LLM呼び出し回数・トークン数・所要時間と、生成したツイートの検証結果を並べて表示する。
+--live-llm を付けると、LLMだけ実際のAPI（OPENAI_API_KEY）を使う。
+
+使い方:
+    python benchmarks/compare_modes.py --iterations 10 --llm-latency 0.5
+    OPENAI_API_KEY=... python benchmarks/compare_modes.py --iterations 5 --live-llm
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_pipeline import percentile  # noqa: E402
+from stand_ins import chat_completions_server, feed_server, google_news_server, pipeline_environment  # noqa: E402
+
+MODES = ('two_call', 'fused')
+
+
+def parse_args(argv: list = None):
+    parser = argparse.ArgumentParser(description="2段階方式と融合方式の比較")
+    parser.add_argument('--iterations', type=int, default=5, help="方式ごとの実行回数")
+    parser.add_argument('--google-latency', type=float, default=0.0, help="検索代替サーバーの応答遅延（秒）")
+    parser.add_argument('--llm-latency', type=float, default=0.3, help="LLM代替サーバーの応答遅延（秒）")
+    parser.add_argument('--live-llm', action='store_true', help="LLMは実際のAPIを使う")
+    parser.add_argument('--json', metavar='PATH', help="結果をJSONで保存するパス")
+    return parser.parse_args(argv)
+
+
+def check_tweet(tweet: str) -> dict:
+    """本番と同じ基準でツイートを検証する"""
+    from tweet_length import is_within_limit
+    from tweet_scoring import REQUIRED_HASHTAGS, has_hashtag, score_tweet_candidate
+
+    return {
+        'within_limit': is_within_limit(tweet),
+        'hashtags': all(has_hashtag(tweet, tag) for tag in REQUIRED_HASHTAGS),
+        'bear': '🐻' in tweet,
+        'score': score_tweet_candidate(tweet)['total'],
+    }
+
+
+def run_mode(generate_tweet, mode: str, iterations: int, workdir: str) -> dict:
+    from telemetry import metrics
+
+    generate_tweet.TWEET_GENERATION_MODE = mode
+    tweets = []
+    originals = generate_tweet.generate_kuma_sensei_tweet, generate_tweet.generate_fused_tweet
+
+    def capture(func):
+        def wrapper(*args, **kwargs):
+            tweet = func(*args, **kwargs)
+            if tweet is not None:
+                tweets.append(tweet)
+            return tweet
+        return wrapper
+
+    generate_tweet.generate_kuma_sensei_tweet = capture(originals[0])
+    generate_tweet.generate_fused_tweet = capture(originals[1])
+
+    rows = []
+    try:
+        for _ in range(iterations):
+            # 毎回同じ条件（キャッシュ・既読位置なし）で実行する
+            shutil.rmtree(os.path.join(workdir, 'http'), ignore_errors=True)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(workdir, 'feed_watermarks.json'))
+            del tweets[:]
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                exit_code = generate_tweet.main()
+            elapsed = time.perf_counter() - started
+            summary = metrics.summary()
+            tweet = tweets[-1] if tweets else ''
+            rows.append({
+                'ok': exit_code == 0 and bool(tweet),
+                'seconds': elapsed,
+                'llm_calls': summary['llm']['calls'],
+                'prompt_tokens': summary['llm']['prompt_tokens'],
+                'completion_tokens': summary['llm']['completion_tokens'],
+                'total_tokens': summary['llm']['total_tokens'],
+                'fallback': any(key.startswith('fallback.') for key in summary['counters']),
+                'tweet': tweet,
+                **check_tweet(tweet),
+            })
+    finally:
+        generate_tweet.generate_kuma_sensei_tweet, generate_tweet.generate_fused_tweet = originals
+
+    def mean(key):
+        return sum(row[key] for row in rows) / len(rows) if rows else 0.0
+
+    seconds = [row['seconds'] for row in rows]
+    return {
+        'runs': len(rows),
+        'failures': sum(1 for row in rows if not row['ok']),
+        'fallbacks': sum(1 for row in rows if row['fallback']),
+        'p50_ms': percentile(seconds, 50) * 1000,
+        'p95_ms': percentile(seconds, 95) * 1000,
+        'llm_calls': mean('llm_calls'),
+        'prompt_tokens': mean('prompt_tokens'),
+        'completion_tokens': mean('completion_tokens'),
+        'total_tokens': mean('total_tokens'),
+        'within_limit': mean('within_limit'),
+        'hashtags': mean('hashtags'),
+        'bear': mean('bear'),
+        'score': mean('score'),
+        'tweets': [row['tweet'] for row in rows],
+    }
+
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix='compare_modes_')
+    os.chdir(workdir)
+
+    with google_news_server(args.google_latency) as google, \
+            feed_server(args.google_latency) as feeds, \
+            contextlib.ExitStack() as stack:
+        llm = None if args.live_llm else stack.enter_context(chat_completions_server(args.llm_latency))
+        os.environ.update(pipeline_environment(workdir, google, feeds, llm))
+        os.environ.setdefault('NEWS_RATE_PER_SEC', '1000')
+        os.environ.setdefault('NEWS_RATE_BURST', '1000')
+        os.environ.setdefault('TWEET_SIMILARITY_THRESHOLD', '1.01')
+        os.environ.setdefault('FEED_MAX_AGE_HOURS', str(24 * 365 * 10))
+
+        import generate_tweet
+        logging.getLogger().setLevel(logging.WARNING)
+
+        results = {mode: run_mode(generate_tweet, mode, args.iterations, workdir) for mode in MODES}
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    return {'iterations': args.iterations, 'live_llm': args.live_llm, 'modes': results}
+
+
+def print_report(report: dict) -> None:
+    columns = (
+        ('runs', 'd'), ('failures', 'd'), ('fallbacks', 'd'), ('p50_ms', '.1f'), ('p95_ms', '.1f'),
+        ('llm_calls', '.2f'), ('prompt_tokens', '.0f'), ('completion_tokens', '.0f'), ('total_tokens', '.0f'),
+        ('within_limit', '.0%'), ('hashtags', '.0%'), ('bear', '.0%'), ('score', '.3f'),
+    )
+    print(f"iterations={report['iterations']} live_llm={report['live_llm']}")
+    print(f"{'metric':<20}" + ''.join(f"{mode:>12}" for mode in MODES))
+    for key, fmt in columns:
+        print(f"{key:<20}" + ''.join(f"{report['modes'][mode][key]:>12{fmt}}" for mode in MODES))
+
+
+def main(argv: list = None) -> int:
+    args = parse_args(argv)
+    json_path = os.path.abspath(args.json) if args.json else None
+    report = run(args)
+    print_report(report)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if any(result['failures'] for result in report['modes'].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+保存した実行のスナップショットを使ったオフラインの再生・A/B評価
+
+run_snapshots が保存したスナップショット（集めた記事・リサーチ結果・LLMとのやり取り）を入力に、
+設定を変えた版（モデル・生成方式・候補数など、環境変数で指定）ごとにツイート生成をやり直し、
+文字数の収まり・ハッシュタグの遵守・過去ツイートとの重複・所要時間を並べて表示する。
+本番で実際に生成したツイート（production）も同じ基準で採点して比較の基準にする。
+
+版ごと・スナップショットの塊ごとに新しいプロセスで実行する（設定は読み込み時に環境変数から決まるため）。
+LLMは次のいずれかを使う:
+    stand-in - ローカルのchat.completions互換サーバー（既定）
+    recorded - スナップショットに記録したレスポンス（入力が同じ呼び出しだけ。記録にない呼び出しは replay_misses に数え、
+               本番と同じくフォールバックに進む）。上書きなしの版が本番と同じツイートを再現できなければ失敗する
+    live     - 実際のAPI（OPENAI_API_KEY）
+
+使い方:
+    python benchmarks/replay_eval.py --days 30 \\
+        --variant mini SELECTION_MODEL=gpt-4.1-mini PERSONA_MODELS=kuma=gpt-4.1-mini \\
+        --variant 4o SELECTION_MODEL=gpt-4o-mini PERSONA_MODELS=kuma=gpt-4o-mini
+    python benchmarks/replay_eval.py --llm recorded --variant baseline
+    python benchmarks/replay_eval.py --record 10 --variant two_call --variant fused TWEET_GENERATION_MODE=fused
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import math
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_pipeline import percentile  # noqa: E402
+
+# 本番の出力をそのまま採点する基準の版の名前
+PRODUCTION = 'production'
+
+# 再生で作り直さない段階（スナップショットの値を使う）
+RECORDED_STAGES = {
+    'generate_tweet': ('prefetched', 'raw_articles', 'recent_tweets'),
+    'x_ai_smart_post': ('research_data',),
+}
+
+
+def parse_args(argv: list = None):
+    parser = argparse.ArgumentParser(description="実行のスナップショットを使ったオフラインのA/B評価")
+    parser.add_argument('--snapshots', default=None, help="スナップショットの保存先（省略時は RUN_SNAPSHOT_DIR）")
+    parser.add_argument('--days', type=float, default=None, help="この日数以内のスナップショットだけを使う")
+    parser.add_argument('--script', choices=sorted(RECORDED_STAGES), help="スクリプトで絞り込む")
+    parser.add_argument('--variant', nargs='+', action='append', metavar=('NAME', 'KEY=VALUE'),
+                        help="比べる版（名前と、上書きする環境変数）。複数指定可")
+    parser.add_argument('--llm', choices=('stand-in', 'recorded', 'live'), default='stand-in', help="使うLLM")
+    parser.add_argument('--llm-latency', type=float, default=0.0, help="LLM代替サーバーの応答遅延（秒）")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help="同時に実行するプロセス数")
+    parser.add_argument('--record', type=int, default=0,
+                        help="評価の前に、代替サーバーに向けた generate_tweet.py をこの回数実行してスナップショットを作る")
+    parser.add_argument('--json', metavar='PATH', help="結果をJSONで保存するパス")
+    return parser.parse_args(argv)
+
+
+def parse_variants(specs: list) -> dict:
+    """--variant の指定を 版の名前 → 上書きする環境変数 にする"""
+    variants = {}
+    for name, *assignments in specs or [['baseline']]:
+        if name == PRODUCTION:
+            raise ValueError(f"版の名前 {PRODUCTION} は本番の出力に使っています")
+        overrides = {}
+        for assignment in assignments:
+            key, sep, value = assignment.partition('=')
+            if not sep:
+                raise ValueError(f"KEY=VALUE の形式で指定してください: {assignment}")
+            overrides[key] = value
+        variants[name] = overrides
+    return variants
+
+
+def record_snapshots(count: int, directory: str, llm_latency: float) -> None:
+    """代替サーバーに向けて generate_tweet.py を実行し、スナップショットを作る"""
+    from stand_ins import chat_completions_server, feed_server, google_news_server, pipeline_environment
+
+    workdir = tempfile.mkdtemp(prefix='replay_record_')
+    try:
+        with google_news_server() as google, feed_server() as feeds, chat_completions_server(llm_latency) as llm:
+            env = dict(os.environ, **pipeline_environment(workdir, google, feeds, llm))
+            env.update(RUN_SNAPSHOT_DIR=directory, RUN_METRICS_FILE=os.path.join(workdir, 'run_metrics.json'),
+                       NEWS_RATE_PER_SEC='1000', NEWS_RATE_BURST='1000', FEED_MAX_AGE_HOURS=str(24 * 365 * 10))
+            for _ in range(count):
+                # 毎回同じ条件（キャッシュ・既読位置・チェックポイントなし）で実行する
+                for name in ('http', 'pipeline'):
+                    shutil.rmtree(os.path.join(workdir, name), ignore_errors=True)
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(workdir, 'feed_watermarks.json'))
+                subprocess.run([sys.executable, os.path.join(ROOT, 'generate_tweet.py')], cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _frozen_datetime(timestamp: float):
+    """now() がスナップショットの時刻を返すdatetime（プロンプトの日付・記事の新しさを本番と同じにする）"""
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.fromtimestamp(timestamp, tz)
+    return FrozenDatetime
+
+
+def _seed_history(snapshot: dict, path: str):
+    """
+    スナップショットの実行時点の履歴（recent_tweets）だけを持つ履歴ストアを作り、プロセス内の履歴として使う
+
+    記事の新しさの順位付けや類似ツイートの判定が、ほかのスナップショットの再生結果に左右されないようにする。
+    """
+    import tweet_history
+
+    history = tweet_history.TweetHistory(path)
+    # recent_tweets は新しい順なので、古いものから追加して並びを本番と同じにする
+    for text in reversed(snapshot.get('recent_tweets') or []):
+        history.add(text, status='posted')
+    if tweet_history._history is not None:
+        tweet_history._history.close()
+    tweet_history._history = history
+    return history
+
+
+def _replay_one(snapshot: dict, workdir: str, overrides: dict) -> dict:
+    """スナップショット1件のツイート生成をやり直し、キャラクター名 → ツイート を返す"""
+    import article_ranking
+    from personas import PERSONAS, get_persona
+    from pipeline import Checkpoint, Pipeline
+
+    script = snapshot['script']
+    module = __import__(script)
+    personas = [get_persona(name) for name in snapshot['personas'] if name in PERSONAS]
+    if script == 'generate_tweet':
+        # 版で指定がなければ、本番と同じ生成方式で作り直す
+        module.TWEET_GENERATION_MODE = overrides.get('TWEET_GENERATION_MODE', snapshot.get('mode', 'two_call'))
+        stages = module.build_pipeline().stages
+    else:
+        stages = module.build_pipeline(dry_run=True).stages
+    recorded = RECORDED_STAGES[script]
+    initial = {key: snapshot[key] for key in recorded}
+
+    frozen = _frozen_datetime(snapshot['created_at'])
+    originals = [(target, target.datetime) for target in (module, article_ranking)]
+    for target, _ in originals:
+        target.datetime = frozen
+    try:
+        pipeline = Pipeline(f"replay_{script}", [stage for stage in stages if stage.name not in recorded],
+                            checkpoint=Checkpoint(os.path.join(workdir, 'replay.json')))
+        return pipeline.run(resume=False, personas=personas, **initial)['tweets']
+    finally:
+        for target, original in originals:
+            target.datetime = original
+
+
+def replay_chunk(variant: str, overrides: dict, paths: list, llm: str, env: dict) -> list:
+    """
+    1つの版でスナップショットの塊を再生する（ワーカープロセスで実行する）
+
+    Returns:
+        list: スナップショットごとの {"run_id", "ok", "error", "tweets", "seconds", "llm_calls", "total_tokens",
+        "replay_misses"}（replay_misses は recorded で記録になかった呼び出しの数）
+    """
+    workdir = tempfile.mkdtemp(prefix='replay_eval_')
+    os.environ.update(env)
+    os.environ.update(overrides)
+    # 状態は作業ディレクトリに閉じ込める（ツイートの履歴はスナップショットごとに作り直す）
+    os.environ.update({
+        'TWEET_HISTORY_DB': os.path.join(workdir, 'tweet_history.sqlite3'),
+        'ARTICLE_QUEUE_DB': os.path.join(workdir, 'article_queue.sqlite3'),
+        'POST_OUTBOX_DB': os.path.join(workdir, 'post_outbox.sqlite3'),
+        'PIPELINE_STATE_DIR': os.path.join(workdir, 'pipeline'),
+        'HTTP_CACHE_DIR': os.path.join(workdir, 'http'),
+        'TREND_STATE_FILE': os.path.join(workdir, 'trends.npz'),
+        'LLM_CACHE_DIR': os.path.join(workdir, 'llm'),
+        'LLM_CACHE_MODE': 'replay' if llm == 'recorded' else 'off',
+        'RUN_SNAPSHOT_DIR': '',
+        'RUN_DEADLINE_SECONDS': '0',
+    })
+    logging.basicConfig(level=logging.CRITICAL)
+
+    from llm_client import get_client, save_response
+    from run_snapshots import load_snapshot
+    from telemetry import metrics
+
+    # モジュールの読み込みとクライアントの用意は所要時間に含めない
+    for script in RECORDED_STAGES:
+        __import__(script)
+    if llm != 'recorded':
+        get_client()
+
+    rows = []
+    try:
+        for index, path in enumerate(paths):
+            snapshot = load_snapshot(path)
+            _seed_history(snapshot, os.path.join(workdir, f"tweet_history-{index}.sqlite3"))
+            if llm == 'recorded':
+                for exchange in snapshot.get('exchanges') or []:
+                    save_response(exchange['model'], exchange['messages'], exchange['params'],
+                                  exchange['contents'], exchange['usage'])
+            metrics.reset()
+            started = time.perf_counter()
+            tweets, error = {}, None
+            try:
+                tweets = _replay_one(snapshot, workdir, overrides)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            elapsed = time.perf_counter() - started
+            summary = metrics.summary()
+            rows.append({
+                'run_id': snapshot['run_id'],
+                'ok': error is None,
+                'error': error,
+                'tweets': tweets,
+                'seconds': elapsed,
+                'llm_calls': summary['llm']['calls'],
+                'total_tokens': summary['llm']['total_tokens'],
+                'replay_misses': summary['counters'].get('llm.replay_misses', 0),
+            })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return rows
+
+
+def production_rows(paths: list) -> list:
+    """本番で生成したツイートと所要時間（スナップショットの記録）"""
+    from run_snapshots import load_snapshot
+
+    rows = []
+    for path in paths:
+        snapshot = load_snapshot(path)
+        summary = snapshot.get('metrics') or {}
+        llm = summary.get('llm') or {}
+        rows.append({
+            'run_id': snapshot['run_id'],
+            'ok': bool(snapshot.get('tweets')),
+            'error': None,
+            'tweets': snapshot.get('tweets') or {},
+            'seconds': (summary.get('duration_ms') or 0) / 1000,
+            'llm_calls': llm.get('calls', 0),
+            'total_tokens': llm.get('total_tokens', 0),
+            'replay_misses': 0,
+        })
+    return rows
+
+
+def _similarity(grams: set, texts: list) -> float:
+    from tweet_history import tweet_ngrams
+
+    best = 0.0
+    for text in texts:
+        other = tweet_ngrams(text)
+        if grams and other:
+            best = max(best, len(grams & other) / len(grams | other))
+    return best
+
+
+def score_variant(rows: list, snapshots: dict) -> dict:
+    """
+    版の出力を採点する
+
+    過去ツイートとの重複はスナップショットに記録した直近の履歴と比べ、
+    版の中での重複（同じようなツイートを繰り返していないか）は同じ版の以前の実行の出力と比べる。
+    """
+    from personas import PERSONAS
+    from tweet_history import TWEET_SIMILARITY_THRESHOLD, tweet_ngrams
+    from tweet_length import MAX_WEIGHTED_LENGTH, is_within_limit, weighted_length
+    from tweet_scoring import REQUIRED_HASHTAGS, has_hashtag
+
+    scores = []
+    previous = []
+    for row in sorted(rows, key=lambda row: snapshots[row['run_id']]['created_at']):
+        recent = snapshots[row['run_id']]['recent_tweets']
+        for name, tweet in row['tweets'].items():
+            persona = PERSONAS.get(name)
+            grams = tweet_ngrams(tweet)
+            history_similarity = _similarity(grams, recent)
+            self_similarity = _similarity(grams, previous)
+            scores.append({
+                'within_limit': is_within_limit(tweet),
+                'fill': weighted_length(tweet) / MAX_WEIGHTED_LENGTH,
+                'hashtags': all(has_hashtag(tweet, tag) for tag in (persona.hashtags if persona else REQUIRED_HASHTAGS)),
+                'similarity': history_similarity,
+                'duplicate': history_similarity >= TWEET_SIMILARITY_THRESHOLD,
+                'self_duplicate': self_similarity >= TWEET_SIMILARITY_THRESHOLD,
+            })
+            previous.append(tweet)
+
+    def mean(values):
+        values = list(values)
+        return sum(values) / len(values) if values else 0.0
+
+    seconds = [row['seconds'] for row in rows if row['ok']]
+    return {
+        'runs': len(rows),
+        'failures': sum(1 for row in rows if not row['ok']),
+        'tweets': len(scores),
+        'within_limit': mean(score['within_limit'] for score in scores),
+        'fill': mean(score['fill'] for score in scores),
+        'hashtags': mean(score['hashtags'] for score in scores),
+        'similarity': mean(score['similarity'] for score in scores),
+        'duplicates': mean(score['duplicate'] for score in scores),
+        'self_duplicates': mean(score['self_duplicate'] for score in scores),
+        'p50_ms': percentile(seconds, 50) * 1000,
+        'p95_ms': percentile(seconds, 95) * 1000,
+        'llm_calls': mean(row['llm_calls'] for row in rows),
+        'total_tokens': mean(row['total_tokens'] for row in rows),
+        'replay_misses': sum(row['replay_misses'] for row in rows),
+        'errors': sorted({row['error'] for row in rows if row['error']})[:5],
+    }
+
+
+def reproduction_rate(rows: list, production: list) -> float:
+    """本番と同じツイートを生成できた実行の割合"""
+    expected = {row['run_id']: row['tweets'] for row in production}
+    if not rows:
+        return 0.0
+    return sum(1 for row in rows if row['ok'] and row['tweets'] == expected.get(row['run_id'])) / len(rows)
+
+
+def check_reproduction(report: dict) -> list:
+    """
+    recorded で上書きなしの版が本番の出力を再現できたか確かめる
+
+    記録したレスポンスで本番と同じ設定を再生すれば、同じツイートが生成されるはず。
+    再現できなければ、再生の入力（履歴・日時など）が本番と違っている。
+
+    Returns:
+        list: 再現できなかった版の名前
+    """
+    if report['llm'] != 'recorded':
+        return []
+    return [
+        name for name, overrides in report['variants'].items()
+        if name != PRODUCTION and not overrides and report['results'][name]['reproduced'] < 1
+    ]
+
+
+def run(args) -> dict:
+    from run_snapshots import RUN_SNAPSHOT_DIR, list_snapshots, load_snapshot
+
+    directory = os.path.abspath(args.snapshots or RUN_SNAPSHOT_DIR)
+    variants = parse_variants(args.variant)
+    if args.record:
+        record_snapshots(args.record, directory, args.llm_latency)
+    paths = list_snapshots(directory, script=args.script, since_days=args.days)
+    if not paths:
+        raise SystemExit(f"スナップショットがありません: {directory}")
+    # 採点に使う部分だけを残す（記事などは各ワーカーがファイルから読む）
+    snapshots = {}
+    for path in paths:
+        snapshot = load_snapshot(path)
+        snapshots[snapshot['run_id']] = {'created_at': snapshot['created_at'],
+                                         'recent_tweets': snapshot.get('recent_tweets') or []}
+
+    with contextlib.ExitStack() as stack:
+        env = {}
+        if args.llm == 'stand-in':
+            from stand_ins import chat_completions_server
+            llm = stack.enter_context(chat_completions_server(args.llm_latency))
+            env.update(OPENAI_BASE_URL=f"{llm.base_url}/v1", OPENAI_API_KEY='replay-dummy-key')
+        elif args.llm == 'recorded':
+            env.update(OPENAI_API_KEY=os.getenv('OPENAI_API_KEY') or 'replay-dummy-key')
+
+        # 版ごとにスナップショットを塊に分け、塊ごとに新しいプロセスで実行する
+        chunk_size = max(1, math.ceil(len(paths) / max(1, args.workers)))
+        chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn'),
+                                 max_tasks_per_child=1) as executor:
+            futures = {
+                name: [executor.submit(replay_chunk, name, overrides, chunk, args.llm, env) for chunk in chunks]
+                for name, overrides in variants.items()
+            }
+            results = {name: [row for future in items for row in future.result()] for name, items in futures.items()}
+        elapsed = time.perf_counter() - started
+
+    production = production_rows(paths)
+    report = {
+        'snapshots': len(paths),
+        'llm': args.llm,
+        'seconds': elapsed,
+        'variants': {PRODUCTION: {}, **variants},
+        'results': {PRODUCTION: dict(score_variant(production, snapshots), reproduced=1.0)},
+    }
+    for name, rows in results.items():
+        report['results'][name] = dict(score_variant(rows, snapshots), reproduced=reproduction_rate(rows, production))
+    return report
+
+
+def print_report(report: dict) -> None:
+    names = list(report['results'])
+    columns = (
+        ('runs', 'd'), ('failures', 'd'), ('tweets', 'd'), ('within_limit', '.0%'), ('fill', '.0%'),
+        ('hashtags', '.0%'), ('similarity', '.3f'), ('duplicates', '.0%'), ('self_duplicates', '.0%'),
+        ('p50_ms', '.1f'), ('p95_ms', '.1f'), ('llm_calls', '.2f'), ('total_tokens', '.0f'), ('replay_misses', 'd'),
+        ('reproduced', '.0%'),
+    )
+    print(f"snapshots={report['snapshots']} llm={report['llm']} seconds={report['seconds']:.1f}")
+    for name in names[1:]:
+        overrides = ' '.join(f"{key}={value}" for key, value in report['variants'][name].items())
+        print(f"  {name}: {overrides or '（上書きなし）'}")
+    width = max(12, max(len(name) for name in names) + 2)
+    print(f"{'metric':<16}" + ''.join(f"{name:>{width}}" for name in names))
+    for key, fmt in columns:
+        print(f"{key:<16}" + ''.join(f"{report['results'][name][key]:>{width}{fmt}}" for name in names))
+    for name in names:
+        for error in report['results'][name]['errors']:
+            print(f"  [{name}] {error}")
+
+
+def main(argv: list = None) -> int:
+    args = parse_args(argv)
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    unreproduced = check_reproduction(report)
+    for name in unreproduced:
+        print(f"  [{name}] 記録したレスポンスで本番の出力を再現できませんでした（reproduced="
+              f"{report['results'][name]['reproduced']:.0%}）", file=sys.stderr)
+    failed = any(result['failures'] for result in report['results'].values())
+    return 1 if failed or unreproduced else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+ベンチマーク用のローカル代替サーバー
+保存済みのGoogleニュース検索結果ページ・RSS/Atomフィードと、chat.completions互換のLLMエンドポイント、
+X API v2 のツイート投稿のモック（レート制限・障害注入つき）を提供する
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+STAND_IN_SUMMARY = (
+    "OpenAIが新モデルGPT-4.1をAPIで公開し、100万トークンの長文コンテキストと"
+    "コーディング性能の大幅向上が話題です。開発者に直接効く具体的な数字があり、"
+    "驚きと実用性の両方を備えているためバズりやすいと考えられます。"
+)
+STAND_IN_TWEETS = [
+    "みんな聞いてクマ！🐻✨ OpenAIのGPT-4.1がAPIで使えるようになったクマ！100万トークンの長文も読めて、"
+    "コーディング性能も大幅アップだクマよ〜💡 開発がもっと楽しくなりそうクマね🚀 #生成AI #AI",
+    "これは驚きクマね🐻💡 GPT-4.1が登場して、長い資料もまるごと読めるようになったクマ！"
+    "エンジニアのみんなは要チェックだクマよ✨ #生成AI #AI",
+    "速報クマ！🐻🔥 OpenAIが新モデルGPT-4.1を公開したクマ。コードを書く力がぐんと上がったらしいクマね🌟 #生成AI #AI",
+]
+
+
+class ServerStats:
+    """代替サーバーのリクエスト数と転送量"""
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._lock = threading.Lock()
+
+    def record(self, bytes_in: int, bytes_out: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def as_dict(self) -> dict:
+        return {'requests': self.requests, 'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out}
+
+
+class StandInServer:
+    """
+    バックグラウンドスレッドで動くHTTPサーバー
+
+    Args:
+        handler_class: リクエストハンドラのクラス
+        latency: レスポンスを返すまでに待つ秒数
+    """
+
+    def __init__(self, handler_class, latency: float = 0.0, **options):
+        self.stats = ServerStats()
+        self.latency = latency
+        self.options = options
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.stand_in = self
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _BaseHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str, bytes_in: int, headers: dict = None) -> None:
+        stand_in = self.server.stand_in
+        if stand_in.latency:
+            time.sleep(stand_in.latency)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        stand_in.stats.record(bytes_in, len(body))
+
+
+class GoogleNewsHandler(_BaseHandler):
+    """`/search?q=...&tbm=nws` に保存済みの検索結果ページを返す"""
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path != '/search':
+            self._send(404, b'not found', 'text/plain', 0)
+            return
+        query = parse_qs(parsed.query).get('q', [''])[0]
+        pages = self.server.stand_in.options['pages']
+        body = pages[zlib.crc32(query.encode('utf-8')) % len(pages)]
+        self._send(200, body, 'text/html; charset=UTF-8', 0)
+
+
+class FeedHandler(_BaseHandler):
+    """`/feeds/<ファイル名>` に保存済みのRSS/Atomフィードを返す"""
+
+    def do_GET(self):
+        name = os.path.basename(urlparse(self.path).path)
+        feeds = self.server.stand_in.options['feeds']
+        if name not in feeds:
+            self._send(404, b'not found', 'text/plain', 0)
+            return
+        self._send(200, feeds[name], 'application/xml; charset=UTF-8', 0)
+
+
+class ChatCompletionsHandler(_BaseHandler):
+    """`/v1/chat/completions` に決まった内容のチャット補完を返す"""
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', '0'))
+        raw = self.rfile.read(length)
+        if urlparse(self.path).path.rstrip('/') != '/v1/chat/completions':
+            self._send(404, b'{}', 'application/json', length)
+            return
+        request = json.loads(raw or b'{}')
+        messages = request.get('messages', [])
+        prompt_text = ''.join(str(m.get('content', '')) for m in messages)
+        last_message = str(messages[-1].get('content', '')) if messages else ''
+        wants_tweet = 'ツイート' in last_message or 'tweet' in last_message.lower()
+
+        # 構造化出力（融合方式）の指定があれば、選んだ話題・理由・ツイートをJSONで返す
+        structured = (request.get('response_format') or {}).get('type') == 'json_schema'
+
+        choices = []
+        for i in range(int(request.get('n') or 1)):
+            content = STAND_IN_TWEETS[i % len(STAND_IN_TWEETS)] if wants_tweet else STAND_IN_SUMMARY
+            if structured:
+                content = json.dumps({
+                    'selected_story': STAND_IN_SUMMARY.split('。')[0],
+                    'reasoning': STAND_IN_SUMMARY.split('。')[-2],
+                    'tweet': content,
+                }, ensure_ascii=False)
+            choices.append({
+                'index': i,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            })
+        # トークン数は文字数からの概算
+        prompt_tokens = len(prompt_text)
+        completion_tokens = sum(len(c['message']['content']) for c in choices)
+        body = json.dumps({
+            'id': f"chatcmpl-standin-{self.server.stand_in.stats.requests}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'stand-in'),
+            'choices': choices,
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+            },
+        }, ensure_ascii=False).encode('utf-8')
+        self._send(200, body, 'application/json', length)
+
+
+class XApiState:
+    """
+    X API モックの状態（アカウントごとの投稿とレート制限の窓）
+
+    Args:
+        rate_limit: 窓あたりの投稿上限
+        window: 窓の長さ（秒）
+        failure_rate: 処理せずに503を返す割合
+        lost_response_rate: 投稿は処理したのに503を返す（応答が失われた）割合
+        seed: 障害注入の乱数の種
+    """
+
+    def __init__(self, rate_limit: int, window: float, failure_rate: float, lost_response_rate: float, seed: int):
+        self.rate_limit = rate_limit
+        self.window = window
+        self.failure_rate = failure_rate
+        self.lost_response_rate = lost_response_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.posts = {}       # アクセストークン → 投稿された本文のリスト（重複も含めて記録する）
+        self.windows = {}     # アクセストークン → (窓の開始時刻, 窓内の投稿数)
+        self.responses = {}   # ステータス → 件数
+        self.next_id = 1
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {
+                'posted': {token: len(texts) for token, texts in self.posts.items()},
+                'duplicates_posted': sum(len(texts) - len(set(texts)) for texts in self.posts.values()),
+                'responses': dict(self.responses),
+            }
+
+
+class XApiHandler(_BaseHandler):
+    """
+    `/2/tweets` へのPOSTを受けるX API v2のモック
+
+    OAuth 1.0a のアクセストークンごとに固定窓のレート制限をかけ、x-rate-limit-* ヘッダーを返す。
+    同じ本文の再投稿は実際のAPIと同じく403（duplicate content）で拒否する。
+    """
+
+    _TOKEN = re.compile(r'oauth_token="([^"]+)"')
+
+    def _reply(self, status: int, payload: dict, length: int, headers: dict = None) -> None:
+        state = self.server.stand_in.options['state']
+        with state.lock:
+            state.responses[status] = state.responses.get(status, 0) + 1
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode('utf-8'), 'application/json', length, headers)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', '0'))
+        raw = self.rfile.read(length)
+        if urlparse(self.path).path.rstrip('/') != '/2/tweets':
+            self._reply(404, {'title': 'Not Found'}, length)
+            return
+        match = self._TOKEN.search(self.headers.get('Authorization', ''))
+        if not match:
+            self._reply(401, {'title': 'Unauthorized', 'status': 401}, length)
+            return
+        token = match.group(1)
+        text = json.loads(raw or b'{}').get('text', '')
+        state = self.server.stand_in.options['state']
+
+        with state.lock:
+            roll = state.random.random()
+            now = time.time()
+            started, used = state.windows.get(token, (now, 0))
+            if now - started >= state.window:
+                started, used = now, 0
+            reset_at = int(started + state.window) + 1
+            if roll < state.failure_rate:
+                fault = 'unavailable'
+            elif used >= state.rate_limit:
+                fault = 'rate_limited'
+            elif text in state.posts.get(token, ()):
+                fault = 'duplicate'
+            else:
+                fault = None
+                used += 1
+                state.posts.setdefault(token, []).append(text)
+                tweet_id = str(state.next_id)
+                state.next_id += 1
+                if roll < state.failure_rate + state.lost_response_rate:
+                    fault = 'lost_response'
+            state.windows[token] = (started, used)
+
+        headers = {
+            'x-rate-limit-limit': str(state.rate_limit),
+            'x-rate-limit-remaining': str(max(state.rate_limit - used, 0)),
+            'x-rate-limit-reset': str(reset_at),
+        }
+        if fault in ('unavailable', 'lost_response'):
+            self._reply(503, {'title': 'Service Unavailable', 'status': 503}, length)
+        elif fault == 'rate_limited':
+            self._reply(429, {'title': 'Too Many Requests', 'detail': 'Too Many Requests', 'status': 429}, length, headers)
+        elif fault == 'duplicate':
+            self._reply(403, {
+                'title': 'Forbidden', 'status': 403,
+                'detail': 'You are not allowed to create a Tweet with duplicate content.',
+            }, length, headers)
+        else:
+            self._reply(201, {'data': {'id': tweet_id, 'text': text}}, length, headers)
+
+
+def pipeline_environment(workdir: str, google: StandInServer, feeds: StandInServer, llm: StandInServer = None) -> dict:
+    """
+    パイプラインを代替サーバーと作業ディレクトリに向ける環境変数
+
+    llmを省略した場合は、LLMの接続先を変えない（実際のAPIを使う）。
+    """
+    env = {
+        'GOOGLE_NEWS_BASE_URL': google.base_url,
+        'NEWS_FEEDS': ','.join(f"{name}|{feeds.base_url}/feeds/{name}" for name in feeds.options['feeds']),
+        'FEED_WATERMARK_FILE': os.path.join(workdir, 'feed_watermarks.json'),
+        'HTTP_CACHE_DIR': os.path.join(workdir, 'http'),
+        'TWEET_HISTORY_DB': os.path.join(workdir, 'tweet_history.sqlite3'),
+        'ARTICLE_QUEUE_DB': os.path.join(workdir, 'article_queue.sqlite3'),
+        'TREND_STATE_FILE': os.path.join(workdir, 'trends.npz'),
+        'PIPELINE_STATE_DIR': os.path.join(workdir, 'pipeline'),
+        'POST_OUTBOX_DB': os.path.join(workdir, 'post_outbox.sqlite3'),
+        'LLM_CACHE_MODE': 'off',
+    }
+    if llm is not None:
+        env['OPENAI_BASE_URL'] = f"{llm.base_url}/v1"
+        env['OPENAI_API_KEY'] = 'bench-dummy-key'
+    return env
+
+
+def load_fixture_pages(directory: str = FIXTURE_DIR) -> list:
+    """保存済みの検索結果ページを読み込む"""
+    names = sorted(n for n in os.listdir(directory) if n.startswith('google_news') and n.endswith('.html'))
+    pages = []
+    for name in names:
+        with open(os.path.join(directory, name), 'rb') as f:
+            pages.append(f.read())
+    return pages
+
+
+def load_fixture_feeds(directory: str = FIXTURE_DIR) -> dict:
+    """保存済みのRSS/Atomフィードを読み込む（ファイル名 → 本文）"""
+    feeds = {}
+    for name in sorted(os.listdir(directory)):
+        if name.startswith('feed_'):
+            with open(os.path.join(directory, name), 'rb') as f:
+                feeds[name] = f.read()
+    return feeds
+
+
+def google_news_server(latency: float = 0.0, pages: list = None) -> StandInServer:
+    """Googleニュース検索の代替サーバーを作る（with文で起動・停止する）"""
+    return StandInServer(GoogleNewsHandler, latency=latency, pages=pages or load_fixture_pages())
+
+
+def feed_server(latency: float = 0.0, feeds: dict = None) -> StandInServer:
+    """RSS/Atomフィードの代替サーバーを作る（with文で起動・停止する）"""
+    return StandInServer(FeedHandler, latency=latency, feeds=feeds or load_fixture_feeds())
+
+
+def chat_completions_server(latency: float = 0.0) -> StandInServer:
+    """chat.completions互換の代替サーバーを作る（with文で起動・停止する）"""
+    return StandInServer(ChatCompletionsHandler, latency=latency)
+
+
+def x_api_server(latency: float = 0.0, rate_limit: int = 100, window: float = 900.0, failure_rate: float = 0.0,
+                 lost_response_rate: float = 0.0, seed: int = 0) -> StandInServer:
+    """X API v2 のモックサーバーを作る（with文で起動・停止する。状態は options['state']）"""
+    state = XApiState(rate_limit, window, failure_rate, lost_response_rate, seed)
+    return StandInServer(XApiHandler, latency=latency, state=state)
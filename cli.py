@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+くーたん博士の自動投稿ツールのコマンドライン
+サブコマンドごとに必要なモジュールだけを読み込むので、表示・確認だけのコマンドはすぐに起動する
+（openai・lxml・numpy・requests_oauthlibなど読み込みに時間がかかるものは、使うサブコマンドでだけ読み込む）
+
+使い方:
+    python cli.py research                  # 事前リサーチだけを実行してキューに追加
+    python cli.py generate [--no-resume]    # ツイート案を生成（generate_tweet.py と同じ）
+    python cli.py post [--dry-run]          # リサーチして投稿（x_ai_smart_post.py と同じ）
+    python cli.py post --drain              # 送信箱に残っているツイートだけを投稿
+    python cli.py replay [--limit 5]        # 直近に生成したツイートを表示（ネットワーク・APIキー不要）
+    python cli.py runs --date 2026-10-17    # その日の実行記録（使った記事・ツイート）を表示
+"""
+
+import argparse
+import sys
+
+
+def cmd_research(args) -> int:
+    from log_setup import setup_logging
+    from generate_tweet import LOG_FILE, prefetch_research
+    from telemetry import write_metrics
+    setup_logging(LOG_FILE)
+    exit_code = prefetch_research()
+    write_metrics()
+    return exit_code
+
+
+def cmd_generate(args) -> int:
+    from log_setup import setup_logging
+    import generate_tweet
+    setup_logging(generate_tweet.LOG_FILE)
+    if args.daemon:
+        from scheduler import run_daemon
+        return run_daemon(generate_tweet.main, 'generate_tweet', warmup=generate_tweet.warm_up,
+                          background=generate_tweet.prefetch_research)
+    return generate_tweet.main(resume=not args.no_resume)
+
+
+def cmd_post(args) -> int:
+    from log_setup import setup_logging
+    if args.drain:
+        # 送信箱を空にするだけならLLM・ニュース検索のモジュールは読み込まない
+        import json
+        from post_outbox import drain_outbox, get_outbox
+        from x_api import account_names
+        setup_logging("post_outbox.log")
+        accounts = args.account or account_names()
+        results = drain_outbox(accounts=accounts)
+        print(json.dumps({account: get_outbox().counts(account) for account in accounts}, ensure_ascii=False))
+        return 1 if any(result.get('failed') for result in results.values()) else 0
+
+    import x_ai_smart_post
+    setup_logging(x_ai_smart_post.LOG_FILE)
+    if args.daemon:
+        from scheduler import run_daemon
+        # 事前リサーチはニュース検索を使う generate_tweet の処理をバックグラウンドで回す
+        from generate_tweet import prefetch_research
+        return run_daemon(x_ai_smart_post.main, 'x_ai_smart_post', warmup=x_ai_smart_post.warm_up,
+                          background=prefetch_research)
+    return x_ai_smart_post.main(resume=not args.no_resume, dry_run=args.dry_run)
+
+
+def cmd_replay(args) -> int:
+    # 履歴DB（SQLite）を読むだけなので、LLM・HTTPのモジュールは読み込まない
+    import os
+    from datetime import datetime
+    from tweet_history import get_history
+    from tweet_length import MAX_WEIGHTED_LENGTH, weighted_length
+
+    entries = get_history().recent(args.limit, source=args.source)
+    if not entries:
+        print("ツイートの履歴がありません", file=sys.stderr)
+        return 1
+    for entry in entries:
+        created = datetime.fromtimestamp(entry['created_at']).strftime('%Y-%m-%d %H:%M')
+        print(f"[{created}] {entry['status']} {entry['source'] or '-'} "
+              f"（{weighted_length(entry['text'])}/{MAX_WEIGHTED_LENGTH}）")
+        print(entry['text'])
+        print()
+
+    # 最新のツイートをGitHub Actionsの出力に書き直す（Issueの作り直しなどに使う）
+    if args.github_output and os.getenv('GITHUB_OUTPUT'):
+        tweet = entries[0]['text']
+        with open(os.getenv('GITHUB_OUTPUT'), 'a', encoding='utf-8') as f:
+            f.write(f"tweet<<EOF\n{tweet}\nEOF\n")
+            f.write(f"char_count={weighted_length(tweet)}\n")
+    return 0
+
+
+def cmd_runs(args) -> int:
+    # 実行記録のアーカイブ（SQLiteの索引と圧縮したデータファイル）を読むだけ
+    import json
+    from datetime import datetime
+    from run_archive import JST, get_archive
+
+    archive = get_archive()
+    if args.compact:
+        print(json.dumps(archive.compact(), ensure_ascii=False))
+        return 0
+    if args.stats:
+        print(json.dumps(archive.stats(), ensure_ascii=False))
+        return 0
+    if args.id:
+        record = archive.get(args.id)
+        if record is None:
+            print(f"実行記録がありません: {args.id}", file=sys.stderr)
+            return 1
+        print(json.dumps(record, ensure_ascii=False, indent=2))
+        return 0
+
+    entries = archive.find(day=args.date, script=args.script, limit=args.limit)
+    records = archive.load([entry['run_id'] for entry in entries])
+    if args.json:
+        print(json.dumps(records, ensure_ascii=False, indent=2))
+        return 0
+    for record in records:
+        created = datetime.fromtimestamp(record['created_at'], JST).strftime('%Y-%m-%d %H:%M')
+        if record.get('error'):
+            print(f"[{created}] {record['run_id']} 失敗")
+            print(record['error'])
+            print()
+            continue
+        status = {True: ' 投稿済み', False: ' 未投稿'}.get(record.get('posted'), '')
+        print(f"[{created}] {record['run_id']}{status}（記事{len(record.get('articles') or [])}件）")
+        print(record.get('tweet') or '')
+        print()
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="くーたん博士の生成AIツイート自動投稿ツール")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    research = subparsers.add_parser('research', help="事前リサーチだけを実行してキューに追加する")
+    research.set_defaults(func=cmd_research)
+
+    generate = subparsers.add_parser('generate', help="ニュースを検索してツイート案を生成する")
+    generate.add_argument('--daemon', action='store_true', help="常駐してJSTの実行枠ごとにツイートを生成する")
+    generate.add_argument('--no-resume', action='store_true', help="前回失敗した実行の途中結果を使わずに最初から実行する")
+    generate.set_defaults(func=cmd_generate)
+
+    post = subparsers.add_parser('post', help="生成AIのトレンドをリサーチしてツイートを投稿する")
+    post.add_argument('--daemon', action='store_true', help="常駐してJSTの実行枠ごとに投稿する")
+    post.add_argument('--no-resume', action='store_true', help="前回失敗した実行の途中結果を使わずに最初から実行する")
+    post.add_argument('--dry-run', action='store_true', help="ツイートを生成して表示するだけで投稿しない")
+    post.add_argument('--drain', action='store_true', help="生成はせず、送信箱に残っているツイートだけを投稿する")
+    post.add_argument('--account', action='append', help="--drain の対象アカウント（複数指定可、省略時は X_ACCOUNTS）")
+    post.set_defaults(func=cmd_post)
+
+    replay = subparsers.add_parser('replay', help="直近に生成したツイートを表示する")
+    replay.add_argument('--limit', type=int, default=1, help="表示する件数")
+    replay.add_argument('--source', help="生成元で絞り込む（generate_tweet / x_ai_smart_post）")
+    replay.add_argument('--github-output', action='store_true', help="最新のツイートをGITHUB_OUTPUTに書き出す")
+    replay.set_defaults(func=cmd_replay)
+
+    runs = subparsers.add_parser('runs', help="実行記録のアーカイブを日付・実行IDで調べる")
+    runs.add_argument('--date', help="日付（JST、YYYY-MM-DD）")
+    runs.add_argument('--id', help="実行ID（記録の全体をJSONで表示する）")
+    runs.add_argument('--script', help="スクリプトで絞り込む（generate_tweet / x_ai_smart_post）")
+    runs.add_argument('--limit', type=int, default=10, help="表示する件数（0で全件）")
+    runs.add_argument('--json', action='store_true', help="記録をJSONで表示する")
+    runs.add_argument('--stats', action='store_true', help="アーカイブの件数と大きさを表示する")
+    runs.add_argument('--compact', action='store_true', help="古い記録を削除し、残りをまとめて圧縮し直す")
+    runs.set_defaults(func=cmd_runs)
+    return parser
+
+
+def main(argv: list = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
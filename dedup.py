@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+ニュース記事の重複排除
+正規化タイトルのハッシュとMinHash（LSH）で、ほぼ同じ記事をまとめる
+"""
+
+import logging
+import random
+import re
+import unicodedata
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+# MinHashの設定（BANDS * ROWS = NUM_PERM）
+NUM_PERM = 64
+BANDS = 16
+ROWS = 4
+SHINGLE_SIZE = 3
+DEFAULT_THRESHOLD = 0.5
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+_rng = random.Random(20240601)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+
+_NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize_text(text: str) -> str:
+    """
+    比較用にテキストを正規化する（NFKC・小文字化・記号と空白の除去）
+
+    Args:
+        text: 元のテキスト
+
+    Returns:
+        str: 正規化されたテキスト
+    """
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    return _NON_WORD.sub('', text)
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    """
+    文字n-gram（シングル）の集合を作る（日本語でも分かち書き不要）
+
+    Args:
+        text: 正規化済みテキスト
+        size: n-gramの長さ
+
+    Returns:
+        set: シングルの集合
+    """
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def minhash_signature(shingle_set: set) -> list:
+    """
+    シングル集合のMinHashシグネチャを計算する
+
+    Args:
+        shingle_set: シングルの集合
+
+    Returns:
+        list: 長さNUM_PERMのシグネチャ
+    """
+    if not shingle_set:
+        return [_MAX_HASH] * NUM_PERM
+    base_hashes = [zlib.crc32(s.encode('utf-8')) for s in shingle_set]
+    return [
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in base_hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def estimate_similarity(sig_a: list, sig_b: list) -> float:
+    """2つのシグネチャからJaccard類似度を推定する"""
+    matches = sum(1 for x, y in zip(sig_a, sig_b) if x == y)
+    return matches / NUM_PERM
+
+
+def _find(parent: list, i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def dedupe_articles(articles: list, threshold: float = DEFAULT_THRESHOLD) -> tuple:
+    """
+    ほぼ同じ内容の記事をまとめる
+
+    タイトルの正規化ハッシュが一致する記事と、タイトル＋スニペットのMinHash類似度が
+    threshold以上の記事を同じグループとみなす。LSHのバンドで候補を絞るため、
+    記事数に対してほぼ線形の計算量で動く。各グループからは最初に出現した記事を残し、
+    スニペットはグループ内で最も長いものを使う。
+
+    Args:
+        articles: ニュース記事のリスト [{"title": "...", "snippet": "..."}]
+        threshold: 重複とみなす推定Jaccard類似度
+
+    Returns:
+        tuple: (重複を除いた記事のリスト, まとめた記事数)
+    """
+    if not articles:
+        return [], 0
+
+    n = len(articles)
+    parent = list(range(n))
+    signatures = []
+    title_buckets = {}
+    band_buckets = {}
+
+    def union(i: int, j: int) -> None:
+        root_i, root_j = _find(parent, i), _find(parent, j)
+        if root_i != root_j:
+            # 先に出現した記事を代表にする
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    for i, article in enumerate(articles):
+        title = normalize_text(article.get('title', ''))
+        if title in title_buckets:
+            signatures.append(None)
+            union(i, title_buckets[title])
+            continue
+        if title:
+            title_buckets[title] = i
+
+        body = normalize_text(article.get('title', '') + article.get('snippet', ''))
+        signature = minhash_signature(shingles(body))
+        signatures.append(signature)
+
+        # 代表記事だけをバケットに入れるので、重複が多くても比較回数は増えない
+        keys = [(band, tuple(signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+        match = next(
+            (j for key in keys for j in band_buckets.get(key, ())
+             if estimate_similarity(signature, signatures[j]) >= threshold),
+            None
+        )
+        if match is not None:
+            union(i, match)
+            continue
+        for key in keys:
+            band_buckets.setdefault(key, []).append(i)
+
+    groups = {}
+    for i in range(n):
+        groups.setdefault(_find(parent, i), []).append(i)
+
+    unique = []
+    for root in sorted(groups):
+        members = groups[root]
+        merged = dict(articles[root])
+        longest = max((articles[j].get('snippet', '') for j in members), key=len)
+        merged['snippet'] = longest
+        if len(members) > 1:
+            merged['duplicates'] = len(members) - 1
+        unique.append(merged)
+
+    collapsed = n - len(unique)
+    logger.info(f"重複排除: {n}件 → {len(unique)}件（{collapsed}件をまとめました）")
+    return unique, collapsed
@@ -4,40 +4,84 @@ X AI Auto Tweet Generator with Real Web Search
 実際のWeb検索で最新の生成AIニュースをリサーチし、くま博士風のツイートを生成
 """
 
+import contextvars
+import json
 import os
+import sqlite3
 import sys
 import logging
-import requests
 from datetime import datetime
-from bs4 import BeautifulSoup
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import time
 import re
 
-# ロギング設定
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('tweet_generator.log'),
-        logging.StreamHandler()
-    ]
+from article_queue import get_queue
+from article_ranking import prerank_articles
+from dedup import dedupe_articles
+from http_cache import cached_get, invalidate
+from llm_client import complete
+from news_extract import extract_articles
+from news_sources import NewsSource, advance_watermarks, feed_sources
+from personas import (
+    KUMA_SENSEI_SYSTEM_PROMPT, enabled_personas, enqueue_persona_tweets, fan_out, generate_persona_tweet,
+    generate_validated_tweet, get_persona
+)
+from pipeline import Pipeline, Stage, StageError
+from prompt_packer import pack_articles
+from rate_limiter import HostRateLimiter
+from run_archive import archive_failed_run, get_archive, slim_articles
+from run_snapshots import capture_exchanges, new_run_id, save_snapshot
+from resilience import (
+    RUN_DEADLINE_RESERVE_SECONDS, CircuitOpenError, DeadlineExceeded, current_deadline, get_breaker, stage_timeout,
+    start_deadline
 )
+from telemetry import metrics, span, start_metrics, traced, write_github_output, write_metrics
+from trend_detector import get_detector, trend_queries
+from tweet_history import get_history
+from tweet_length import MAX_WEIGHTED_LENGTH, weighted_length
+
+# ロギング設定（ハンドラはエントリーポイントでsetup_loggingが設定する）
+LOG_FILE = "tweet_generator.log"
 logger = logging.getLogger(__name__)
 
 
-def scrape_google_news(query: str, max_results: int = 5) -> list:
+# ニュース取得の設定（環境変数で上書き可能）
+GOOGLE_NEWS_BASE_URL = os.getenv('GOOGLE_NEWS_BASE_URL', 'https://www.google.com')
+NEWS_QUERY_TIMEOUT = float(os.getenv('NEWS_QUERY_TIMEOUT', '10'))
+NEWS_MAX_WORKERS = int(os.getenv('NEWS_MAX_WORKERS', '10'))
+NEWS_RATE_PER_SEC = float(os.getenv('NEWS_RATE_PER_SEC', '2'))
+NEWS_RATE_BURST = int(os.getenv('NEWS_RATE_BURST', '6'))
+
+# このスクリプトの主キャラクター（ツイート案としてIssueに出す）。ほかは TWEET_PERSONAS で追加する
+PRIMARY_PERSONA = 'kuma'
+
+# ツイート生成の方式
+#   two_call - 情報の選別とツイート生成を別々のLLM呼び出しで行う（既定）
+#   fused    - 記事から1回の構造化出力で「選んだ話題・理由・ツイート」をまとめて生成する
+TWEET_GENERATION_MODE = os.getenv('TWEET_GENERATION_MODE', 'two_call')
+# 情報の選別（と、検索が失敗したときの知識ベースからのリサーチ）に使うモデル
+SELECTION_MODEL = os.getenv('SELECTION_MODEL', 'gpt-4.1-mini')
+
+# ホスト単位のレート制限（固定sleepの代わり）
+rate_limiter = HostRateLimiter(rate=NEWS_RATE_PER_SEC, burst=NEWS_RATE_BURST)
+
+
+@traced()
+def scrape_google_news(query: str, max_results: int = 5, timeout: float = NEWS_QUERY_TIMEOUT) -> list:
     """
     Google検索で最新ニュースを取得
     
     Args:
         query: 検索クエリ
         max_results: 取得する最大結果数
+        timeout: このクエリのタイムアウト（秒）。レート制限の待ち時間も含む
+            （キャッシュヒット時はネットワークに出ない）
         
     Returns:
-        list: ニュース記事のリスト [{"title": "...", "snippet": "..."}]
+        list: ニュース記事のリスト [{"title": "...", "snippet": "...", "source"?, "published"?, "url"?}]
     """
     logger.info(f"Google検索中: {query}")
+    breaker = get_breaker('google')
     
     try:
         headers = {
@@ -45,43 +89,60 @@ def scrape_google_news(query: str, max_results: int = 5) -> list:
         }
         
         # Google検索（ニュース）
-        search_url = f"https://www.google.com/search?q={query}&tbm=nws&hl=ja"
-        response = requests.get(search_url, headers=headers, timeout=10)
-        response.raise_for_status()
+        search_url = f"{GOOGLE_NEWS_BASE_URL}/search?q={query}&tbm=nws&hl=ja"
+        response = cached_get(search_url, headers=headers, timeout=timeout, limiter=rate_limiter, breaker=breaker)
+        
+        # 結果コンテナだけを抽出（lxml、セレクタプロファイルを順に試す）
+        articles = extract_articles(response.text, max_results=max_results)
         
-        soup = BeautifulSoup(response.text, 'html.parser')
+        # 結果のないページはキャッシュに残さない（次の実行で取り直す）
+        if not articles:
+            invalidate(search_url)
         
-        articles = []
-        # Google検索結果のパース
-        for item in soup.select('div.SoaBEf')[:max_results]:
-            try:
-                title_elem = item.select_one('div.n0jPhd')
-                snippet_elem = item.select_one('div.GI74Re')
-                
-                if title_elem:
-                    title = title_elem.get_text(strip=True)
-                    snippet = snippet_elem.get_text(strip=True) if snippet_elem else ""
-                    
-                    articles.append({
-                        "title": title,
-                        "snippet": snippet
-                    })
-            except Exception as e:
-                logger.warning(f"記事パースエラー: {e}")
-                continue
+        # ブロックされると結果のないページが返るので、結果が空なら失敗として数える
+        # （304で再検証したときもネットワークに出ているので、半開の試しの結果として記録する）
+        if not response.from_cache or response.revalidated:
+            if articles:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
         
         logger.info(f"取得した記事数: {len(articles)}")
         return articles
         
+    except CircuitOpenError:
+        logger.warning(f"Google検索を省略しました（サーキットブレーカーが開いています）: {query}")
+        return []
     except Exception as e:
+        # 429/503はブロックされたとみなして、残りのクエリをすぐに省く
+        status_code = getattr(getattr(e, 'response', None), 'status_code', None)
+        breaker.record_failure(trip=status_code in (429, 503))
         logger.error(f"Google検索エラー: {e}")
         return []
+    finally:
+        breaker.release()
+
+
+class GoogleNewsSource(NewsSource):
+    """Googleニュース検索（1クエリ）のアダプター"""
+    
+    def __init__(self, query: str, max_results: int = 3):
+        self.name = f"google:{query}"
+        self.query = query
+        self.max_results = max_results
+    
+    def fetch(self, timeout: float) -> list:
+        return scrape_google_news(self.query, self.max_results, timeout)
 
 
 def search_ai_news_multi_source() -> list:
     """
     複数のソースから生成AI関連の最新ニュースを検索
     
+    Google検索の各クエリとRSS/Atomフィード（NEWS_FEEDS）を並列に取得し、
+    ホスト単位のレート制限で頻度を制御する。結果はソースの順序どおりに結合される。
+    フィードは前回の実行以降の新着記事だけを返す。
+    
     Returns:
         list: ニュース記事のリスト
     """
@@ -98,16 +159,58 @@ def search_ai_news_multi_source() -> list:
         "AI 画像生成",
         "Anthropic Claude"
     ]
+    # 急上昇中の語があれば検索クエリに加える
+    detector = get_detector()
+    trend_sources = [GoogleNewsSource(query) for query in trend_queries(detector, queries)]
+    
+    sources = [GoogleNewsSource(query) for query in queries] + trend_sources
+    sources += feed_sources(limiter=rate_limiter)
     
-    for query in queries:
-        articles = scrape_google_news(query, max_results=3)
-        all_articles.extend(articles)
-        time.sleep(1)  # レート制限対策
+    # 検索に使える時間（実行全体の締め切りから、LLMの段階の分を残す）
+    try:
+        timeout = stage_timeout(NEWS_QUERY_TIMEOUT, reserve=RUN_DEADLINE_RESERVE_SECONDS)
+    except DeadlineExceeded as e:
+        logger.warning(f"ニュース検索を省略しました: {e}")
+        return []
+    
+    max_workers = max(1, min(len(sources), NEWS_MAX_WORKERS))
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    # メトリクス・締め切りは呼び出し元のコンテキストのものを使う
+    futures = [executor.submit(contextvars.copy_context().run, source.fetch, timeout) for source in sources]
+    # ソースの順序を保って結合（fetchは例外を投げない）。締め切りまでに返らないソースは待たない
+    deadline = current_deadline()
+    wait_until = deadline.expires_at - RUN_DEADLINE_RESERVE_SECONDS if deadline else None
+    observed = []
+    for source, future in zip(sources, futures):
+        try:
+            wait = None if wait_until is None else max(wait_until - time.monotonic(), 0)
+            articles = future.result(timeout=wait)
+            all_articles.extend(articles)
+            if source not in trend_sources:
+                observed.extend(articles)
+        except FutureTimeoutError:
+            logger.warning(f"時間内に応答がないためスキップしました: {source.name}")
+            metrics.increment('deadline.skipped_sources')
+    executor.shutdown(wait=False, cancel_futures=True)
+    
+    # 取得した記事のタイトルを急上昇トピックの集計に加える
+    # （急上昇中の語で検索した記事を数えると、その語が自分で件数を押し上げて急上昇のまま残るので除く）
+    try:
+        detector.observe(observed)
+        detector.save()
+    except Exception as e:
+        logger.warning(f"急上昇トピックの集計に失敗しました: {e}")
     
     logger.info(f"合計取得記事数: {len(all_articles)}")
     return all_articles
 
 
+def format_articles(articles: list) -> str:
+    """記事をプロンプト用のテキストに整形する（トークン予算内で価値の高い記事から詰める）"""
+    return pack_articles(articles)["text"]
+
+
+@traced()
 def analyze_and_select_viral_content(articles: list) -> str:
     """
     LLMを使用して、バズりそうな情報を分析・選別
@@ -125,18 +228,12 @@ def analyze_and_select_viral_content(articles: list) -> str:
         return None
     
     try:
-        client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        
-        # 記事情報を整形
-        articles_text = "\n\n".join([
-            f"【記事{i+1}】\nタイトル: {article['title']}\n内容: {article['snippet']}"
-            for i, article in enumerate(articles[:15])  # 最大15記事
-        ])
+        articles_text = format_articles(articles)
         
         today = datetime.now().strftime('%Y年%m月%d日')
         
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
+        selected_content = complete(
+            model=SELECTION_MODEL,
             messages=[
                 {
                     "role": "system",
@@ -172,9 +269,8 @@ def analyze_and_select_viral_content(articles: list) -> str:
             max_tokens=600
         )
         
-        selected_content = response.choices[0].message.content.strip()
         logger.info(f"選別完了: {len(selected_content)}文字")
-        logger.info(f"選別内容: {selected_content}")
+        logger.debug(f"選別内容: {selected_content}")
         return selected_content
         
     except Exception as e:
@@ -182,58 +278,176 @@ def analyze_and_select_viral_content(articles: list) -> str:
         return None
 
 
+def rank_articles(raw_articles: list, recent_tweets: list) -> list:
+    """重複記事をまとめて、事前ランキングの上位だけを返す"""
+    with span('dedupe_articles'):
+        articles, collapsed = dedupe_articles(raw_articles)
+    metrics.increment('articles.collapsed', collapsed)
+    with span('prerank_articles', candidates=len(articles)):
+        return prerank_articles(articles, recent_tweets)
+
+
+def collect_articles() -> tuple:
+    """
+    ニュースを検索し、重複記事をまとめて、事前ランキングの上位だけを返す
+
+    Returns:
+        tuple: (事前ランキングの上位の記事, 検索で得たすべての記事)
+    """
+    with span('search_ai_news_multi_source'):
+        raw_articles = search_ai_news_multi_source()
+    return rank_articles(raw_articles, get_history().recent_texts()), raw_articles
+
+
+def research_viral_content() -> tuple:
+    """
+    ニュースを検索・重複除去し、バズりそうな情報を選別する
+
+    Returns:
+        tuple: (選別内容 or None, 分析に使った記事のリスト, 検索で得たすべての記事)
+    """
+    articles, raw_articles = collect_articles()
+    if not articles:
+        return None, articles, raw_articles
+    return analyze_and_select_viral_content(articles), articles, raw_articles
+
+
+def prefetch_research() -> int:
+    """
+    事前リサーチ: ニュースを集めて分析し、結果をキューに追加する
+
+    常駐モードではバックグラウンドで定期的に実行し、単発では cron などから実行する。
+    メトリクスは実行枠のジョブと混ざらないよう、ここで新しく始める。
+
+    Returns:
+        int: 終了コード
+    """
+    logger.info("事前リサーチ開始")
+    start_metrics()
+    start_deadline()
+    try:
+        with span('prefetch_research'):
+            content_summary, articles, raw_articles = research_viral_content()
+        if not content_summary:
+            logger.warning("事前リサーチで素材が得られませんでした")
+            return 1
+        research_id = get_queue().put(content_summary, articles[:15], source='generate_tweet')
+        logger.info(f"事前リサーチ結果をキューに追加しました: ID={research_id}")
+        # 分析に使い終わったので、フィードの既読位置を進める
+        advance_watermarks(raw_articles)
+        return 0
+    except Exception as e:
+        logger.error(f"事前リサーチエラー: {e}")
+        return 1
+
+
+@traced()
 def generate_kuma_sensei_tweet(content_summary: str) -> str:
     """
     選別された情報をもとに、くま博士風のツイートを生成
     
+    1回のリクエストでTWEET_CANDIDATES件の候補を生成し、文字数・ハッシュタグ・🐻・
+    語尾・新規性でローカル採点して最良の候補を採用する。
+    
     Args:
         content_summary: 選別された情報のサマリー
         
     Returns:
-        str: 生成されたツイート内容（280文字以内）
+        str: 生成されたツイート内容（Xの重み付き文字数で280以内）
+    """
+    return generate_persona_tweet(get_persona(PRIMARY_PERSONA), content_summary, source='generate_tweet')
+
+
+# 融合方式の構造化出力（選んだ話題・バズりそうな理由・ツイート）
+FUSED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "kuma_sensei_tweet",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "selected_story": {"type": "string", "description": "選んだ話題（企業名・製品名・数字を含む）"},
+                "reasoning": {"type": "string", "description": "バズりそうな理由（簡潔に）"},
+                "tweet": {"type": "string", "description": "くーたん博士のツイート本文"},
+            },
+            "required": ["selected_story", "reasoning", "tweet"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+def parse_fused_output(content: str) -> dict:
+    """
+    融合方式の出力（JSON）を辞書にする
+
+    JSONとして読めない場合は、出力全体をツイート本文として扱う。
+
+    Args:
+        content: LLMの出力
+
+    Returns:
+        dict: {"selected_story", "reasoning", "tweet"}
     """
-    logger.info("くま博士風のツイートを生成中...")
-    
     try:
-        client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": """あなたは「くーたん博士」という、かわいいくまのAI専門家キャラクターです。
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        data = None
+    if not isinstance(data, dict):
+        return {"selected_story": "", "reasoning": "", "tweet": (content or "").strip()}
+    return {
+        "selected_story": str(data.get("selected_story") or ""),
+        "reasoning": str(data.get("reasoning") or ""),
+        "tweet": str(data.get("tweet") or "").strip(),
+    }
 
-キャラクター設定：
-- 種族: かわいいくま🐻
-- 語尾: 「〜クマ」「〜だクマ」「〜クマね」「〜クマよ」
-- 口調: 親しみやすく、かわいらしく、でも知識豊富
-- 絵文字: 🐻✨💡🌟🎨🔥🚀など（くま絵文字必須）
-- 特徴: 最新AI技術に詳しく、分かりやすく説明するのが得意なくま
 
-ツイートの要件：
-- 280文字以内（厳守）
-- くま博士らしい口調（語尾に「クマ」を自然に入れる）
-- 具体的な企業名や製品名を含める
-- 驚きや興奮を表現
-- バズりやすい構成（冒頭で引きつける）
-- ハッシュタグ: #生成AI #AI を含める
-- 絵文字は適度に（特に🐻を使う）
+@traced()
+def generate_fused_tweet(articles: list, selection: dict = None) -> str:
+    """
+    記事から1回のLLM呼び出しで話題を選び、くま博士風のツイートまで生成する（融合方式）
 
-例：
-「みんな聞いてクマ！🐻✨ OpenAIの新機能がヤバいクマ〜！」
-「これは驚きクマね🐻💡 Googleが発表した〜」
-"""
-                },
-                {
-                    "role": "user",
-                    "content": f"""
-以下の最新情報をもとに、くま博士（くーたん博士）としてバズりそうなツイートを作成してください：
+    選別とツイート生成を1回の構造化出力にまとめ、2段階方式と同じ検証を通す。
 
-{content_summary}
+    Args:
+        articles: ニュース記事のリスト
+        selection: 渡すと、選んだ話題と理由（selected_story, reasoning）を書き込む
 
-要件：
-- 280文字以内（厳守）
+    Returns:
+        str: 生成されたツイート内容。失敗した場合はNone（呼び出し側で2段階方式のフォールバックへ進む）
+    """
+    logger.info("記事から話題の選別とツイート生成をまとめて実行中...")
+    
+    selections = []
+    
+    def extract(content: str) -> str:
+        output = parse_fused_output(content)
+        if output['selected_story']:
+            selections.append(output)
+        return output['tweet']
+    
+    try:
+        today = datetime.now().strftime('%Y年%m月%d日')
+        messages = [
+            {"role": "system", "content": KUMA_SENSEI_SYSTEM_PROMPT},
+            {
+                "role": "user",
+                "content": f"""
+今日は{today}です。
+
+以下の生成AI関連ニュースから、驚き・具体性・話題性・実用性の観点で最もバズりそうな話題を1つ選び、
+くま博士（くーたん博士）としてその話題のツイートを作成してください：
+
+{format_articles(articles)}
+
+出力（JSON）：
+- selected_story: 選んだ話題（企業名・製品名・数字を含めて100文字程度）
+- reasoning: バズりそうな理由（50文字程度）
+- tweet: ツイート本文
+
+ツイートの要件：
+- Xの文字数換算で280以内（厳守。全角なら約130文字まで）
 - くま博士の口調で（語尾に「クマ」）
 - 🐻絵文字を必ず使う
 - 具体的な企業名や製品名を含める
@@ -241,63 +455,180 @@ def generate_kuma_sensei_tweet(content_summary: str) -> str:
 - 冒頭で読者を引きつける
 - ハッシュタグ #生成AI #AI を含める
 """
-                }
-            ],
-            temperature=0.9,
-            max_tokens=300
+            }
+        ]
+        tweet = generate_validated_tweet(
+            messages, get_persona(PRIMARY_PERSONA), extract=extract, source='generate_tweet',
+            response_format=FUSED_RESPONSE_FORMAT
         )
-        
-        tweet = response.choices[0].message.content.strip()
-        
-        # 280文字制限チェック
-        if len(tweet) > 280:
-            logger.warning(f"ツイートが長すぎます（{len(tweet)}文字）。短縮します...")
-            tweet = tweet[:277] + "..."
-        
-        logger.info(f"ツイート生成完了: {len(tweet)}文字")
-        logger.info(f"生成内容: {tweet}")
-        
+        if selections:
+            logger.debug(f"選別内容: {selections[0]['selected_story']}（理由: {selections[0]['reasoning']}）")
+            if selection is not None:
+                selection.update(selections[0])
         return tweet
         
     except Exception as e:
-        logger.error(f"ツイート生成エラー: {e}")
-        # フォールバック
-        return "みんな聞いてクマ！🐻✨ 今日も生成AIの世界はすごい進化を見せているクマよ〜！OpenAIやGoogleの最新技術、本当にワクワクするクマね💡 一緒にAIの未来を楽しもうクマ🚀 #生成AI #AI"
+        logger.error(f"融合方式のツイート生成エラー: {e}")
+        return None
+
+
+def _take_prefetched():
+    """1. 事前リサーチ済みの素材があれば使う（投稿時のLLM呼び出しはツイート生成だけになる）"""
+    prefetched = get_queue().take('generate_tweet')
+    if prefetched:
+        logger.info(f"事前リサーチ結果を使用します（{prefetched['age_seconds'] / 60:.0f}分前）")
+        metrics.increment('research.prefetched')
+    return prefetched
 
 
-def main():
-    """メイン処理"""
+def _search_news(prefetched):
+    """2. なければその場でニュースを検索する"""
+    if prefetched:
+        return []
+    with span('search_ai_news_multi_source'):
+        return search_ai_news_multi_source()
+
+
+def _recent_tweets():
+    return get_history().recent_texts()
+
+
+def _generate_fused(prefetched, articles):
+    """融合方式: 記事から1回のLLM呼び出しでツイートまで生成する"""
+    selection = {}
+    tweet = None
+    if not prefetched and TWEET_GENERATION_MODE == 'fused' and articles:
+        tweet = generate_fused_tweet(articles, selection)
+    return {'fused_tweet': tweet, 'selection': selection}
+
+
+def _select_content(prefetched, articles, fused_tweet, selection, personas):
+    """3. バズりそうな情報を選別する（失敗したら期限切れの事前リサーチ結果 → LLMの知識ベースの順）"""
+    if prefetched:
+        return prefetched['summary']
+    if fused_tweet is not None:
+        if selection:
+            # ほかのキャラクターは融合方式で選んだ話題をもとに書く
+            return f"{selection['selected_story']}\n{selection['reasoning']}"
+        if len(personas) == 1:
+            return None
+    # 融合方式が失敗したときも2段階方式で続ける
+    content_summary = analyze_and_select_viral_content(articles) if articles else None
+    if not content_summary:
+        stale = get_queue().take('generate_tweet', allow_expired=True)
+        if stale:
+            logger.warning(f"Web検索が失敗しました。期限切れの事前リサーチ結果を使用します（{stale['age_seconds'] / 3600:.1f}時間前）")
+            metrics.increment('fallback.stale_prefetch')
+            content_summary = stale['summary']
+    if not content_summary:
+        logger.warning("Web検索が失敗しました。LLMの知識ベースを使用します。")
+        metrics.increment('fallback.knowledge_base')
+        content_summary = complete(
+            model=SELECTION_MODEL,
+            messages=[{
+                "role": "user",
+                "content": "生成AI分野の最新トレンドで、最も話題性が高く、バズりそうな情報を具体的に教えてください。企業名、製品名、数字を含めて300文字程度で。"
+            }],
+            temperature=0.8,
+            max_tokens=500
+        )
+    return content_summary
+
+
+def _generate_tweets(personas, content_summary, fused_tweet):
+    """4. くま博士風のツイートと、追加のキャラクターのツイートを同じリサーチ結果から並行して生成"""
+    def generate(persona):
+        if persona.name == PRIMARY_PERSONA:
+            return fused_tweet if fused_tweet is not None else generate_kuma_sensei_tweet(content_summary)
+        return generate_persona_tweet(persona, content_summary, source='generate_tweet')
+    return fan_out(personas, generate)
+
+
+def build_pipeline() -> Pipeline:
+    """
+    ツイート生成の段階グラフ
+
+    personas（生成するキャラクターのリスト）は実行時に初期値として渡す。
+    検索・選別・生成の結果はチェックポイントに残り、失敗した実行はその続きから再開する。
+    """
+    return Pipeline('generate_tweet', [
+        Stage('prefetched', _take_prefetched),
+        Stage('raw_articles', _search_news, inputs=('prefetched',)),
+        Stage('recent_tweets', _recent_tweets, memoize=False),
+        Stage('articles', rank_articles, inputs=('raw_articles', 'recent_tweets'), memoize=False),
+        Stage('fused', _generate_fused, inputs=('prefetched', 'articles'), outputs=('fused_tweet', 'selection')),
+        Stage('content_summary', _select_content,
+              inputs=('prefetched', 'articles', 'fused_tweet', 'selection', 'personas')),
+        Stage('tweets', _generate_tweets, inputs=('personas', 'content_summary', 'fused_tweet')),
+    ])
+
+
+def save_run_snapshot(run_id: str, values: dict, exchanges: list) -> None:
+    """実行のスナップショット（記事・選別結果・LLMとのやり取り・ツイート）を保存する。失敗しても実行は続ける"""
+    try:
+        save_snapshot('generate_tweet', {
+            'mode': TWEET_GENERATION_MODE,
+            'personas': [persona.name for persona in values['personas']],
+            'prefetched': values['prefetched'],
+            'raw_articles': values['raw_articles'],
+            'recent_tweets': values['recent_tweets'],
+            'selection': values['selection'],
+            'content_summary': values['content_summary'],
+            'tweets': values['tweets'],
+            'exchanges': exchanges,
+            'metrics': metrics.summary(),
+        }, run_id=run_id)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"スナップショットの保存に失敗しました: {e}")
+
+
+def archive_run(run_id: str, values: dict) -> None:
+    """実行記録（使った記事・選別結果・ツイート・メトリクス）をアーカイブに追記する。失敗しても実行は続ける"""
+    # 事前リサーチ結果を使った実行は、その分析に使った記事を残す
+    articles = values['prefetched']['articles'] if values['prefetched'] else values['articles']
+    try:
+        get_archive().append({
+            'run_id': run_id,
+            'script': 'generate_tweet',
+            'created_at': time.time(),
+            'mode': TWEET_GENERATION_MODE,
+            'articles': slim_articles(articles),
+            'summary': values['content_summary'] or values['selection'].get('selected_story'),
+            'tweet': values['tweets'][PRIMARY_PERSONA],
+            'tweets': values['tweets'],
+            'metrics': metrics.summary(),
+        })
+    except (OSError, TypeError, ValueError, sqlite3.Error) as e:
+        logger.warning(f"実行記録のアーカイブに失敗しました: {e}")
+
+
+def main(resume: bool = True):
+    """
+    メイン処理
+    
+    Args:
+        resume: 前回失敗した実行の途中結果（検索・選別など）から再開するか
+    """
     logger.info("=" * 60)
     logger.info("X AI Tweet Generator 開始（本格Web検索モード）")
     logger.info("=" * 60)
+    start_metrics()
+    start_deadline()
     
     try:
-        # 1. 複数ソースから最新ニュースを検索
-        articles = search_ai_news_multi_source()
-        
-        # 2. バズりそうな情報を分析・選別
-        if articles:
-            content_summary = analyze_and_select_viral_content(articles)
-        else:
-            content_summary = None
-        
-        # 3. フォールバック処理
-        if not content_summary:
-            logger.warning("Web検索が失敗しました。LLMの知識ベースを使用します。")
-            client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-            response = client.chat.completions.create(
-                model="gpt-4.1-mini",
-                messages=[{
-                    "role": "user",
-                    "content": "生成AI分野の最新トレンドで、最も話題性が高く、バズりそうな情報を具体的に教えてください。企業名、製品名、数字を含めて300文字程度で。"
-                }],
-                temperature=0.8,
-                max_tokens=500
-            )
-            content_summary = response.choices[0].message.content.strip()
+        personas = enabled_personas(PRIMARY_PERSONA)
         
-        # 4. くま博士風のツイートを生成
-        tweet = generate_kuma_sensei_tweet(content_summary)
+        # 事前リサーチ → 検索（過去ツイートの読み込みと並行）→ 選別 → キャラクターごとの生成
+        with capture_exchanges() as exchanges:
+            values = build_pipeline().run(resume=resume, personas=personas)
+        tweets = values['tweets']
+        tweet = tweets[PRIMARY_PERSONA]
+        # ツイートまで生成できたので、フィードの既読位置を進める（失敗した実行の新着は次回また読む）
+        advance_watermarks(values['raw_articles'])
+        enqueue_persona_tweets(tweets, personas, source='generate_tweet')
+        run_id = new_run_id('generate_tweet')
+        save_run_snapshot(run_id, values, exchanges)
+        archive_run(run_id, values)
         
         # 5. 結果を出力（GitHub Actionsで使用）
         print("\n" + "=" * 60)
@@ -305,14 +636,21 @@ def main():
         print("=" * 60)
         print(tweet)
         print("=" * 60)
-        print(f"\n文字数: {len(tweet)}/280")
+        print(f"\n文字数: {weighted_length(tweet)}/{MAX_WEIGHTED_LENGTH}（X換算）")
+        for persona in personas[1:]:
+            print(f"\n[{persona.label}]\n{tweets[persona.name]}")
         print("\n✅ ツイート生成完了！")
         
         # GitHub Actionsの環境変数に出力
         if os.getenv('GITHUB_OUTPUT'):
             with open(os.getenv('GITHUB_OUTPUT'), 'a') as f:
                 f.write(f"tweet<<EOF\n{tweet}\nEOF\n")
-                f.write(f"char_count={len(tweet)}\n")
+                f.write(f"char_count={weighted_length(tweet)}\n")
+                for persona in personas[1:]:
+                    f.write(f"tweet_{persona.name}<<EOF\n{tweets[persona.name]}\nEOF\n")
+        
+        # 実行メトリクス（段階別の所要時間・トークン数・キャッシュヒット数）
+        write_github_output(write_metrics())
         
         logger.info("=" * 60)
         logger.info("X AI Tweet Generator 終了")
@@ -324,9 +662,38 @@ def main():
         logger.error(f"予期しないエラー: {e}")
         import traceback
         logger.error(traceback.format_exc())
+        # 途中で止まった実行もエラーとメトリクスをアーカイブに残す
+        cause = e.cause if isinstance(e, StageError) else e
+        archive_failed_run(new_run_id('generate_tweet'), 'generate_tweet', cause, metrics.summary())
+        write_metrics()
         return 1
 
 
+def warm_up() -> None:
+    """常駐モードの起動時に、HTTPセッション・LLMクライアント・ツイート履歴を用意しておく"""
+    from http_cache import get_session
+    from llm_client import get_client
+    get_session()
+    get_client()
+    get_history()
+    get_queue()
+
+
 if __name__ == "__main__":
-    sys.exit(main())
+    import argparse
+    from log_setup import setup_logging
+    setup_logging(LOG_FILE)
+    parser = argparse.ArgumentParser(description="X AI Tweet Generator")
+    parser.add_argument('--daemon', action='store_true', help="常駐してJSTの実行枠ごとにツイートを生成する")
+    parser.add_argument('--prefetch', action='store_true', help="事前リサーチだけを実行してキューに追加する")
+    parser.add_argument('--no-resume', action='store_true', help="前回失敗した実行の途中結果を使わずに最初から実行する")
+    args = parser.parse_args()
+    if args.daemon:
+        from scheduler import run_daemon
+        sys.exit(run_daemon(main, 'generate_tweet', warmup=warm_up, background=prefetch_research))
+    if args.prefetch:
+        exit_code = prefetch_research()
+        write_metrics()
+        sys.exit(exit_code)
+    sys.exit(main(resume=not args.no_resume))
 
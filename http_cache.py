@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+共有HTTPセッションとディスクキャッシュ
+接続プールを使い回し、同一URLへの再取得をTTL付きキャッシュで抑える
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from resilience import CircuitOpenError
+from telemetry import increment
+
+logger = logging.getLogger(__name__)
+
+
+# キャッシュ設定（環境変数で上書き可能）
+HTTP_CACHE_DIR = os.getenv('HTTP_CACHE_DIR', os.path.join('.cache', 'http'))
+HTTP_CACHE_TTL = float(os.getenv('HTTP_CACHE_TTL', '900'))
+HTTP_CACHE_MAX_BYTES = int(os.getenv('HTTP_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    プロセス内で共有するrequests.Sessionを返す
+
+    Returns:
+        requests.Session: 接続プール付きのセッション
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+class CachedResponse:
+    """
+    キャッシュまたはネットワークから得たレスポンス
+
+    from_cache が True でも revalidated が True なら、条件付きGETでネットワークに出て304が返っている
+    """
+
+    def __init__(self, url: str, status_code: int, text: str, headers: dict, from_cache: bool,
+                 revalidated: bool = False):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers
+        self.from_cache = from_cache
+        self.revalidated = revalidated
+
+
+class DiskCache:
+    """
+    URLをキーにしたコンテンツアドレス型のディスクキャッシュ
+
+    エントリはURLのSHA-256をファイル名としてJSONで保存する。
+    アクセス時にmtimeを更新し、合計サイズが上限を超えたら古い順に削除する（LRU）。
+
+    Args:
+        directory: キャッシュディレクトリ
+        ttl: 再検証なしで使える秒数
+        max_bytes: キャッシュ全体の最大バイト数
+    """
+
+    def __init__(self, directory: str = HTTP_CACHE_DIR, ttl: float = HTTP_CACHE_TTL,
+                 max_bytes: int = HTTP_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, url: str) -> dict:
+        """キャッシュエントリを読み込む（なければNone）"""
+        path = self._path(url)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('url') != url:
+            return None
+        try:
+            os.utime(path, None)  # LRU用にアクセス時刻を更新
+        except OSError:
+            pass
+        return entry
+
+    def store(self, url: str, entry: dict) -> None:
+        """キャッシュエントリを書き込み、必要なら古いエントリを削除する"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(url)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def delete(self, url: str) -> bool:
+        """キャッシュエントリを削除する（削除した場合True）"""
+        try:
+            os.remove(self._path(url))
+        except OSError:
+            return False
+        return True
+
+    def is_fresh(self, entry: dict, ttl: float = None) -> bool:
+        """エントリがTTL内かどうか"""
+        ttl = self.ttl if ttl is None else ttl
+        return time.time() - entry.get('fetched_at', 0) < ttl
+
+    def evict(self) -> int:
+        """
+        合計サイズが上限を超えている場合、最終アクセスの古い順に削除する
+
+        Returns:
+            int: 削除したエントリ数
+        """
+        with self._lock:
+            try:
+                names = [n for n in os.listdir(self.directory) if n.endswith('.json')]
+            except OSError:
+                return 0
+            files = []
+            total = 0
+            for name in names:
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+            removed = 0
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            if removed:
+                logger.info(f"HTTPキャッシュを{removed}件削除しました")
+            return removed
+
+
+_cache = DiskCache()
+
+
+def cached_get(url: str, headers: dict = None, timeout: float = 10,
+               ttl: float = None, cache: DiskCache = None, limiter=None, breaker=None) -> CachedResponse:
+    """
+    キャッシュを考慮してGETリクエストを送る
+
+    TTL内のエントリはネットワークに出ずに返す。期限切れでもETag/Last-Modifiedが
+    あれば条件付きGETで再検証し、304なら保存済みの本文を使う。
+
+    Args:
+        url: 取得するURL
+        headers: 追加のリクエストヘッダー
+        timeout: タイムアウト（秒）
+        ttl: このリクエストで使うTTL（Noneならキャッシュの既定値）
+        cache: 使用するキャッシュ（Noneなら共有キャッシュ）
+        limiter: ネットワークに出る場合だけ使うレート制限（HostRateLimiter）。
+            待ち時間はtimeoutに含まれる
+        breaker: ネットワークに出る直前に確認するサーキットブレーカー。
+            成功・失敗の記録は呼び出し側で行う
+
+    Returns:
+        CachedResponse: レスポンス
+
+    Raises:
+        requests.RequestException: 通信エラーまたはHTTPエラー
+        CircuitOpenError: サーキットブレーカーが開いている
+    """
+    cache = cache or _cache
+    entry = cache.load(url)
+
+    if entry and cache.is_fresh(entry, ttl):
+        logger.info(f"HTTPキャッシュヒット: {url}")
+        increment('http.cache_hits')
+        return CachedResponse(url, entry['status_code'], entry['text'], entry['headers'], True)
+
+    request_headers = dict(headers or {})
+    if entry:
+        if entry['headers'].get('etag'):
+            request_headers['If-None-Match'] = entry['headers']['etag']
+        if entry['headers'].get('last-modified'):
+            request_headers['If-Modified-Since'] = entry['headers']['last-modified']
+
+    if limiter is not None:
+        started = time.monotonic()
+        if not limiter.acquire(url, timeout=timeout):
+            raise requests.Timeout(f"レート制限の待機がタイムアウトしました: {url}")
+        timeout = max(timeout - (time.monotonic() - started), 0.1)
+
+    # レート制限を待っている間に開いた場合もここで省く
+    if breaker is not None and not breaker.allow():
+        raise CircuitOpenError(f"サーキットブレーカーが開いているため省きました: {breaker.name}")
+
+    response = get_session().get(url, headers=request_headers, timeout=timeout)
+    increment('http.requests')
+    increment('http.bytes', len(response.content))
+
+    if response.status_code == 304 and entry:
+        logger.info(f"HTTPキャッシュ再検証OK(304): {url}")
+        increment('http.revalidated')
+        entry['fetched_at'] = time.time()
+        try:
+            cache.store(url, entry)
+        except OSError as e:
+            logger.warning(f"HTTPキャッシュ書き込みエラー: {e}")
+        return CachedResponse(url, entry['status_code'], entry['text'], entry['headers'], True, revalidated=True)
+
+    response.raise_for_status()
+    if 'charset' not in response.headers.get('Content-Type', '').lower():
+        # charset指定がないとrequestsはISO-8859-1とみなすため、本文から推定する
+        response.encoding = response.apparent_encoding
+
+    stored_headers = {
+        'etag': response.headers.get('ETag'),
+        'last-modified': response.headers.get('Last-Modified'),
+        'content-type': response.headers.get('Content-Type'),
+    }
+    new_entry = {
+        'url': url,
+        'status_code': response.status_code,
+        'headers': stored_headers,
+        'text': response.text,
+        'fetched_at': time.time(),
+    }
+    try:
+        cache.store(url, new_entry)
+    except OSError as e:
+        logger.warning(f"HTTPキャッシュ書き込みエラー: {e}")
+    return CachedResponse(url, response.status_code, response.text, stored_headers, False)
+
+
+def invalidate(url: str, cache: DiskCache = None) -> None:
+    """
+    URLのキャッシュを捨てる
+
+    結果のないページ（ブロックされたときの空のページなど）をTTLの間使い続けないよう、
+    本文を解析して結果がなかったときに呼び出し側で捨てる。
+
+    Args:
+        url: キャッシュを捨てるURL
+        cache: 使用するキャッシュ（Noneなら共有キャッシュ）
+    """
+    if (cache or _cache).delete(url):
+        logger.info(f"結果のないページのキャッシュを捨てました: {url}")
+        increment('http.cache_invalidated')
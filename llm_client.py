@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+共通のLLM呼び出しレイヤー
+OpenAIクライアントの共有、ジッター付きリトライ、締め切り・サーキットブレーカー・ヘッジ、レスポンスキャッシュ、記録・再生モードを提供する
+"""
+
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from resilience import CircuitOpenError, current_deadline, get_breaker, stage_timeout
+from run_snapshots import record_exchange
+from telemetry import increment, record_llm_call
+
+logger = logging.getLogger(__name__)
+
+
+# LLM呼び出しの設定（環境変数で上書き可能）
+# LLM_CACHE_MODE:
+#   off    - 毎回APIを呼ぶ（既定）
+#   cache  - 同じ入力のレスポンスがディスクにあれば再利用し、なければ呼んで保存する
+#   record - 毎回APIを呼び、レスポンスをディスクに保存する
+#   replay - ディスクに保存されたレスポンスだけを使う（APIは呼ばない）
+LLM_CACHE_MODE = os.getenv('LLM_CACHE_MODE', 'off')
+LLM_CACHE_DIR = os.getenv('LLM_CACHE_DIR', os.path.join('.cache', 'llm'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '1.0'))
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', '20'))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '60'))
+# 0より大きければ、この秒数たっても応答がないLLM呼び出しに同じリクエストをもう1本送る（ヘッジ）
+LLM_HEDGE_DELAY = float(os.getenv('LLM_HEDGE_DELAY', '0'))
+
+DEFAULT_MODEL = "gpt-4.1-mini"
+
+_client = None
+_client_lock = threading.Lock()
+_hedge_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='llm-hedge')
+
+
+class ReplayMissError(RuntimeError):
+    """replayモードで保存済みレスポンスが見つからない"""
+
+
+def _retryable_errors() -> tuple:
+    """再試行するopenaiの例外（openaiは実際にAPIを呼ぶときに読み込む）"""
+    import openai
+    return (
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+    )
+
+
+def get_client():
+    """
+    プロセス内で共有するOpenAIクライアントを返す
+
+    リトライはこのモジュールで行うため、クライアント側のリトライは無効にする。
+    openaiは読み込みに時間がかかるので、最初にクライアントが必要になったときに読み込む
+    （キャッシュ・replayモードや投稿だけのコマンドでは読み込まない）。
+
+    Returns:
+        openai.OpenAI: 共有クライアント
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            from openai import OpenAI
+            _client = OpenAI(
+                api_key=os.getenv('OPENAI_API_KEY'),
+                max_retries=0,
+                timeout=LLM_TIMEOUT
+            )
+        return _client
+
+
+def cache_key(model: str, messages: list, params: dict) -> str:
+    """モデル・メッセージ・パラメータからキャッシュキーを作る"""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(LLM_CACHE_DIR, f"{key}.json")
+
+
+def _load_cached(key: str) -> dict:
+    try:
+        with open(_cache_path(key), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_cached(key: str, result: dict, model: str, messages: list, params: dict) -> None:
+    os.makedirs(LLM_CACHE_DIR, exist_ok=True)
+    record = dict(result, request={"model": model, "messages": messages, "params": params})
+    path = _cache_path(key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def save_response(model: str, messages: list, params: dict, contents: list, usage: dict = None) -> None:
+    """
+    レスポンスをキャッシュに保存する
+
+    記録済みのやり取りから cache / replay モード用のキャッシュを作るのに使う。
+    """
+    result = {"model": model, "contents": contents, "usage": usage or {}, "cached": False}
+    _save_cached(cache_key(model, messages, params), result, model, messages, params)
+
+
+def _backoff_delay(attempt: int) -> float:
+    """指数バックオフ（フルジッター）の待ち時間"""
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _hedged_create(client, model: str, messages: list, params: dict):
+    """
+    LLM_HEDGE_DELAY秒たっても応答がなければ同じリクエストをもう1本送り、先に返った方を使う
+
+    遅い方のリクエストは取り消せないので、そのまま終わるのを待たずに捨てる（トークンは両方分かかる）。
+    """
+    first = _hedge_executor.submit(client.chat.completions.create, model=model, messages=messages, **params)
+    done, _ = wait([first], timeout=LLM_HEDGE_DELAY)
+    if done:
+        return first.result()
+    increment('llm.hedged')
+    logger.info(f"LLMの応答が{LLM_HEDGE_DELAY:.1f}秒ないため、同じリクエストをもう1本送ります")
+    second = _hedge_executor.submit(client.chat.completions.create, model=model, messages=messages, **params)
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def _create_with_retry(model: str, messages: list, params: dict):
+    client = get_client()
+    retryable = _retryable_errors()
+    breaker = get_breaker('openai')
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        # 1回あたりのタイムアウトは、実行全体の締め切りまでの残り時間を超えない
+        # （締め切りを過ぎていれば、半開の試しを取る前にここで止める）
+        request_params = dict(params, timeout=stage_timeout(LLM_TIMEOUT))
+        if not breaker.allow():
+            raise CircuitOpenError("OpenAIのサーキットブレーカーが開いているため呼び出しを省きました")
+        try:
+            if LLM_HEDGE_DELAY > 0:
+                response = _hedged_create(client, model, messages, request_params)
+            else:
+                response = client.chat.completions.create(model=model, messages=messages, **request_params)
+            breaker.record_success()
+            return response
+        except retryable as e:
+            breaker.record_failure()
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            delay = _backoff_delay(attempt)
+            deadline = current_deadline()
+            if deadline is not None and deadline.remaining() <= delay:
+                raise
+            increment('llm.retries')
+            logger.warning(f"LLM呼び出しエラー（{attempt + 1}回目）: {e}。{delay:.1f}秒後に再試行します")
+            time.sleep(delay)
+        finally:
+            # 再試行しないエラー（BadRequest・認証エラーなど）で終わっても試しの呼び出しを残さない
+            breaker.release()
+
+
+def chat_completion(messages: list, model: str = DEFAULT_MODEL, mode: str = None, **params) -> dict:
+    """
+    チャット補完を呼び出す
+
+    Args:
+        messages: チャットメッセージのリスト
+        model: モデル名
+        mode: キャッシュモード（Noneなら環境変数LLM_CACHE_MODE）
+        **params: temperature, max_tokens, n などのAPIパラメータ
+
+    Returns:
+        dict: {"model": ..., "contents": [本文, ...], "usage": {...}, "cached": bool}
+
+    Raises:
+        ReplayMissError: replayモードで保存済みレスポンスがない
+        openai.OpenAIError: API呼び出しに失敗した
+        DeadlineExceeded: 実行全体の締め切りまでの残り時間がない
+        CircuitOpenError: OpenAIのサーキットブレーカーが開いている
+    """
+    mode = mode or LLM_CACHE_MODE
+    key = cache_key(model, messages, params)
+    started = time.perf_counter()
+
+    if mode in ('cache', 'replay'):
+        cached = _load_cached(key)
+        if cached is not None:
+            logger.info(f"LLMキャッシュヒット: {key[:12]}")
+            increment('llm.cache_hits')
+            result = {
+                "model": cached.get("model", model),
+                "contents": cached["contents"],
+                "usage": cached.get("usage") or {},
+                "cached": True,
+            }
+            record_llm_call(model, result["usage"], True, time.perf_counter() - started)
+            record_exchange(model, messages, params, result, time.perf_counter() - started)
+            return result
+        if mode == 'replay':
+            increment('llm.replay_misses')
+            raise ReplayMissError(f"保存済みのLLMレスポンスがありません: {key[:12]}")
+
+    response = _create_with_retry(model, messages, params)
+    usage = response.usage.model_dump() if getattr(response, 'usage', None) else {}
+    result = {
+        "model": getattr(response, 'model', model),
+        "contents": [choice.message.content or "" for choice in response.choices],
+        "usage": usage,
+        "cached": False,
+    }
+    record_llm_call(model, usage, False, time.perf_counter() - started)
+    record_exchange(model, messages, params, result, time.perf_counter() - started)
+
+    if mode in ('cache', 'record'):
+        try:
+            _save_cached(key, result, model, messages, params)
+        except OSError as e:
+            logger.warning(f"LLMキャッシュ書き込みエラー: {e}")
+
+    return result
+
+
+def complete(messages: list, model: str = DEFAULT_MODEL, **params) -> str:
+    """
+    チャット補完を呼び出し、最初の候補の本文を返す
+
+    Args:
+        messages: チャットメッセージのリスト
+        model: モデル名
+        **params: temperature, max_tokens などのAPIパラメータ
+
+    Returns:
+        str: 前後の空白を除いた本文
+    """
+    return chat_completion(messages, model=model, **params)["contents"][0].strip()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+ログ設定
+ログ出力をキュー経由で別スレッドに任せ、呼び出し側はファイル書き込みやローテーションを待たない
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime, timezone
+
+
+# ログの設定（環境変数で上書き可能）
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# text: 従来どおりの1行テキスト / json: 1行1レコードのJSON（JSON Lines）
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(5 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+# 空ならサイズでローテーションする。'midnight' や 'H' などを指定すると時刻でローテーションする
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', '')
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """ログレコードを1行のJSONにする"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _file_handler(log_file: str) -> logging.Handler:
+    if LOG_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(
+            log_file, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    return logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+    )
+
+
+def setup_logging(log_file: str, level: str = None, log_format: str = None) -> logging.handlers.QueueListener:
+    """
+    ルートロガーをキュー経由の非同期出力に設定する
+
+    ルートロガーにはQueueHandlerだけを付け、ファイル（ローテーションつき）と標準エラーへの
+    書き込みはQueueListenerのスレッドで行う。終了時にキューに残ったログを書き出してから止める。
+    エントリーポイントから1回だけ呼ぶ（2回目以降は何もしない）。
+
+    Args:
+        log_file: ログファイルのパス
+        level: ログレベル（Noneなら環境変数LOG_LEVEL）
+        log_format: 'text' または 'json'（Noneなら環境変数LOG_FORMAT）
+
+    Returns:
+        logging.handlers.QueueListener: 起動済みのリスナー
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    level = (level or LOG_LEVEL).upper()
+    log_format = log_format or LOG_FORMAT
+
+    file_handler = _file_handler(log_file)
+    stream_handler = logging.StreamHandler()
+    file_handler.setFormatter(JsonLinesFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT))
+    # 画面には常に読みやすいテキストで出す
+    stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging() -> None:
+    """キューに残ったログを書き出して、出力スレッドを止める"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Googleニュース検索結果ページからの記事抽出
+lxmlで結果コンテナだけを取り出し、セレクタのプロファイルを差し替えてマークアップ変更に備える
+"""
+
+import json
+import logging
+import os
+
+try:
+    from lxml import html as lxml_html
+except ImportError:  # lxmlがなければBeautifulSoup（SoupStrainer）で代替する
+    lxml_html = None
+
+logger = logging.getLogger(__name__)
+
+
+# セレクタのプロファイル（上から順に試し、結果が取れた最初のものを使う）
+# 各値はclass属性に含まれるクラス名
+SELECTOR_PROFILES = [
+    {
+        "name": "news_soabef",
+        "container": "SoaBEf",
+        "title": "n0jPhd",
+        "snippet": "GI74Re",
+        "source": "CEMjEf",
+        "published": "OSrXXb",
+    },
+    {
+        "name": "news_dbsr",
+        "container": "dbsr",
+        "title": "JheGif",
+        "snippet": "Y3v8qd",
+        "source": "XTjFC",
+        "published": "WG9SHc",
+    },
+]
+
+# 追加のプロファイルを書いたJSONファイル（リスト形式）。既定のプロファイルより先に試す
+NEWS_SELECTOR_PROFILES = os.getenv('NEWS_SELECTOR_PROFILES')
+
+
+def load_profiles(path: str = NEWS_SELECTOR_PROFILES) -> list:
+    """
+    使用するセレクタプロファイルを返す
+
+    Args:
+        path: 追加プロファイルのJSONファイル（Noneなら既定のみ）
+
+    Returns:
+        list: プロファイルのリスト
+    """
+    if not path:
+        return list(SELECTOR_PROFILES)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            custom = json.load(f)
+        return list(custom) + SELECTOR_PROFILES
+    except (OSError, ValueError) as e:
+        logger.warning(f"セレクタプロファイルの読み込みに失敗しました: {e}")
+        return list(SELECTOR_PROFILES)
+
+
+_default_profiles = load_profiles()
+
+
+def _class_xpath(class_name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+
+def _clean(text: str) -> str:
+    return ' '.join(text.split())
+
+
+def _extract_lxml(tree, profile: dict, max_results: int) -> list:
+    containers = tree.xpath(f"//div[{_class_xpath(profile['container'])}]")
+    articles = []
+    for item in containers[:max_results]:
+        fields = {}
+        for field in ('title', 'snippet', 'source', 'published'):
+            class_name = profile.get(field)
+            if not class_name:
+                continue
+            found = item.xpath(f".//*[{_class_xpath(class_name)}]")
+            if found:
+                fields[field] = _clean(found[0].text_content())
+        if not fields.get('title'):
+            continue
+        link = item.xpath('(.//a[@href])[1]/@href')
+        article = {"title": fields['title'], "snippet": fields.get('snippet', '')}
+        for field in ('source', 'published'):
+            if fields.get(field):
+                article[field] = fields[field]
+        if link:
+            article['url'] = link[0]
+        articles.append(article)
+    return articles
+
+
+def _extract_soup(page: str, profile: dict, max_results: int) -> list:
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    # 結果コンテナのdivだけを木に載せる
+    strainer = SoupStrainer('div', class_=profile['container'])
+    soup = BeautifulSoup(page, 'html.parser', parse_only=strainer)
+    articles = []
+    for item in soup.select(f"div.{profile['container']}")[:max_results]:
+        title_elem = item.select_one(f".{profile['title']}")
+        if not title_elem:
+            continue
+        snippet_elem = item.select_one(f".{profile['snippet']}") if profile.get('snippet') else None
+        article = {
+            "title": _clean(title_elem.get_text(' ')),
+            "snippet": _clean(snippet_elem.get_text(' ')) if snippet_elem else "",
+        }
+        for field in ('source', 'published'):
+            elem = item.select_one(f".{profile[field]}") if profile.get(field) else None
+            if elem:
+                article[field] = _clean(elem.get_text(' '))
+        link = item.find('a', href=True)
+        if link:
+            article['url'] = link['href']
+        articles.append(article)
+    return articles
+
+
+def extract_articles(page: str, max_results: int = 5, profiles: list = None) -> list:
+    """
+    検索結果ページから記事を抽出する
+
+    プロファイルを順に試し、記事が取れた最初のプロファイルの結果を返す。
+
+    Args:
+        page: 検索結果ページのHTML
+        max_results: 取得する最大結果数
+        profiles: セレクタプロファイル（Noneなら起動時に読み込んだプロファイル）
+
+    Returns:
+        list: ニュース記事のリスト [{"title": "...", "snippet": "...", "source"?, "published"?, "url"?}]
+    """
+    if not page:
+        return []
+    if lxml_html is not None:
+        # ページは1回だけパースし、プロファイルごとにXPathで結果コンテナを探す
+        document, extractor = lxml_html.fromstring(page), _extract_lxml
+    else:
+        document, extractor = page, _extract_soup
+    for profile in profiles or _default_profiles:
+        try:
+            articles = extractor(document, profile, max_results)
+        except Exception as e:
+            logger.warning(f"記事パースエラー（{profile.get('name')}）: {e}")
+            continue
+        if articles:
+            return articles
+    logger.warning("どのセレクタプロファイルでも記事を抽出できませんでした")
+    return []
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+ニュースソースのアダプター
+RSS/Atomフィードを逐次パースし、フィードごとのウォーターマークで前回以降の新着記事だけを返す。
+ウォーターマークは記事を使い終わってから advance_watermarks で進める（失敗した実行の新着は次回また読む）
+"""
+
+import html
+import io
+import json
+import logging
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+
+from http_cache import cached_get, invalidate
+from telemetry import traced
+
+logger = logging.getLogger(__name__)
+
+
+# フィードの設定（環境変数で上書き可能）
+# NEWS_FEEDS: 「名前|URL」をカンマ区切りで並べる。空文字ならフィードを使わない
+DEFAULT_FEEDS = (
+    "OpenAI|https://openai.com/news/rss.xml,"
+    "Google AI|https://blog.google/technology/ai/rss/,"
+    "Hugging Face|https://huggingface.co/blog/feed.xml,"
+    "ITmedia AI+|https://rss.itmedia.co.jp/rss/2.0/aiplus.xml"
+)
+NEWS_FEEDS = os.getenv('NEWS_FEEDS', DEFAULT_FEEDS)
+FEED_WATERMARK_FILE = os.getenv('FEED_WATERMARK_FILE', os.path.join('.cache', 'feed_watermarks.json'))
+# ウォーターマークがない（初回の）フィードで返す最大記事数。2回目以降は新着をすべて返し、絞り込みはランキングに任せる
+FEED_MAX_ITEMS = int(os.getenv('FEED_MAX_ITEMS', '5'))
+# ウォーターマークがない（初回の）フィードで読む範囲
+FEED_MAX_AGE_HOURS = float(os.getenv('FEED_MAX_AGE_HOURS', '48'))
+FEED_SNIPPET_LENGTH = 300
+
+_TAG = re.compile(r'<[^>]+>')
+_ATOM_NS = '{http://www.w3.org/2005/Atom}'
+
+
+class NewsSource:
+    """
+    ニュースソースの共通インターフェース
+
+    fetch() は例外を投げず、失敗時は空リストを返す。
+    記事は {"title", "snippet", "source"?, "published"?, "url"?} の辞書。
+    """
+
+    name = "source"
+
+    def fetch(self, timeout: float) -> list:
+        raise NotImplementedError
+
+
+class FeedWatermarks:
+    """
+    フィードごとの「最後に読んだ記事の公開日時」を保存する
+
+    Args:
+        path: JSONファイルのパス
+    """
+
+    def __init__(self, path: str = FEED_WATERMARK_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self._marks = json.load(f)
+        except (OSError, ValueError):
+            self._marks = {}
+
+    def get(self, url: str) -> datetime:
+        value = self._marks.get(url)
+        return datetime.fromisoformat(value) if value else None
+
+    def update(self, url: str, published: datetime) -> None:
+        """ウォーターマークを進める（戻ることはない）"""
+        with self._lock:
+            current = self._marks.get(url)
+            if current and datetime.fromisoformat(current) >= published:
+                return
+            self._marks[url] = published.isoformat()
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._marks, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+_watermarks = None
+_watermarks_lock = threading.Lock()
+
+
+def get_watermarks() -> FeedWatermarks:
+    """プロセス内で共有するウォーターマークを返す"""
+    global _watermarks
+    with _watermarks_lock:
+        if _watermarks is None:
+            _watermarks = FeedWatermarks()
+        return _watermarks
+
+
+def parse_feed_date(value: str) -> datetime:
+    """RSS（RFC 822）・Atom（ISO 8601）の日時を、タイムゾーン付きdatetimeに変換する"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def _child_text(elem, *names) -> str:
+    for child in elem:
+        if _local(child.tag) in names and (child.text or '').strip():
+            return child.text.strip()
+    return ''
+
+
+def _clean_snippet(text: str) -> str:
+    text = ' '.join(html.unescape(_TAG.sub(' ', text)).split())
+    return text[:FEED_SNIPPET_LENGTH]
+
+
+def iter_feed_entries(data: str):
+    """
+    RSS/Atomのエントリを逐次パースして返すジェネレータ
+
+    iterparseで1エントリずつ処理し、処理済みの要素は解放する。
+
+    Args:
+        data: フィードのXML（デコード済みの文字列）
+
+    Yields:
+        dict: {"title", "snippet", "url", "published": datetime or None}
+    """
+    for _, elem in ET.iterparse(io.StringIO(data), events=('end',)):
+        tag = _local(elem.tag)
+        if tag not in ('item', 'entry'):
+            continue
+        link = _child_text(elem, 'link')
+        if not link:
+            atom_link = elem.find(f'{_ATOM_NS}link')
+            link = atom_link.get('href', '') if atom_link is not None else ''
+        yield {
+            "title": ' '.join(_child_text(elem, 'title').split()),
+            "snippet": _clean_snippet(_child_text(elem, 'description', 'summary', 'content', 'encoded')),
+            "url": link,
+            "published": parse_feed_date(_child_text(elem, 'pubDate', 'published', 'updated', 'date')),
+        }
+        elem.clear()
+
+
+class FeedSource(NewsSource):
+    """
+    RSS/Atomフィードのアダプター
+
+    条件付きGET（ETag/Last-Modified）で取得し、ウォーターマークより新しいエントリだけを返す。
+    記事には取得元のフィード（feed）を付け、ウォーターマークはここでは進めない。
+
+    Args:
+        name: ソース名（記事のsourceになる）
+        url: フィードのURL
+        max_items: 初回（ウォーターマークがないとき）に返す最大記事数
+        limiter: ホスト単位のレート制限
+    """
+
+    def __init__(self, name: str, url: str, max_items: int = FEED_MAX_ITEMS, limiter=None):
+        self.name = name
+        self.url = url
+        self.max_items = max_items
+        self.limiter = limiter
+
+    @traced('fetch_feed')
+    def fetch(self, timeout: float) -> list:
+        logger.info(f"フィード取得中: {self.name}")
+        response = None
+        try:
+            response = cached_get(self.url, timeout=timeout, limiter=self.limiter)
+            watermarks = get_watermarks()
+            watermark = watermarks.get(self.url)
+            since = watermark or datetime.now(timezone.utc) - timedelta(hours=FEED_MAX_AGE_HOURS)
+
+            articles = []
+            entries = 0
+            for entry in iter_feed_entries(response.text):
+                entries += 1
+                published = entry['published']
+                if not entry['title']:
+                    continue
+                # 日時のないエントリは初回だけ読む（毎回同じ記事を返さないため）
+                if (published and published <= since) or (not published and watermark):
+                    continue
+                if published:
+                    published = published.astimezone(timezone.utc)
+                articles.append({
+                    "title": entry['title'],
+                    "snippet": entry['snippet'],
+                    "source": self.name,
+                    "published": published.isoformat() if published else None,
+                    "url": entry['url'],
+                    "feed": self.url,
+                })
+            # 新しい順に並べる。件数を絞るのは初回だけ（前回以降の新着は読み残さない）
+            articles.sort(key=lambda a: a['published'] or '', reverse=True)
+            if not watermark:
+                articles = articles[:self.max_items]
+            if not entries:
+                # エントリのない応答（ブロック・エラーページなど）はキャッシュに残さない
+                invalidate(self.url)
+            logger.info(f"フィードの新着記事数: {len(articles)}（{self.name}）")
+            return articles
+        except Exception as e:
+            logger.error(f"フィード取得エラー（{self.name}）: {e}")
+            if response is not None:
+                # 取得できても解析できない応答はキャッシュに残さない
+                invalidate(self.url)
+            return []
+
+
+def advance_watermarks(articles: list) -> None:
+    """
+    使い終わった記事の公開日時まで、取得元のフィードのウォーターマークを進める
+
+    実行が成功して記事を使ったあとに呼ぶ。フィード以外の記事・公開日時のない記事は無視する。
+
+    Args:
+        articles: FeedSource.fetch が返した記事を含むリスト
+    """
+    newest = {}
+    for article in articles or []:
+        if not article.get('feed') or not article.get('published'):
+            continue
+        published = datetime.fromisoformat(article['published'])
+        if article['feed'] not in newest or published > newest[article['feed']]:
+            newest[article['feed']] = published
+    watermarks = get_watermarks()
+    for url, published in newest.items():
+        watermarks.update(url, published)
+
+
+def feed_sources(spec: str = NEWS_FEEDS, limiter=None) -> list:
+    """
+    「名前|URL」のカンマ区切り設定からフィードのアダプターを作る
+
+    Args:
+        spec: フィードの設定文字列
+        limiter: ホスト単位のレート制限
+
+    Returns:
+        list: FeedSourceのリスト
+    """
+    sources = []
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, url = item.partition('|')
+        if not url:
+            url = name
+        sources.append(FeedSource(name.strip(), url.strip(), limiter=limiter))
+    return sources
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+キャラクター（ペルソナ）の登録とツイートの並行生成
+1回のリサーチ結果を共有し、登録したキャラクターごとのツイートを並行して生成する
+（キャラクターを1つ増やしてもLLM呼び出しが1回増えるだけで、検索・分析はやり直さない）
+"""
+
+import contextvars
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from llm_client import chat_completion, complete
+from telemetry import span
+from tweet_history import TWEET_MAX_REGENERATE, TWEET_SIMILARITY_THRESHOLD, get_history
+from tweet_length import MAX_WEIGHTED_LENGTH, fit_tweet, is_within_limit, shorten_request, weighted_length
+from tweet_scoring import CANDIDATE_WEIGHTS, REQUIRED_HASHTAGS, rank_candidates
+
+logger = logging.getLogger(__name__)
+
+
+# 並行生成の設定（環境変数で上書き可能）
+# TWEET_PERSONAS: 各エントリーポイントの主キャラクターに加えて生成するキャラクター（カンマ区切り）
+TWEET_PERSONAS = os.getenv('TWEET_PERSONAS', '')
+# PERSONA_ACCOUNTS: キャラクターごとの投稿先アカウント（例: "kuma_en=english,soft=default"）。
+# 指定したキャラクターのツイートはそのアカウントの送信箱に入る
+PERSONA_ACCOUNTS = os.getenv('PERSONA_ACCOUNTS', '')
+# PERSONA_MODELS: キャラクターごとの生成モデル（例: "kuma=gpt-4o-mini"）。指定がなければ登録時のモデル
+PERSONA_MODELS = os.getenv('PERSONA_MODELS', '')
+PERSONA_MAX_WORKERS = int(os.getenv('PERSONA_MAX_WORKERS', '3'))
+
+# 1回のリクエストで生成するツイート候補数（ローカルで採点して最良のものを選ぶ）
+TWEET_CANDIDATES = int(os.getenv('TWEET_CANDIDATES', '3'))
+
+
+class Persona:
+    """
+    ツイートを書くキャラクター
+
+    Args:
+        name: 登録名
+        label: ログ用の表示名
+        system_prompt: システムプロンプト
+        user_prompt: ユーザープロンプト（{content} にリサーチ結果が入る）
+        fallback: 生成に失敗したときのツイート
+        hashtags: 必須のハッシュタグ（候補の採点に使う）
+        weights: 候補の採点の重み
+        model: 生成に使うモデル（PERSONA_MODELS で上書きできる）
+        temperature: 生成の温度
+        max_tokens: 生成の最大トークン数
+        candidates: 1回のリクエストで生成する候補数
+    """
+
+    def __init__(self, name: str, label: str, system_prompt: str, user_prompt: str, fallback: str,
+                 hashtags: tuple = REQUIRED_HASHTAGS, weights: dict = None, model: str = "gpt-4.1-mini",
+                 temperature: float = 0.9, max_tokens: int = 300, candidates: int = TWEET_CANDIDATES):
+        self.name = name
+        self.label = label
+        self.system_prompt = system_prompt
+        self.user_prompt = user_prompt
+        self.fallback = fallback
+        self.hashtags = hashtags
+        self.weights = weights or CANDIDATE_WEIGHTS
+        self.default_model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.candidates = candidates
+
+    @property
+    def account(self) -> str:
+        """投稿先のアカウント（PERSONA_ACCOUNTS で指定がなければNone）"""
+        return persona_accounts().get(self.name)
+
+    @property
+    def model(self) -> str:
+        """生成に使うモデル（PERSONA_MODELS で指定がなければ登録時のモデル）"""
+        return persona_models().get(self.name, self.default_model)
+
+    def messages(self, content_summary: str) -> list:
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": self.user_prompt.format(content=content_summary)},
+        ]
+
+    def __repr__(self) -> str:
+        return f"Persona({self.name!r})"
+
+
+KUMA_SENSEI_SYSTEM_PROMPT = """あなたは「くーたん博士」という、かわいいくまのAI専門家キャラクターです。
+
+キャラクター設定：
+- 種族: かわいいくま🐻
+- 語尾: 「〜クマ」「〜だクマ」「〜クマね」「〜クマよ」
+- 口調: 親しみやすく、かわいらしく、でも知識豊富
+- 絵文字: 🐻✨💡🌟🎨🔥🚀など（くま絵文字必須）
+- 特徴: 最新AI技術に詳しく、分かりやすく説明するのが得意なくま
+
+ツイートの要件：
+- Xの文字数換算で280以内（厳守。日本語・絵文字は1文字で2と数えるので、全角なら約130文字まで）
+- くま博士らしい口調（語尾に「クマ」を自然に入れる）
+- 具体的な企業名や製品名を含める
+- 驚きや興奮を表現
+- バズりやすい構成（冒頭で引きつける）
+- ハッシュタグ: #生成AI #AI を含める
+- 絵文字は適度に（特に🐻を使う）
+
+例：
+「みんな聞いてクマ！🐻✨ OpenAIの新機能がヤバいクマ〜！」
+「これは驚きクマね🐻💡 Googleが発表した〜」
+"""
+
+KUMA_SENSEI_USER_PROMPT = """
+以下の最新情報をもとに、くま博士（くーたん博士）としてバズりそうなツイートを作成してください：
+
+{content}
+
+要件：
+- Xの文字数換算で280以内（厳守。全角なら約130文字まで）
+- くま博士の口調で（語尾に「クマ」）
+- 🐻絵文字を必ず使う
+- 具体的な企業名や製品名を含める
+- 驚きや興奮を表現
+- 冒頭で読者を引きつける
+- ハッシュタグ #生成AI #AI を含める
+"""
+
+SOFT_SYSTEM_PROMPT = "あなたは『くーたん博士』という生成AI技術に詳しいキャラクターです。親しみやすく、かわいい口調で、専門的な内容を分かりやすく楽しく伝えるのが得意です。"
+
+SOFT_USER_PROMPT = """以下の生成AI最新トレンド情報をもとに、魅力的なツイートを作成してください。
+
+【最新トレンド情報】
+{content}
+
+【要件】
+- Xの文字数換算で280以内の日本語で作成（日本語・絵文字は1文字で2と数えるので、全角なら約130文字まで）
+- 「くーたん博士」というキャラクターとして投稿
+- 親しみやすく、かわいい口調を使用（「〜だよ」「〜なの」「〜だね」「わくわく」「すごい」「びっくり」など）
+- 最新トレンドのポイントを簡潔に紹介
+- くーたん博士としての所感や考察を必ず含める
+- 読者に語りかけるような親しみやすい表現
+- ハッシュタグを1〜2個含める（#生成AI #AI #ChatGPT #Claude など）
+- かわいい絵文字を2〜3個使用（🤖✨💡🎨🌟😊🚀など）
+- ポジティブで前向きなトーン
+- 専門的な内容も分かりやすく説明
+
+【くーたん博士の口調例】
+- 「〜だよ！」「〜なんだよね」「〜だと思うの」
+- 「すごいね！」「わくわくするね！」「びっくりだよ！」
+- 「みんなも〜してみてね」「一緒に〜しよう」
+
+ツイート本文のみを出力してください。説明や前置きは不要です。"""
+
+KUMA_EN_SYSTEM_PROMPT = """You are "Dr. Kuma", a cute bear character who is an expert on generative AI.
+
+Character:
+- A friendly bear 🐻 who explains the latest AI news simply and with excitement
+- Playful and warm, but accurate and specific
+- Emoji such as 🐻✨💡🚀 (always include 🐻)
+
+Tweet requirements:
+- At most 280 characters as counted by X (strict)
+- Name the specific company or product and include a concrete number or fact
+- Hook the reader in the first sentence
+- Include the hashtags #GenerativeAI #AI
+"""
+
+KUMA_EN_USER_PROMPT = """
+Write one tweet as Dr. Kuma about the most exciting item in the following research notes
+(the notes may be in Japanese; the tweet must be in natural English):
+
+{content}
+
+Output only the tweet text.
+"""
+
+# 登録済みのキャラクター
+PERSONAS = {
+    persona.name: persona for persona in (
+        Persona(
+            name='kuma',
+            label='くーたん博士（クマ）',
+            system_prompt=KUMA_SENSEI_SYSTEM_PROMPT,
+            user_prompt=KUMA_SENSEI_USER_PROMPT,
+            fallback="みんな聞いてクマ！🐻✨ 今日も生成AIの世界はすごい進化を見せているクマよ〜！OpenAIやGoogleの最新技術、本当にワクワクするクマね💡 一緒にAIの未来を楽しもうクマ🚀 #生成AI #AI",
+        ),
+        Persona(
+            name='soft',
+            label='くーたん博士（やさしい口調）',
+            system_prompt=SOFT_SYSTEM_PROMPT,
+            user_prompt=SOFT_USER_PROMPT,
+            fallback="生成AIの世界、今日もすごい進化してるよ🤖✨ 新しい技術がどんどん出てきてワクワクが止まらないの！みんなも一緒に楽しもうね💡 #生成AI #AI",
+            hashtags=('#生成AI',),
+            weights={'length': 0.35, 'hashtags': 0.2, 'novelty': 0.45},
+            model="gpt-4o-mini",
+            max_tokens=500,
+            candidates=1,
+        ),
+        Persona(
+            name='kuma_en',
+            label='Dr. Kuma (English)',
+            system_prompt=KUMA_EN_SYSTEM_PROMPT,
+            user_prompt=KUMA_EN_USER_PROMPT,
+            fallback="Generative AI keeps moving fast! 🐻✨ New models and tools from OpenAI, Google and more are landing every week. Let's explore the future of AI together! 🚀 #GenerativeAI #AI",
+            hashtags=('#GenerativeAI', '#AI'),
+            weights={'length': 0.3, 'hashtags': 0.3, 'bear': 0.1, 'novelty': 0.3},
+        ),
+    )
+}
+
+
+def _parse_mapping(value: str) -> dict:
+    """"name=value,..." 形式の設定を辞書にする"""
+    mapping = {}
+    for entry in value.split(','):
+        name, _, item = entry.partition('=')
+        if name.strip() and item.strip():
+            mapping[name.strip()] = item.strip()
+    return mapping
+
+
+def persona_accounts() -> dict:
+    """キャラクター名 → 投稿先アカウント（PERSONA_ACCOUNTS）"""
+    return _parse_mapping(PERSONA_ACCOUNTS)
+
+
+def persona_models() -> dict:
+    """キャラクター名 → 生成モデル（PERSONA_MODELS）"""
+    return _parse_mapping(PERSONA_MODELS)
+
+
+def get_persona(name: str) -> Persona:
+    """
+    登録済みのキャラクターを返す
+
+    Raises:
+        KeyError: 登録されていない
+    """
+    try:
+        return PERSONAS[name]
+    except KeyError:
+        raise KeyError(f"登録されていないキャラクターです: {name}（登録済み: {', '.join(PERSONAS)}）") from None
+
+
+def enabled_personas(primary: str) -> list:
+    """
+    生成するキャラクターのリスト（主キャラクター + TWEET_PERSONAS、重複なし）
+
+    登録されていない名前は警告して無視する。
+    """
+    personas = [get_persona(primary)]
+    for name in TWEET_PERSONAS.split(','):
+        name = name.strip()
+        if not name or name in (persona.name for persona in personas):
+            continue
+        if name not in PERSONAS:
+            logger.warning(f"登録されていないキャラクターを無視します: {name}")
+            continue
+        personas.append(PERSONAS[name])
+    return personas
+
+
+# 生成したツイートを履歴に記録するか（ドライランでは record_history(False) の中で生成する）
+_record_history = contextvars.ContextVar('record_tweet_history', default=True)
+
+
+@contextmanager
+def record_history(enabled: bool = True):
+    """
+    この中で生成したツイートを履歴に記録するかを切り替える
+
+    パイプラインの段階やキャラクターの並行生成はコンテキストを引き継ぐので、別スレッドの生成にも効く。
+    """
+    token = _record_history.set(enabled)
+    try:
+        yield
+    finally:
+        _record_history.reset(token)
+
+
+def generate_validated_tweet(messages: list, persona: Persona, extract=str.strip, source: str = '',
+                             **params) -> str:
+    """
+    候補の生成・採点・文字数調整・重複チェックを行い、検証済みのツイートを返す
+
+    2段階方式・融合方式・各キャラクターで同じ検証を通すための共通処理。
+
+    Args:
+        messages: ツイートを生成するチャットメッセージ
+        persona: 生成するキャラクター（モデル・候補数・採点の重み）
+        extract: LLMの出力からツイート本文を取り出す関数
+        source: ツイート履歴に記録する生成元
+        **params: 候補生成のAPIパラメータ（response_format など）
+
+    Returns:
+        str: Xの重み付き文字数で280以内のツイート
+
+    Raises:
+        ValueError: 再生成しても使える候補がなかった
+    """
+    history = get_history()
+
+    for attempt in range(TWEET_MAX_REGENERATE + 1):
+        result = chat_completion(
+            model=persona.model,
+            messages=messages,
+            temperature=persona.temperature,
+            max_tokens=persona.max_tokens,
+            n=persona.candidates,
+            **params
+        )
+        candidates = [extract(content) for content in result["contents"]]
+        candidates = [candidate for candidate in candidates if candidate]
+        if not candidates:
+            if attempt == TWEET_MAX_REGENERATE:
+                raise ValueError(f"使える候補がありませんでした（{persona.label}）")
+            logger.warning(f"使える候補がありませんでした（{persona.label}）。再生成します...")
+            continue
+
+        # 候補をローカルで採点し、最良のものを選ぶ
+        best = rank_candidates(candidates, history, persona.weights, persona.hashtags)[0]
+        tweet = best['text']
+
+        # 文字数制限チェック（Xの重み付き文字数）
+        if not is_within_limit(tweet):
+            logger.warning(f"ツイートが長すぎます（X換算{weighted_length(tweet)}）。残り文字数を伝えて書き直します...")
+            try:
+                shortened = extract(complete(
+                    model=persona.model,
+                    messages=messages + [
+                        {"role": "assistant", "content": tweet},
+                        {"role": "user", "content": shorten_request(tweet)}
+                    ],
+                    temperature=0.7,
+                    max_tokens=persona.max_tokens
+                ))
+            except Exception as e:
+                logger.warning(f"書き直しに失敗しました（{persona.label}）: {e}。最良の候補を切り詰めて使います")
+                shortened = None
+            if not shortened:
+                # 書き直せなかった・空が返ったときは、採点で選んだ候補をそのまま切り詰める
+                shortened = best['text']
+            # それでも収まらなければ文の区切りで切る（ハッシュタグは残す）
+            tweet = fit_tweet(shortened)
+
+        # 過去ツイートとの重複チェック（書き直した・切ったときは最終的な本文で調べ直す）
+        if tweet == best['text']:
+            score, past_tweet = best['similarity'], best['past_tweet']
+        else:
+            score, past_tweet = history.most_similar(tweet)
+        if score < TWEET_SIMILARITY_THRESHOLD:
+            break
+        if attempt == TWEET_MAX_REGENERATE:
+            logger.warning(f"過去のツイートと類似しています（類似度{score:.2f}）が、再生成の上限に達しました")
+            break
+        logger.warning(f"過去のツイートと類似しています（類似度{score:.2f}）。再生成します...")
+        messages = messages + [
+            {"role": "assistant", "content": tweet},
+            {
+                "role": "user",
+                "content": f"このツイートは過去の投稿「{past_tweet}」と似すぎています。別の話題や切り口で、同じ要件のツイートを作り直してください。"
+            }
+        ]
+
+    # ドライランのツイートは投稿されないので、以降の新規性の判定に使わない
+    if _record_history.get():
+        history.add(tweet, source=source)
+
+    logger.info(f"ツイート生成完了（{persona.label}）: X換算{weighted_length(tweet)}/{MAX_WEIGHTED_LENGTH}")
+    logger.debug(f"生成内容: {tweet}")
+    return tweet
+
+
+def _strip_quotes(content: str) -> str:
+    return content.strip().strip('"').strip("'").strip()
+
+
+def generate_persona_tweet(persona: Persona, content_summary: str, source: str = '') -> str:
+    """
+    リサーチ結果からキャラクターのツイートを生成する（失敗したらキャラクターのフォールバック）
+
+    Args:
+        persona: 生成するキャラクター
+        content_summary: 選別された情報のサマリー
+        source: ツイート履歴に記録する生成元
+
+    Returns:
+        str: 生成されたツイート
+    """
+    logger.info(f"{persona.label}のツイートを生成中...")
+    try:
+        with span('generate_persona_tweet', persona=persona.name):
+            return generate_validated_tweet(
+                persona.messages(content_summary), persona, extract=_strip_quotes, source=source
+            )
+    except Exception as e:
+        logger.error(f"ツイート生成エラー（{persona.label}）: {e}")
+        return persona.fallback
+
+
+def fan_out(personas: list, generate, max_workers: int = PERSONA_MAX_WORKERS) -> dict:
+    """
+    キャラクターごとのツイートを並行して生成する
+
+    各スレッドは呼び出し元のコンテキスト（実行全体の締め切りなど）を引き継ぐ。
+
+    Args:
+        personas: 生成するキャラクターのリスト
+        generate: キャラクターを受け取ってツイートを返す関数（例外を投げない）
+        max_workers: 同時に生成するキャラクター数
+
+    Returns:
+        dict: キャラクター名 → ツイート（personasの順）
+    """
+    if len(personas) == 1:
+        return {personas[0].name: generate(personas[0])}
+    with span('persona_fan_out', personas=len(personas)):
+        with ThreadPoolExecutor(max_workers=max(1, min(len(personas), max_workers))) as executor:
+            futures = {
+                persona.name: executor.submit(contextvars.copy_context().run, generate, persona)
+                for persona in personas
+            }
+            return {name: future.result() for name, future in futures.items()}
+
+
+def enqueue_persona_tweets(tweets: dict, personas: list, source: str) -> list:
+    """
+    投稿先アカウントが指定されたキャラクターのツイートを送信箱に入れる
+
+    Args:
+        tweets: キャラクター名 → ツイート
+        personas: キャラクターのリスト
+        source: 送信箱に記録する追加元
+
+    Returns:
+        list: 送信箱に入れたアカウント名のリスト
+    """
+    targets = [persona for persona in personas if persona.account and tweets.get(persona.name)]
+    if not targets:
+        return []
+    from post_outbox import get_outbox
+    outbox = get_outbox()
+    accounts = []
+    for persona in targets:
+        post_id, previous = outbox.enqueue(tweets[persona.name], account=persona.account,
+                                           source=f"{source}:{persona.name}")
+        if previous == 'posted':
+            logger.warning(f"{persona.label}のツイートは同じ内容がすでに投稿済みです: アカウント={persona.account}、ID={post_id}")
+            continue
+        logger.info(f"{persona.label}のツイートを送信箱に入れました: アカウント={persona.account}、ID={post_id}")
+        accounts.append(persona.account)
+    return accounts
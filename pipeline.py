@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+段階（ステージ）グラフの実行
+各段階が入力と出力を宣言し、依存関係のない段階は並行して実行する。
+成功した段階の出力はチェックポイントに保存し、失敗した実行はネットワーク処理をやり直さずに続きから再開できる
+"""
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from telemetry import increment, span
+
+logger = logging.getLogger(__name__)
+
+
+# 実行の設定（環境変数で上書き可能）
+PIPELINE_STATE_DIR = os.getenv('PIPELINE_STATE_DIR', os.path.join('.cache', 'pipeline'))
+# 失敗した実行のチェックポイントから再開する猶予（分）。0なら再開しない
+PIPELINE_RESUME_MINUTES = float(os.getenv('PIPELINE_RESUME_MINUTES', '30'))
+PIPELINE_MAX_WORKERS = int(os.getenv('PIPELINE_MAX_WORKERS', '4'))
+
+
+class StageError(RuntimeError):
+    """段階の実行に失敗した"""
+
+    def __init__(self, stage: str, cause: BaseException):
+        super().__init__(f"段階 {stage} が失敗しました: {cause}")
+        self.stage = stage
+        self.cause = cause
+
+
+class Stage:
+    """
+    パイプラインの1段階
+
+    関数は inputs の名前をキーワード引数として受け取る。outputs が1つなら戻り値がそのまま、
+    複数なら戻り値の辞書から各出力を取り出す。
+
+    Args:
+        name: 段階名
+        func: 処理する関数
+        inputs: 入力の名前（ほかの段階の出力、または実行時に渡す初期値）
+        outputs: 出力の名前（省略時は段階名）
+        memoize: 成功した出力をチェックポイントに保存するか（認証情報など保存してはいけないものはFalse）
+    """
+
+    def __init__(self, name: str, func, inputs: tuple = (), outputs: tuple = None, memoize: bool = True):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs) if outputs else (name,)
+        self.memoize = memoize
+
+    def run(self, values: dict) -> dict:
+        with span(f"stage.{self.name}"):
+            result = self.func(**{key: values[key] for key in self.inputs})
+        if len(self.outputs) == 1:
+            return {self.outputs[0]: result}
+        missing = [key for key in self.outputs if key not in (result or {})]
+        if missing:
+            raise ValueError(f"段階 {self.name} の出力が足りません: {', '.join(missing)}")
+        return {key: result[key] for key in self.outputs}
+
+    def __repr__(self) -> str:
+        return f"Stage({self.name!r}, inputs={self.inputs}, outputs={self.outputs})"
+
+
+class Checkpoint:
+    """
+    成功した段階の出力を保存するJSONファイル
+
+    Args:
+        path: ファイルのパス
+        max_age_minutes: これより古いチェックポイントからは再開しない
+    """
+
+    def __init__(self, path: str, max_age_minutes: float = PIPELINE_RESUME_MINUTES):
+        self.path = path
+        self.max_age_minutes = max_age_minutes
+        self._lock = threading.Lock()
+        self._state = {'created_at': time.time(), 'stages': {}}
+
+    def load(self) -> dict:
+        """
+        再開に使える段階の出力を読み込む
+
+        Returns:
+            dict: 段階名 → 出力。使えるものがなければ空
+        """
+        if self.max_age_minutes <= 0:
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if time.time() - state.get('created_at', 0) > self.max_age_minutes * 60:
+            logger.info("前回の実行のチェックポイントが古いため、最初から実行します")
+            self.clear()
+            return {}
+        with self._lock:
+            self._state = state
+        return dict(state.get('stages') or {})
+
+    def save(self, stage: str, outputs: dict) -> None:
+        with self._lock:
+            self._state['stages'][stage] = outputs
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._state, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._state = {'created_at': time.time(), 'stages': {}}
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class Pipeline:
+    """
+    段階グラフの実行器
+
+    入力がそろった段階から順に（独立した段階は並行して）実行する。
+    段階が失敗すると新しい段階は始めず、実行中の段階の終了を待ってから StageError を送出する。
+    成功した段階の出力はチェックポイントに残るので、次の実行はその続きから始まる。
+    全段階が成功したらチェックポイントを消す。
+
+    Args:
+        name: パイプライン名（チェックポイントのファイル名になる）
+        stages: 段階のリスト
+        checkpoint: チェックポイント（Noneなら PIPELINE_STATE_DIR/<name>.json）
+        max_workers: 同時に実行する段階数
+    """
+
+    def __init__(self, name: str, stages: list, checkpoint: Checkpoint = None,
+                 max_workers: int = PIPELINE_MAX_WORKERS):
+        self.name = name
+        self.stages = list(stages)
+        self.checkpoint = checkpoint or Checkpoint(os.path.join(PIPELINE_STATE_DIR, f"{name}.json"))
+        self.max_workers = max_workers
+        self._validate()
+
+    def _validate(self) -> None:
+        names = [stage.name for stage in self.stages]
+        if len(set(names)) != len(names):
+            raise ValueError(f"段階名が重複しています: {names}")
+        produced = {}
+        for stage in self.stages:
+            for key in stage.outputs:
+                if key in produced:
+                    raise ValueError(f"出力 {key} が {produced[key]} と {stage.name} の両方にあります")
+                produced[key] = stage.name
+
+    def run(self, resume: bool = True, **initial) -> dict:
+        """
+        パイプラインを実行する
+
+        Args:
+            resume: 前回失敗した実行のチェックポイントから再開するか
+            **initial: 初期値（どの段階の出力でもない入力）
+
+        Returns:
+            dict: 初期値とすべての段階の出力
+
+        Raises:
+            StageError: 段階が失敗した
+            ValueError: 入力がそろわない段階がある
+        """
+        values = dict(initial)
+        pending = list(self.stages)
+
+        if resume:
+            saved = self.checkpoint.load()
+            for stage in list(pending):
+                if stage.memoize and stage.name in saved:
+                    values.update(saved[stage.name])
+                    pending.remove(stage)
+                    increment('pipeline.resumed_stages')
+                    logger.info(f"[{self.name}] 前回の実行の結果を使います: {stage.name}")
+        else:
+            self.checkpoint.clear()
+
+        error = None
+        running = {}
+        workers = max(1, min(self.max_workers, len(pending) or 1))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"stage-{self.name}") as executor:
+            while pending or running:
+                if error is None:
+                    for stage in [s for s in pending if all(key in values for key in s.inputs)]:
+                        pending.remove(stage)
+                        # 呼び出し元のコンテキスト（実行全体の締め切りなど）を引き継ぐ
+                        future = executor.submit(contextvars.copy_context().run, stage.run, dict(values))
+                        running[future] = stage
+                if not running:
+                    if error is None and pending:
+                        waiting = {s.name: [k for k in s.inputs if k not in values] for s in pending}
+                        raise ValueError(f"入力がそろわない段階があります: {waiting}")
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        outputs = future.result()
+                    except Exception as e:
+                        logger.error(f"[{self.name}] 段階 {stage.name} が失敗しました: {e}")
+                        increment('pipeline.failed_stages')
+                        error = error or StageError(stage.name, e)
+                        continue
+                    values.update(outputs)
+                    if stage.memoize:
+                        try:
+                            self.checkpoint.save(stage.name, outputs)
+                        except (OSError, TypeError, ValueError) as e:
+                            logger.warning(f"[{self.name}] チェックポイントの保存に失敗しました（{stage.name}）: {e}")
+
+        if error is not None:
+            raise error
+        self.checkpoint.clear()
+        return values
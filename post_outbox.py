@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+投稿待ちツイートの送信箱（アウトボックス）
+生成したツイートをSQLiteに保存してから投稿し、失敗しても捨てずに次回の実行で再送する。
+投稿ワーカーはX APIのレート制限ヘッダーに従って待ち、アカウントごとに並行して送信箱を空にする
+"""
+
+import contextvars
+import hashlib
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from telemetry import increment, span
+from x_api import DEFAULT_ACCOUNT, XApiError, account_names, get_x_client
+
+logger = logging.getLogger(__name__)
+
+
+# 送信箱の設定（環境変数で上書き可能）
+POST_OUTBOX_DB = os.getenv('POST_OUTBOX_DB', os.path.join('.cache', 'post_outbox.sqlite3'))
+# 通信エラー・5xxで諦めるまでの試行回数（429は数えない）
+POST_MAX_ATTEMPTS = int(os.getenv('POST_MAX_ATTEMPTS', '8'))
+POST_BACKOFF_BASE = float(os.getenv('POST_BACKOFF_BASE', '2'))
+POST_BACKOFF_MAX = float(os.getenv('POST_BACKOFF_MAX', '300'))
+# 1回の実行の中でレート制限の解除を待つ上限。これより長ければ次回の実行に回す
+POST_MAX_WAIT_SECONDS = float(os.getenv('POST_MAX_WAIT_SECONDS', '60'))
+# 投稿中のまま止まった（プロセスが落ちた）ツイートを再び取り出せるようになるまでの秒数
+POST_LEASE_SECONDS = float(os.getenv('POST_LEASE_SECONDS', '120'))
+POST_MAX_WORKERS = int(os.getenv('POST_MAX_WORKERS', '4'))
+# 投稿済み・失敗したツイートを残しておく日数
+POST_KEEP_DAYS = float(os.getenv('POST_KEEP_DAYS', '30'))
+
+# 429でリセット時刻が分からないときに待つ秒数
+_DEFAULT_RATE_LIMIT_WAIT = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account TEXT NOT NULL,
+    text TEXT NOT NULL,
+    dedupe_key TEXT NOT NULL UNIQUE,
+    source TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    tweet_id TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS account_limits (
+    account TEXT PRIMARY KEY,
+    blocked_until REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_posts_due ON posts(account, status, next_attempt_at);
+"""
+
+
+def dedupe_key(account: str, text: str) -> str:
+    """同じアカウントへの同じ本文を1件にまとめるためのキー"""
+    return hashlib.sha256(f"{account}\n{text.strip()}".encode('utf-8')).hexdigest()
+
+
+class PostOutbox:
+    """
+    投稿待ちツイートの送信箱
+
+    状態は pending（待ち）→ posting（投稿中）→ posted（投稿済み）/ failed（諦めた）と進む。
+    同じアカウントへの同じ本文は1件しか入らないので、再実行しても二重に投稿しない。
+    諦めた（failed）本文をもう一度入れたときは、投稿待ちに戻して試し直す。
+
+    Args:
+        path: SQLiteファイルのパス
+    """
+
+    def __init__(self, path: str = POST_OUTBOX_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def enqueue(self, text: str, account: str = DEFAULT_ACCOUNT, source: str = '') -> tuple:
+        """
+        ツイートを送信箱に入れる
+
+        同じ本文がすでにあれば新しく入れずにそのIDを返す。それが failed なら投稿待ちに戻す
+        （試行回数も数え直す）。
+
+        Args:
+            text: ツイート本文
+            account: 投稿先のアカウント名
+            source: 追加元（スクリプト名など）
+
+        Returns:
+            tuple: (送信箱のID, すでにあった行の入れる前の状態)。新しく入れたなら状態はNone
+        """
+        now = time.time()
+        key = dedupe_key(account, text)
+        with self._lock, self._conn:
+            row = self._conn.execute('SELECT id, status FROM posts WHERE dedupe_key = ?', (key,)).fetchone()
+            if row is None:
+                cursor = self._conn.execute(
+                    """
+                    INSERT INTO posts
+                        (account, text, dedupe_key, source, next_attempt_at, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (account, text, key, source, now, now, now)
+                )
+                return cursor.lastrowid, None
+            if row['status'] == 'failed':
+                self._conn.execute(
+                    """
+                    UPDATE posts SET status = 'pending', attempts = 0, next_attempt_at = ?, updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (now, now, row['id'])
+                )
+        return row['id'], row['status']
+
+    def get(self, post_id: int) -> dict:
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM posts WHERE id = ?', (post_id,)).fetchone()
+        return dict(row) if row else None
+
+    def claim(self, account: str, now: float = None) -> dict:
+        """
+        アカウントの投稿待ちツイートを古い順に1件取り出し、投稿中にする
+
+        投稿中のまま POST_LEASE_SECONDS を過ぎたもの（前回の実行が途中で止まった）も対象にする。
+
+        Returns:
+            dict: 送信箱の行。なければNone
+        """
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                """
+                SELECT * FROM posts
+                WHERE account = ?
+                  AND ((status = 'pending' AND next_attempt_at <= ?)
+                       OR (status = 'posting' AND updated_at <= ?))
+                ORDER BY created_at, id
+                LIMIT 1
+                """,
+                (account, now, now - POST_LEASE_SECONDS)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE posts SET status = 'posting', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (now, row['id'])
+            )
+        return dict(row, status='posting', attempts=row['attempts'] + 1)
+
+    def mark_posted(self, post_id: int, tweet_id: str = None) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE posts SET status = 'posted', tweet_id = ?, last_error = NULL, updated_at = ? WHERE id = ?",
+                (tweet_id, time.time(), post_id)
+            )
+
+    def mark_retry(self, post_id: int, error: str, not_before: float, count_attempt: bool = True) -> None:
+        """
+        投稿待ちに戻して、not_before 以降に再送する
+
+        Args:
+            count_attempt: 試行回数に数えるか（レート制限による待ちは数えない）
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                UPDATE posts SET status = 'pending', last_error = ?, next_attempt_at = ?, updated_at = ?,
+                    attempts = attempts - ?
+                WHERE id = ?
+                """,
+                (error, not_before, time.time(), 0 if count_attempt else 1, post_id)
+            )
+
+    def mark_failed(self, post_id: int, error: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE posts SET status = 'failed', last_error = ?, updated_at = ? WHERE id = ?",
+                (error, time.time(), post_id)
+            )
+
+    def blocked_until(self, account: str) -> float:
+        """アカウントのレート制限が解除される時刻（UNIX秒、制限がなければ0）"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT blocked_until FROM account_limits WHERE account = ?', (account,)
+            ).fetchone()
+        return row[0] if row else 0.0
+
+    def block_account(self, account: str, until: float) -> None:
+        """アカウントへの投稿を until まで止める（実行をまたいで保持する）"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO account_limits (account, blocked_until) VALUES (?, ?)
+                ON CONFLICT(account) DO UPDATE SET blocked_until = MAX(blocked_until, excluded.blocked_until)
+                """,
+                (account, until)
+            )
+
+    def next_due(self, account: str) -> float:
+        """アカウントの再送待ちで最も早い再送時刻（なければNone）"""
+        with self._lock:
+            (due,) = self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM posts WHERE account = ? AND status = 'pending'", (account,)
+            ).fetchone()
+        return due
+
+    def accounts_with_pending(self) -> list:
+        """投稿待ち・投稿中のツイートがあるアカウント名のリスト"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT account FROM posts WHERE status IN ('pending', 'posting') ORDER BY account"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def counts(self, account: str = None) -> dict:
+        """状態ごとの件数"""
+        query = 'SELECT status, COUNT(*) FROM posts'
+        params = ()
+        if account is not None:
+            query += ' WHERE account = ?'
+            params = (account,)
+        with self._lock:
+            rows = self._conn.execute(query + ' GROUP BY status', params).fetchall()
+        return {status: count for status, count in rows}
+
+    def prune(self, keep_days: float = POST_KEEP_DAYS) -> int:
+        """
+        投稿済み・失敗から一定期間たったツイートを削除する
+
+        Returns:
+            int: 削除した件数
+        """
+        cutoff = time.time() - keep_days * 86400
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM posts WHERE status IN ('posted', 'failed') AND updated_at < ?", (cutoff,)
+            )
+        if cursor.rowcount:
+            logger.info(f"送信箱から{cursor.rowcount}件削除しました")
+        return cursor.rowcount
+
+
+def _backoff_delay(attempt: int) -> float:
+    """指数バックオフ（フルジッター）の待ち時間"""
+    return random.uniform(0, min(POST_BACKOFF_MAX, POST_BACKOFF_BASE * (2 ** attempt)))
+
+
+class PostWorker:
+    """
+    1アカウント分の送信箱を空にする投稿ワーカー
+
+    X APIのレート制限は利用者（アカウント）単位なので、1アカウントの投稿は順番に行う。
+    残り回数が0になったらリセット時刻まで待ち、待ち時間が max_wait を超えるなら次回の実行に回す。
+
+    Args:
+        outbox: 送信箱
+        account: アカウント名
+        client: X APIクライアント（Noneならアカウントの共有クライアント）
+        max_wait: 1回の実行の中でレート制限の解除を待つ上限（秒）
+        on_posted: 投稿できたときに本文を受け取るコールバック
+    """
+
+    def __init__(self, outbox: PostOutbox, account: str = DEFAULT_ACCOUNT, client=None,
+                 max_wait: float = POST_MAX_WAIT_SECONDS, on_posted=None):
+        self.outbox = outbox
+        self.account = account
+        self.client = client
+        self.max_wait = max_wait
+        self.on_posted = on_posted
+
+    def _wait_for_limit(self) -> bool:
+        """レート制限の解除を待つ。待ちきれない（次回に回す）ならFalse"""
+        wait = self.outbox.blocked_until(self.account) - time.time()
+        if wait <= 0:
+            return True
+        if wait > self.max_wait:
+            logger.info(f"[{self.account}] レート制限の解除まで{wait:.0f}秒あるため、残りは次回の実行で投稿します")
+            return False
+        logger.info(f"[{self.account}] レート制限の解除まで{wait:.1f}秒待ちます")
+        increment('outbox.rate_limit_waits')
+        time.sleep(wait)
+        return True
+
+    def _posted(self, post: dict, tweet_id: str) -> None:
+        self.outbox.mark_posted(post['id'], tweet_id)
+        increment('outbox.posted')
+        logger.info(f"[{self.account}] ツイート投稿成功: ID={tweet_id}")
+        if self.on_posted is not None:
+            try:
+                self.on_posted(post['text'])
+            except Exception as e:
+                logger.warning(f"投稿後の処理に失敗しました: {e}")
+
+    def _handle_error(self, post: dict, error: XApiError) -> str:
+        """エラーに応じて送信箱を更新し、結果（'posted' / 'retried' / 'failed'）を返す"""
+        now = time.time()
+        rate_limit = error.rate_limit
+        if error.duplicate:
+            # 前回の試行が実は成功していた（応答だけ失われた）ので、投稿済みとして扱う
+            increment('outbox.duplicates')
+            logger.info(f"[{self.account}] 同じ内容がすでに投稿済みのため、投稿済みとして扱います: id={post['id']}")
+            self._posted(post, None)
+            outcome = 'posted'
+        elif error.rate_limited:
+            until = rate_limit.reset_at or now + (error.retry_after or _DEFAULT_RATE_LIMIT_WAIT)
+            self.outbox.block_account(self.account, until)
+            self.outbox.mark_retry(post['id'], str(error), until, count_attempt=False)
+            increment('outbox.rate_limited')
+            logger.warning(f"[{self.account}] レート制限に達しました（解除まで{max(until - now, 0):.0f}秒）")
+            outcome = 'retried'
+        elif error.retryable and post['attempts'] < POST_MAX_ATTEMPTS:
+            delay = error.retry_after or _backoff_delay(post['attempts'] - 1)
+            self.outbox.mark_retry(post['id'], str(error), now + delay)
+            increment('outbox.retries')
+            logger.warning(f"[{self.account}] 投稿エラー（{post['attempts']}回目）: {error}。{delay:.1f}秒後に再送します")
+            outcome = 'retried'
+        else:
+            self.outbox.mark_failed(post['id'], str(error))
+            increment('outbox.failed')
+            logger.error(f"[{self.account}] ツイート投稿失敗（再送しません）: {error}")
+            outcome = 'failed'
+        if rate_limit.wait_seconds(now) > 0:
+            self.outbox.block_account(self.account, rate_limit.reset_at)
+        return outcome
+
+    def drain(self) -> dict:
+        """
+        送信箱のこのアカウントの投稿待ちを、待ちきれなくなるまで投稿する
+
+        Returns:
+            dict: {"posted", "failed", "retried"} の件数
+        """
+        client = self.client or get_x_client(self.account)
+        result = {'posted': 0, 'failed': 0, 'retried': 0}
+        while self._wait_for_limit():
+            post = self.outbox.claim(self.account)
+            if post is None:
+                # 再送待ちで、期限が近いものがあれば待つ
+                due = self.outbox.next_due(self.account)
+                if due is None or due - time.time() > self.max_wait:
+                    break
+                time.sleep(max(due - time.time(), 0))
+                continue
+            try:
+                with span('post_tweet', account=self.account):
+                    tweet_id, rate_limit = client.create_tweet(post['text'])
+            except XApiError as e:
+                result[self._handle_error(post, e)] += 1
+                continue
+            self._posted(post, tweet_id)
+            result['posted'] += 1
+            if rate_limit.wait_seconds() > 0:
+                self.outbox.block_account(self.account, rate_limit.reset_at)
+        return result
+
+
+def drain_outbox(outbox: PostOutbox = None, accounts: list = None, clients: dict = None,
+                 max_wait: float = POST_MAX_WAIT_SECONDS, on_posted=None,
+                 max_workers: int = POST_MAX_WORKERS) -> dict:
+    """
+    送信箱を空にする（アカウントごとに並行して投稿する）
+
+    Args:
+        outbox: 送信箱（Noneなら共有の送信箱）
+        accounts: 対象のアカウント名（Noneなら投稿待ちのある全アカウント）
+        clients: アカウント名 → X APIクライアント（省略したアカウントは共有クライアント）
+        max_wait: 1回の実行の中でレート制限の解除を待つ上限（秒）
+        on_posted: 投稿できたときに本文を受け取るコールバック
+        max_workers: 同時に投稿するアカウント数
+
+    Returns:
+        dict: アカウント名 → {"posted", "failed", "retried"}
+    """
+    outbox = outbox or get_outbox()
+    accounts = accounts if accounts is not None else outbox.accounts_with_pending()
+    clients = clients or {}
+    if not accounts:
+        return {}
+
+    def run(account):
+        try:
+            worker = PostWorker(outbox, account, clients.get(account), max_wait=max_wait, on_posted=on_posted)
+            return worker.drain()
+        except ValueError as e:
+            logger.error(f"[{account}] 投稿できません: {e}")
+            return {'posted': 0, 'failed': 0, 'retried': 0}
+
+    with span('drain_outbox'):
+        with ThreadPoolExecutor(max_workers=max(1, min(len(accounts), max_workers))) as executor:
+            # 投稿のスパン・カウンターは呼び出し元の実行のメトリクスに記録する
+            futures = [executor.submit(contextvars.copy_context().run, run, account) for account in accounts]
+            results = dict(zip(accounts, (future.result() for future in futures)))
+    for account, result in results.items():
+        logger.info(f"[{account}] 送信箱: 投稿{result['posted']}件、再送待ち{result['retried']}件、失敗{result['failed']}件")
+    return results
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> PostOutbox:
+    """
+    プロセス内で共有する送信箱を返す（初回に古いツイートを削除する）
+
+    Returns:
+        PostOutbox: 送信箱
+    """
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = PostOutbox()
+            _outbox.prune()
+        return _outbox
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from log_setup import setup_logging
+    setup_logging("post_outbox.log")
+    parser = argparse.ArgumentParser(description="投稿待ちツイートの送信箱")
+    parser.add_argument('--drain', action='store_true', help="投稿待ちのツイートを投稿する")
+    parser.add_argument('--account', action='append', help="対象のアカウント（複数指定可、省略時は X_ACCOUNTS）")
+    args = parser.parse_args()
+    if args.drain:
+        drain_outbox(accounts=args.account or account_names())
+    print(json.dumps({account: get_outbox().counts(account) for account in (args.account or account_names())},
+                     ensure_ascii=False))
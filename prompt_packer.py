@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+記事コンテキストのプロンプト詰め込み
+トークン数をローカルで見積もり、価値の高い記事から予算内に収まるように整形する
+"""
+
+import logging
+import math
+import os
+import re
+
+from telemetry import increment
+
+try:
+    import tiktoken
+except ImportError:  # 任意依存。なければ文字種からの概算を使う
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+
+# 詰め込みの設定（環境変数で上書き可能）
+PROMPT_ARTICLE_BUDGET_TOKENS = int(os.getenv('PROMPT_ARTICLE_BUDGET_TOKENS', '1500'))
+PROMPT_SNIPPET_MAX_TOKENS = int(os.getenv('PROMPT_SNIPPET_MAX_TOKENS', '120'))
+PROMPT_MAX_ARTICLES = 15
+# 予算が足りないとき、本文をこれより短くするくらいなら記事ごと省く
+MIN_SNIPPET_TOKENS = 20
+
+_CJK = re.compile(r'[぀-ヿ㐀-鿿豈-﫿＀-￯]')
+_WORD = re.compile(r'[A-Za-z0-9]+')
+_SPACE = re.compile(r'\s+')
+# Google検索結果の本文の先頭に付く「3 時間前 — 」などの日付
+_RELATIVE_DATE = re.compile(r'^\s*(\d+\s*(秒|分|時間|日|週間|か月|ヶ月|年)前|\d{4}[/年]\d{1,2}[/月]\d{1,2}日?)\s*[—–-]\s*')
+_SENTENCE = re.compile(r'[^。！？!?]+[。！？!?]*')
+_TRAILING_ELLIPSIS = re.compile(r'\s*(\.\.\.|…)+\s*$')
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding('o200k_base')
+        except Exception as e:  # エンコーディングの取得（初回ダウンロード）に失敗したら概算にする
+            logger.warning(f"tiktokenを使えないため概算でトークン数を見積もります: {e}")
+            _encoding = False
+    return _encoding or None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのトークン数を見積もる
+
+    tiktokenがあれば正確に数え、なければ文字種から多めに概算する
+    （かな・漢字・全角は1文字1トークン、英数字は4文字で1トークン、記号は1文字1トークン）。
+
+    Args:
+        text: 対象のテキスト
+
+    Returns:
+        int: 見積もりトークン数
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    cjk = len(_CJK.findall(text))
+    words = _WORD.findall(text)
+    word_tokens = sum(math.ceil(len(word) / 4) for word in words)
+    others = len(_SPACE.sub('', text)) - cjk - sum(len(word) for word in words)
+    return cjk + word_tokens + max(others, 0)
+
+
+def clean_snippet(title: str, snippet: str) -> str:
+    """
+    本文から冗長な部分を取り除く
+
+    空白の連続、先頭の日付、タイトルの繰り返し、同じ文の重複、末尾の「...」を除く。
+    """
+    text = _SPACE.sub(' ', snippet or '').strip()
+    text = _RELATIVE_DATE.sub('', text)
+    title = _SPACE.sub(' ', title or '').strip()
+    if title and text.startswith(title):
+        text = text[len(title):].lstrip(' 　-—–:：')
+    text = _TRAILING_ELLIPSIS.sub('', text)
+
+    sentences = []
+    seen = set()
+    for sentence in _SENTENCE.findall(text):
+        key = sentence.strip()
+        if key and key not in seen:
+            seen.add(key)
+            sentences.append(sentence.strip())
+    return ''.join(sentences) if sentences else text
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    見積もりトークン数がmax_tokens以内になるように本文を切り詰める
+
+    予算の半分以上が残る位置に文の区切りがあればそこで切り、なければ「…」を付けて切る。
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # 先頭から伸ばしていき、収まる最長の長さを二分探索で探す
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) + 1 <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    cut = text[:low]
+    sentence_end = max(cut.rfind(mark) for mark in '。！？!?')
+    if sentence_end + 1 >= low // 2 and sentence_end > 0:
+        return cut[:sentence_end + 1]
+    return cut.rstrip() + '…'
+
+
+def _article_value(indexed: tuple) -> tuple:
+    """並べ替えのキー（事前スコア → 複数ソースでの報道数 → 元の順序）"""
+    index, article = indexed
+    return (-(article.get('score') or 0.0), -(article.get('duplicates') or 0), index)
+
+
+def _format_article(number: int, title: str, snippet: str) -> str:
+    return f"【記事{number}】\nタイトル: {title}\n内容: {snippet}"
+
+
+def pack_articles(articles: list, budget_tokens: int = PROMPT_ARTICLE_BUDGET_TOKENS,
+                  snippet_tokens: int = PROMPT_SNIPPET_MAX_TOKENS,
+                  max_articles: int = PROMPT_MAX_ARTICLES) -> dict:
+    """
+    記事をトークン予算内のプロンプト用テキストに詰め込む
+
+    価値の高い記事から順に、冗長な部分を除いて本文をsnippet_tokensまで切り詰めて追加する。
+    残りの予算に収まらない記事は、本文を短くして入るなら短くし、入らなければ省く。
+
+    Args:
+        articles: ニュース記事のリスト
+        budget_tokens: 記事部分全体のトークン予算
+        snippet_tokens: 1記事の本文のトークン上限
+        max_articles: 最大記事数
+
+    Returns:
+        dict: {"text", "tokens", "articles"(採用した記事), "dropped"(省いた件数), "truncated"(切り詰めた件数)}
+    """
+    ranked = [article for _, article in sorted(enumerate(articles), key=_article_value)]
+    separator_tokens = estimate_tokens("\n\n")
+
+    blocks = []
+    packed = []
+    used = 0
+    truncated = 0
+    for article in ranked:
+        if len(packed) >= max_articles:
+            break
+        title = _SPACE.sub(' ', article.get('title') or '').strip()
+        if not title:
+            continue
+        snippet = clean_snippet(title, article.get('snippet', ''))
+        shortened = truncate_to_tokens(snippet, snippet_tokens)
+
+        number = len(packed) + 1
+        overhead = estimate_tokens(_format_article(number, title, '')) + (separator_tokens if blocks else 0)
+        remaining = budget_tokens - used - overhead
+        if remaining < estimate_tokens(shortened):
+            if remaining < MIN_SNIPPET_TOKENS:
+                continue
+            shortened = truncate_to_tokens(shortened, remaining)
+        if shortened != snippet:
+            truncated += 1
+
+        block = _format_article(number, title, shortened)
+        blocks.append(block)
+        packed.append(article)
+        used += overhead + estimate_tokens(shortened)
+
+    text = "\n\n".join(blocks)
+    tokens = estimate_tokens(text)
+    dropped = len(articles) - len(packed)
+
+    increment('prompt.packed_tokens', tokens)
+    increment('prompt.articles_packed', len(packed))
+    increment('prompt.articles_dropped', dropped)
+    logger.info(
+        f"記事コンテキスト: {len(packed)}/{len(articles)}記事、約{tokens}トークン"
+        f"（予算{budget_tokens}、切り詰め{truncated}件）"
+    )
+    return {
+        "text": text,
+        "tokens": tokens,
+        "articles": packed,
+        "dropped": dropped,
+        "truncated": truncated,
+    }
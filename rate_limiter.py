@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+ホスト単位のトークンバケット・レート制限
+固定sleepの代わりに、同一ホストへのリクエスト頻度を制御する
+"""
+
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """
+    スレッドセーフなトークンバケット
+
+    Args:
+        rate: 1秒あたりに補充されるトークン数
+        capacity: バケットの最大トークン数（同時に送れるバースト数）
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        if rate <= 0:
+            raise ValueError("rateは正の値である必要があります")
+        if capacity < 1:
+            raise ValueError("capacityは1以上である必要があります")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout: float = None) -> bool:
+        """
+        トークンを1つ取得する（必要なら補充を待つ）
+
+        Args:
+            timeout: 最大待ち時間（秒）。Noneなら取得できるまで待つ
+
+        Returns:
+            bool: 取得できた場合True、タイムアウトした場合False
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """
+    URLのホストごとに独立したトークンバケットを持つレート制限
+
+    Args:
+        rate: ホストごとの1秒あたりリクエスト数
+        burst: ホストごとのバースト上限
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket_for(self, url: str) -> TokenBucket:
+        """URLのホストに対応するバケットを返す（なければ作成）"""
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+                self._buckets[host] = bucket
+            return bucket
+
+    def acquire(self, url: str, timeout: float = None) -> bool:
+        """URLのホストに対してトークンを1つ取得する"""
+        return self.bucket_for(url).acquire(timeout=timeout)
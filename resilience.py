@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+実行全体の締め切りとサーキットブレーカー
+1回の実行に使える時間を段階間で共有し、応答しなくなった接続先への呼び出しはすぐに諦める
+"""
+
+import contextvars
+import logging
+import os
+import threading
+import time
+
+from telemetry import increment
+
+logger = logging.getLogger(__name__)
+
+
+# 締め切りの設定（環境変数で上書き可能）
+# RUN_DEADLINE_SECONDS: 1回の実行（検索〜ツイート生成）に使える時間。0なら締め切りなし
+RUN_DEADLINE_SECONDS = float(os.getenv('RUN_DEADLINE_SECONDS', '150'))
+# 検索などの前段が使い切らないように、LLMの段階のために残しておく時間
+RUN_DEADLINE_RESERVE_SECONDS = float(os.getenv('RUN_DEADLINE_RESERVE_SECONDS', '45'))
+
+# サーキットブレーカーの設定
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '3'))
+BREAKER_RESET_SECONDS = float(os.getenv('BREAKER_RESET_SECONDS', '300'))
+
+
+class DeadlineExceeded(TimeoutError):
+    """実行全体の締め切りを過ぎた（または残り時間が足りない）"""
+
+
+class CircuitOpenError(RuntimeError):
+    """サーキットブレーカーが開いているため呼び出しを省いた"""
+
+
+class Deadline:
+    """
+    実行全体の締め切り
+
+    Args:
+        seconds: 今から締め切りまでの秒数
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+_current = contextvars.ContextVar('run_deadline', default=None)
+
+
+def start_deadline(seconds: float = RUN_DEADLINE_SECONDS) -> Deadline:
+    """
+    現在の実行の締め切りを設定する（0以下なら締め切りなし）
+
+    締め切りはコンテキストごとに持つので、常駐モードのバックグラウンドジョブとは干渉しない。
+
+    Returns:
+        Deadline: 設定した締め切り（なしならNone）
+    """
+    deadline = Deadline(seconds) if seconds and seconds > 0 else None
+    _current.set(deadline)
+    return deadline
+
+
+def current_deadline() -> Deadline:
+    """現在の実行の締め切り（なければNone）"""
+    return _current.get()
+
+
+def stage_timeout(cap: float, reserve: float = 0.0) -> float:
+    """
+    段階に渡すタイムアウト（本来の上限と、締め切りまでの残り時間の短い方）
+
+    Args:
+        cap: この段階の本来のタイムアウト（秒）
+        reserve: 後の段階のために残しておく時間（秒）
+
+    Returns:
+        float: タイムアウト（秒）
+
+    Raises:
+        DeadlineExceeded: 残り時間がない
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        return cap
+    left = deadline.remaining() - reserve
+    if left <= 0:
+        increment('deadline.exceeded')
+        raise DeadlineExceeded(f"実行の締め切りまでの残り時間が足りません（残り{deadline.remaining():.1f}秒）")
+    return min(cap, left)
+
+
+class CircuitBreaker:
+    """
+    接続先ごとのサーキットブレーカー
+
+    連続してfailure_threshold回失敗すると開き、reset_seconds の間は呼び出しを省く。
+    その後は1回だけ試し（半開）、成功すれば閉じ、失敗すればまた開く。
+    試しの呼び出しが成功とも失敗とも記録されずに終わったら、release() で次の呼び出しに試しを譲る。
+
+    Args:
+        name: 接続先の名前
+        failure_threshold: 開くまでの連続失敗回数
+        reset_seconds: 開いてから試し直すまでの秒数
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        # 半開で試しの呼び出しをしているスレッド（していなければNone）
+        self._trial = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> bool:
+        """呼び出してよいか（半開なら最初の1回だけ許可する）"""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and self._trial is None:
+                self._trial = threading.get_ident()
+                return True
+        increment(f'breaker.skipped.{self.name}')
+        return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"サーキットブレーカーを閉じました: {self.name}")
+            self._failures = 0
+            self._opened_at = None
+            self._trial = None
+
+    def record_failure(self, trip: bool = False) -> None:
+        """
+        失敗を記録する
+
+        Args:
+            trip: 連続失敗回数にかかわらずすぐに開く（ブロックされたと分かったときなど）
+        """
+        with self._lock:
+            self._failures += 1
+            was_open = self._opened_at is not None and self._trial is None
+            if trip or self._trial is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._trial = None
+                if not was_open:
+                    increment(f'breaker.opened.{self.name}')
+                    logger.warning(f"サーキットブレーカーを開きました: {self.name}（{self.reset_seconds:.0f}秒間呼び出しを省きます）")
+
+    def release(self) -> None:
+        """
+        このスレッドの試しの呼び出しを、結果を記録せずに終える（半開のまま次の呼び出しに試しを譲る）
+
+        接続先の状態と関係のないエラー（リクエストの誤り・認証エラーなど）で終わったときに呼ぶ。
+        結果を記録済みのとき、試しの呼び出しでないときは何もしない。
+        """
+        with self._lock:
+            if self._trial == threading.get_ident():
+                self._trial = None
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """プロセス内で共有する接続先ごとのサーキットブレーカーを返す"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+実行記録のアーカイブ
+実行ごとの記事・リサーチ結果・ツイート・メトリクスを圧縮して追記専用のデータファイルに保存し、
+SQLiteの索引（実行ID・日付 → ファイル内の位置）から、ファイル全体を読まずに1件ずつ取り出せるようにする。
+圧縮（compact）は古い記録を削除し、残りを日付順に数十件ずつまとめて圧縮し直す
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import zlib
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+
+# アーカイブの設定（環境変数で上書き可能）
+RUN_ARCHIVE_DIR = os.getenv('RUN_ARCHIVE_DIR', os.path.join('.cache', 'run_archive'))
+# 圧縮のときに残す日数（これより古い記録は削除する）
+RUN_ARCHIVE_KEEP_DAYS = float(os.getenv('RUN_ARCHIVE_KEEP_DAYS', '400'))
+# 圧縮のときに1ブロックにまとめる記録数（多いほど小さくなり、1件の取り出しで展開する量は増える）
+RUN_ARCHIVE_BLOCK_RECORDS = int(os.getenv('RUN_ARCHIVE_BLOCK_RECORDS', '32'))
+
+# 日付はJSTで数える（実行枠と同じ）
+JST = timezone(timedelta(hours=9))
+
+# 追記先のデータファイル。圧縮すると中身は新しいセグメントに移り、このファイルは消える
+ACTIVE_SEGMENT = 'active.dat'
+
+# 記事は検索に使う項目だけを残す
+ARTICLE_FIELDS = ('title', 'source', 'url', 'published')
+
+# 失敗した実行に残すトレースバックの最大文字数（末尾を残す）
+TRACEBACK_MAX_CHARS = 4000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    script TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    day TEXT NOT NULL,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_day ON runs(day);
+CREATE INDEX IF NOT EXISTS idx_runs_created ON runs(created_at);
+"""
+
+
+def run_day(created_at: float) -> str:
+    """記録の日付（JST、YYYY-MM-DD）"""
+    return datetime.fromtimestamp(created_at, JST).strftime('%Y-%m-%d')
+
+
+def slim_articles(articles: list) -> list:
+    """記事から検索に使う項目だけを残す（本文の抜粋は保存しない）"""
+    return [
+        {key: article[key] for key in ARTICLE_FIELDS if article.get(key)}
+        for article in articles or []
+    ]
+
+
+def archive_failed_run(run_id: str, script: str, error: BaseException, metrics: dict) -> None:
+    """
+    失敗した実行の記録（エラー・トレースバック・メトリクス）をアーカイブに追記する。失敗しても実行は続ける
+
+    Args:
+        run_id: 実行ID
+        script: スクリプト名
+        error: 実行を止めた例外
+        metrics: 実行メトリクスの集計（telemetry の summary()）
+    """
+    trace = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+    try:
+        get_archive().append({
+            'run_id': run_id,
+            'script': script,
+            'created_at': time.time(),
+            'error': f"{type(error).__name__}: {error}",
+            'traceback': trace[-TRACEBACK_MAX_CHARS:],
+            'metrics': metrics,
+        })
+    except (OSError, TypeError, ValueError, sqlite3.Error) as e:
+        logger.warning(f"実行記録のアーカイブに失敗しました: {e}")
+
+
+class RunArchive:
+    """
+    追記専用の実行記録アーカイブ
+
+    データファイルには zlib で圧縮したブロック（記録のJSON配列）を並べ、
+    索引には記録ごとに (セグメント, ブロックの位置, 長さ, ブロック内の番号) を持つ。
+    追記は1件1ブロック、圧縮は日付順に RUN_ARCHIVE_BLOCK_RECORDS 件ずつのブロックにまとめ直す。
+    追記と圧縮はSQLiteの書き込みロックの中で行うので、複数のプロセスから使ってよい。
+
+    Args:
+        directory: 保存先のディレクトリ
+    """
+
+    def __init__(self, directory: str = RUN_ARCHIVE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, 'index.sqlite3'), check_same_thread=False, timeout=30)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _read_blocks(self, locations: set) -> dict:
+        """
+        ブロックを読んで展開する
+
+        セグメントはほかのプロセスの圧縮で置き換わることがあるので、ファイルは呼び出しごとに開き直す。
+
+        Args:
+            locations: {(セグメント, 位置, 長さ), ...}
+
+        Returns:
+            dict: (セグメント, 位置) → 記録のリスト
+        """
+        blocks = {}
+        for segment in {location[0] for location in locations}:
+            fd = os.open(os.path.join(self.directory, segment), os.O_RDONLY)
+            try:
+                for _, offset, length in (location for location in locations if location[0] == segment):
+                    blocks[(segment, offset)] = json.loads(zlib.decompress(os.pread(fd, length, offset)))
+            finally:
+                os.close(fd)
+        return blocks
+
+    def append(self, record: dict) -> str:
+        """
+        実行記録を追記する（同じ実行IDの記録があれば置き換える）
+
+        Args:
+            record: 記録（run_id, script, created_at を含む、JSONにできる辞書）
+
+        Returns:
+            str: 実行ID
+        """
+        block = zlib.compress(json.dumps([record], ensure_ascii=False).encode('utf-8'), 9)
+        path = os.path.join(self.directory, ACTIVE_SEGMENT)
+        with self._lock, self._conn:
+            # 書き込みロックを取ってから追記する（ほかのプロセスの追記・圧縮と混ざらないように）
+            self._conn.execute('BEGIN IMMEDIATE')
+            with open(path, 'ab') as f:
+                offset = f.tell()
+                f.write(block)
+            self._conn.execute(
+                'INSERT OR REPLACE INTO runs (run_id, script, created_at, day, segment, offset, length, position) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, 0)',
+                (record['run_id'], record['script'], record['created_at'], run_day(record['created_at']),
+                 ACTIVE_SEGMENT, offset, len(block))
+            )
+        return record['run_id']
+
+    def find(self, day: str = None, since: float = None, until: float = None, script: str = None,
+             limit: int = None) -> list:
+        """
+        索引から実行を探す（データファイルは読まない）
+
+        Args:
+            day: 日付（JST、YYYY-MM-DD）
+            since: この時刻以降（UNIX時刻）
+            until: この時刻より前（UNIX時刻）
+            script: スクリプト名
+            limit: 件数の上限
+
+        Returns:
+            list: 新しい順の [{"run_id", "script", "created_at", "day"}, ...]
+        """
+        conditions, params = [], []
+        for column, operator, value in (('day', '=', day), ('created_at', '>=', since),
+                                        ('created_at', '<', until), ('script', '=', script)):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                params.append(value)
+        query = 'SELECT run_id, script, created_at, day FROM runs'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY created_at DESC'
+        if limit:
+            query += ' LIMIT ?'
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [{"run_id": row[0], "script": row[1], "created_at": row[2], "day": row[3]} for row in rows]
+
+    def load(self, run_ids: list) -> list:
+        """
+        実行記録を読み込む（同じブロックの記録は1回の展開で取り出す）
+
+        Returns:
+            list: run_ids の順の記録。見つからないIDは除く
+        """
+        if not run_ids:
+            return []
+        placeholders = ','.join('?' * len(run_ids))
+        with self._lock:
+            for attempt in range(2):
+                rows = self._conn.execute(
+                    f'SELECT run_id, segment, offset, length, position FROM runs WHERE run_id IN ({placeholders})',
+                    list(run_ids)
+                ).fetchall()
+                try:
+                    blocks = self._read_blocks({(segment, offset, length) for _, segment, offset, length, _ in rows})
+                    break
+                except FileNotFoundError:
+                    # 索引を読んだ直後にほかのプロセスが圧縮した。新しい索引で読み直す
+                    if attempt:
+                        raise
+        records = {run_id: blocks[(segment, offset)][position] for run_id, segment, offset, _, position in rows}
+        return [records[run_id] for run_id in run_ids if run_id in records]
+
+    def get(self, run_id: str) -> dict:
+        """実行IDで記録を1件読み込む。なければNone"""
+        records = self.load([run_id])
+        return records[0] if records else None
+
+    def stats(self) -> dict:
+        """
+        アーカイブの大きさ
+
+        Returns:
+            dict: {"runs", "blocks", "segments", "bytes", "live_bytes"}（live_bytes は索引から参照されている部分）
+        """
+        with self._lock:
+            runs, = self._conn.execute('SELECT COUNT(*) FROM runs').fetchone()
+            blocks = self._conn.execute('SELECT DISTINCT segment, offset, length FROM runs').fetchall()
+        segments = [name for name in os.listdir(self.directory) if name.endswith('.dat')]
+        return {
+            "runs": runs,
+            "blocks": len(blocks),
+            "segments": len(segments),
+            "bytes": sum(os.path.getsize(os.path.join(self.directory, name)) for name in segments),
+            "live_bytes": sum(length for _, _, length in blocks),
+        }
+
+    def compact(self, keep_days: float = RUN_ARCHIVE_KEEP_DAYS,
+                block_records: int = RUN_ARCHIVE_BLOCK_RECORDS) -> dict:
+        """
+        古い記録を削除し、残りを日付順のブロックにまとめ直して新しいセグメントに書く
+
+        置き換えられた記録・削除した記録の分の領域もここで解放される。
+
+        Args:
+            keep_days: 残す日数
+            block_records: 1ブロックにまとめる記録数
+
+        Returns:
+            dict: 圧縮前後の stats() と削除した件数
+        """
+        before = self.stats()
+        cutoff = time.time() - keep_days * 86400
+        segment = f"runs-{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}.dat"
+        tmp_path = os.path.join(self.directory, segment + '.tmp')
+        with self._lock:
+            with self._conn:
+                self._conn.execute('BEGIN IMMEDIATE')
+                removed = self._conn.execute('DELETE FROM runs WHERE created_at < ?', (cutoff,)).rowcount
+                rows = self._conn.execute(
+                    'SELECT run_id, segment, offset, length, position FROM runs ORDER BY created_at'
+                ).fetchall()
+                blocks = self._read_blocks({(row[1], row[2], row[3]) for row in rows})
+
+                updates = []
+                with open(tmp_path, 'wb') as f:
+                    for start in range(0, len(rows), block_records):
+                        chunk = rows[start:start + block_records]
+                        records = [blocks[(row[1], row[2])][row[4]] for row in chunk]
+                        block = zlib.compress(json.dumps(records, ensure_ascii=False).encode('utf-8'), 9)
+                        offset = f.tell()
+                        f.write(block)
+                        updates += [(segment, offset, len(block), position, row[0])
+                                    for position, row in enumerate(chunk)]
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, os.path.join(self.directory, segment))
+                self._conn.executemany(
+                    'UPDATE runs SET segment = ?, offset = ?, length = ?, position = ? WHERE run_id = ?', updates
+                )
+            # 索引の更新を確定してから、参照されなくなったセグメントを消す
+            # （書き込みロックを取り直すので、その間にほかのプロセスが追記したセグメントは残る）
+            with self._conn:
+                self._conn.execute('BEGIN IMMEDIATE')
+                referenced = {name for (name,) in self._conn.execute('SELECT DISTINCT segment FROM runs')}
+                for name in os.listdir(self.directory):
+                    if name.endswith('.dat') and name != segment and name not in referenced:
+                        os.remove(os.path.join(self.directory, name))
+        after = self.stats()
+        logger.info(f"実行記録を圧縮しました: {before['bytes']} → {after['bytes']} bytes（{removed}件削除）")
+        return {"removed": removed, "before": before, "after": after}
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_archive() -> RunArchive:
+    """プロセス内で共有するアーカイブを返す"""
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            _archive = RunArchive()
+        return _archive
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+実行ごとのスナップショット
+1回の実行で集めた記事・リサーチ結果・LLMとのやり取り・生成したツイートをgzip圧縮したJSONに保存する。
+保存したスナップショットは benchmarks/replay_eval.py で、プロンプトやモデルを変えた版と同じ入力で比べるのに使う
+"""
+
+import contextvars
+import gzip
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+# スナップショットの設定（環境変数で上書き可能）
+# RUN_SNAPSHOT_DIR: 保存先（空文字なら保存しない）
+RUN_SNAPSHOT_DIR = os.getenv('RUN_SNAPSHOT_DIR', os.path.join('.cache', 'snapshots'))
+RUN_SNAPSHOT_KEEP_DAYS = float(os.getenv('RUN_SNAPSHOT_KEEP_DAYS', '45'))
+
+SNAPSHOT_SUFFIX = '.json.gz'
+
+# 記録中のLLMとのやり取り（capture_exchanges の中だけリストが入る）
+_exchanges = contextvars.ContextVar('llm_exchanges', default=None)
+
+
+@contextmanager
+def capture_exchanges():
+    """
+    この中で行ったLLM呼び出し（キャッシュヒットを含む）を記録する
+
+    パイプラインの段階やキャラクターの並行生成はコンテキストを引き継ぐので、別スレッドの呼び出しも記録される。
+
+    Yields:
+        list: 記録したやり取りのリスト
+    """
+    exchanges = []
+    token = _exchanges.set(exchanges)
+    try:
+        yield exchanges
+    finally:
+        _exchanges.reset(token)
+
+
+def record_exchange(model: str, messages: list, params: dict, result: dict, seconds: float) -> None:
+    """LLM呼び出しを記録する（capture_exchanges の外では何もしない）"""
+    exchanges = _exchanges.get()
+    if exchanges is None:
+        return
+    exchanges.append({
+        'model': model,
+        'messages': messages,
+        'params': params,
+        'contents': result['contents'],
+        'usage': result.get('usage') or {},
+        'cached': result.get('cached', False),
+        'latency_ms': round(seconds * 1000, 1),
+    })
+
+
+def new_run_id(script: str, created_at: float = None) -> str:
+    """実行ID（時刻-スクリプト名-プロセスID）。スナップショットと実行記録のアーカイブで共通に使う"""
+    created_at = time.time() if created_at is None else created_at
+    return f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(created_at))}-{script}-{os.getpid()}"
+
+
+def save_snapshot(script: str, data: dict, directory: str = None, run_id: str = None) -> str:
+    """
+    実行のスナップショットを保存する
+
+    Args:
+        script: 実行したスクリプト名（generate_tweet / x_ai_smart_post）
+        data: 保存する内容（記事・リサーチ結果・やり取り・ツイートなど、JSONにできるもの）
+        directory: 保存先（Noneなら RUN_SNAPSHOT_DIR）
+        run_id: 実行ID（Noneなら新しく作る）
+
+    Returns:
+        str: 保存したファイルのパス。保存しない設定ならNone
+    """
+    directory = RUN_SNAPSHOT_DIR if directory is None else directory
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    created_at = time.time()
+    run_id = run_id or new_run_id(script, created_at)
+    snapshot = dict(data, run_id=run_id, script=script, created_at=created_at)
+    path = os.path.join(directory, run_id + SNAPSHOT_SUFFIX)
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    logger.info(f"実行のスナップショットを保存しました: {path}")
+    prune_snapshots(directory)
+    return path
+
+
+def load_snapshot(path: str) -> dict:
+    """保存したスナップショットを読み込む"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def list_snapshots(directory: str = None, script: str = None, since_days: float = None) -> list:
+    """
+    保存したスナップショットのパスを古い順に返す
+
+    Args:
+        directory: 保存先（Noneなら RUN_SNAPSHOT_DIR）
+        script: スクリプト名で絞り込む
+        since_days: この日数以内に保存したものだけ
+    """
+    directory = RUN_SNAPSHOT_DIR if directory is None else directory
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith(SNAPSHOT_SUFFIX))
+    except OSError:
+        return []
+    cutoff = time.time() - since_days * 86400 if since_days else None
+    paths = []
+    for name in names:
+        if script and f"-{script}-" not in name:
+            continue
+        path = os.path.join(directory, name)
+        if cutoff is not None and os.path.getmtime(path) < cutoff:
+            continue
+        paths.append(path)
+    return paths
+
+
+def prune_snapshots(directory: str = None, keep_days: float = None) -> int:
+    """
+    古いスナップショットを削除する
+
+    Returns:
+        int: 削除した件数
+    """
+    keep_days = RUN_SNAPSHOT_KEEP_DAYS if keep_days is None else keep_days
+    cutoff = time.time() - keep_days * 86400
+    removed = 0
+    for path in list_snapshots(directory):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    if removed:
+        logger.info(f"古いスナップショットを{removed}件削除しました")
+    return removed
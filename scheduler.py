@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+常駐実行用のスケジューラ
+プロセスを起動したままJSTの決まった時刻にジョブを実行し、取りこぼした枠は起動時に追いかけて実行する
+"""
+
+import json
+import logging
+import os
+import signal
+import threading
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+
+JST = timezone(timedelta(hours=9))
+
+# スケジューラの設定（環境変数で上書き可能）
+SCHEDULE_SLOTS_JST = os.getenv('SCHEDULE_SLOTS_JST', '09:00,12:00,18:00')
+SCHEDULER_STATE_FILE = os.getenv('SCHEDULER_STATE_FILE', os.path.join('.cache', 'scheduler_state.json'))
+# この時間以内に取りこぼした枠は、起動時や復帰時に追いかけて実行する
+SCHEDULER_CATCHUP_MINUTES = float(os.getenv('SCHEDULER_CATCHUP_MINUTES', '180'))
+# バックグラウンドジョブ（事前リサーチなど）の実行間隔（分）
+SCHEDULER_BACKGROUND_MINUTES = float(os.getenv('SCHEDULER_BACKGROUND_MINUTES', '60'))
+# 待機中に停止要求を確認する間隔（秒）
+SCHEDULER_POLL_SECONDS = 30
+
+
+def parse_slots(spec: str = SCHEDULE_SLOTS_JST) -> list:
+    """
+    「HH:MM」のカンマ区切りを (時, 分) のリストに変換する
+
+    Args:
+        spec: 実行時刻の設定文字列（JST）
+
+    Returns:
+        list: (時, 分) のタプルを時刻順に並べたリスト
+    """
+    slots = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        hour, _, minute = item.partition(':')
+        slots.append((int(hour), int(minute or 0)))
+    if not slots:
+        raise ValueError("実行時刻が設定されていません")
+    return sorted(slots)
+
+
+def previous_slot(now: datetime, slots: list) -> datetime:
+    """now以前で最も新しい実行枠"""
+    now = now.astimezone(JST)
+    for days_back in (0, 1):
+        day = now - timedelta(days=days_back)
+        for hour, minute in reversed(slots):
+            slot = day.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if slot <= now:
+                return slot
+    raise ValueError("直前の実行枠を計算できません")
+
+
+def next_slot(now: datetime, slots: list) -> datetime:
+    """nowより後で最も近い実行枠"""
+    now = now.astimezone(JST)
+    for days_ahead in (0, 1):
+        day = now + timedelta(days=days_ahead)
+        for hour, minute in slots:
+            slot = day.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if slot > now:
+                return slot
+    raise ValueError("次の実行枠を計算できません")
+
+
+class SchedulerState:
+    """
+    ジョブごとの「最後に実行した枠」を保存する
+
+    Args:
+        path: JSONファイルのパス
+    """
+
+    def __init__(self, path: str = SCHEDULER_STATE_FILE):
+        self.path = path
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self._state = json.load(f)
+        except (OSError, ValueError):
+            self._state = {}
+
+    def last_slot(self, job_name: str) -> datetime:
+        value = self._state.get(job_name)
+        return datetime.fromisoformat(value) if value else None
+
+    def mark(self, job_name: str, slot: datetime) -> None:
+        self._state[job_name] = slot.isoformat()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class Scheduler:
+    """
+    JSTの実行枠でジョブを繰り返し実行する常駐スケジューラ
+
+    Args:
+        job: 引数なしで呼ばれるジョブ（終了コードを返す）
+        job_name: 状態ファイルでのジョブ名
+        slots: (時, 分) のリスト（JST）
+        state: 実行済み枠の保存先
+        catchup_minutes: 取りこぼした枠を追いかけて実行する猶予（分）
+        background: 実行枠とは別に一定間隔で実行するジョブ（事前リサーチなど）
+        background_minutes: backgroundの実行間隔（分）
+    """
+
+    def __init__(self, job, job_name: str, slots: list = None, state: SchedulerState = None,
+                 catchup_minutes: float = SCHEDULER_CATCHUP_MINUTES, background=None,
+                 background_minutes: float = SCHEDULER_BACKGROUND_MINUTES):
+        self.job = job
+        self.job_name = job_name
+        self.slots = slots or parse_slots()
+        self.state = state or SchedulerState()
+        self.catchup = timedelta(minutes=catchup_minutes)
+        self.background = background
+        self.background_interval = background_minutes * 60
+        self._stop = threading.Event()
+
+    def stop(self, *_args) -> None:
+        """停止を要求する（実行中のジョブは最後まで実行する）"""
+        logger.info("スケジューラの停止要求を受け付けました")
+        self._stop.set()
+
+    def due_slot(self, now: datetime) -> datetime:
+        """
+        今すぐ実行すべき枠を返す（なければNone）
+
+        直前の枠が未実行で、かつ猶予時間内であれば実行対象になる。
+        取りこぼした枠が複数あっても、実行するのは最新の1枠だけ。
+        """
+        slot = previous_slot(now, self.slots)
+        last = self.state.last_slot(self.job_name)
+        if last is not None and last >= slot:
+            return None
+        if now.astimezone(JST) - slot > self.catchup:
+            return None
+        return slot
+
+    def run_pending(self, now: datetime = None) -> bool:
+        """実行すべき枠があればジョブを実行する。実行した場合True"""
+        now = now or datetime.now(JST)
+        slot = self.due_slot(now)
+        if slot is None:
+            return False
+        late = (now.astimezone(JST) - slot).total_seconds()
+        logger.info(f"ジョブ実行: {self.job_name}（枠 {slot:%Y-%m-%d %H:%M} JST、{late:.0f}秒遅れ）")
+        # 失敗しても同じ枠を繰り返さないよう、実行前に記録する
+        self.state.mark(self.job_name, slot)
+        try:
+            exit_code = self.job()
+            if exit_code:
+                logger.error(f"ジョブが失敗しました: {self.job_name}（終了コード {exit_code}）")
+        except Exception as e:
+            logger.error(f"ジョブで予期しないエラー: {self.job_name}: {e}")
+        return True
+
+    def _run_background(self) -> None:
+        """停止要求があるまでbackgroundを一定間隔で実行する（起動直後に1回目を実行）"""
+        while not self._stop.is_set():
+            try:
+                self.background()
+            except Exception as e:
+                logger.error(f"バックグラウンドジョブで予期しないエラー: {e}")
+            self._stop.wait(self.background_interval)
+
+    def run_forever(self) -> int:
+        """
+        停止要求があるまで実行枠ごとにジョブを実行する
+
+        Returns:
+            int: 終了コード
+        """
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                signal.signal(signum, self.stop)
+            except ValueError:  # メインスレッド以外では設定できない
+                pass
+        slot_text = ', '.join(f"{h:02d}:{m:02d}" for h, m in self.slots)
+        logger.info(f"常駐モード開始: {self.job_name}（実行枠 {slot_text} JST）")
+        if self.background is not None:
+            threading.Thread(target=self._run_background, name=f"{self.job_name}-background", daemon=True).start()
+
+        while not self._stop.is_set():
+            self.run_pending()
+            upcoming = next_slot(datetime.now(JST), self.slots)
+            wait = (upcoming - datetime.now(JST)).total_seconds()
+            logger.info(f"次回実行: {upcoming:%Y-%m-%d %H:%M} JST（{wait / 60:.0f}分後）")
+            # 枠の時刻ちょうどに起きられるよう、残り時間と確認間隔の短い方だけ待つ
+            while not self._stop.is_set():
+                remaining = (upcoming - datetime.now(JST)).total_seconds()
+                if remaining <= 0:
+                    break
+                self._stop.wait(min(remaining, SCHEDULER_POLL_SECONDS))
+
+        logger.info(f"常駐モード終了: {self.job_name}")
+        return 0
+
+
+def run_daemon(job, job_name: str, warmup=None, background=None) -> int:
+    """
+    ジョブを常駐モードで実行する
+
+    Args:
+        job: 引数なしで呼ばれるジョブ（終了コードを返す）
+        job_name: 状態ファイルでのジョブ名
+        warmup: 起動時に1回だけ呼ぶ準備処理（クライアントの作成など）
+        background: 実行枠とは別に一定間隔で実行するジョブ
+
+    Returns:
+        int: 終了コード
+    """
+    if warmup is not None:
+        try:
+            warmup()
+        except Exception as e:
+            # 準備に失敗しても、各実行で改めて作成されるので常駐は続ける
+            logger.warning(f"起動時の準備に失敗しました: {e}")
+    return Scheduler(job, job_name, background=background).run_forever()
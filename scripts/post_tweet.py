@@ -1,6 +1,8 @@
 # scripts/post_tweet.py
 import os, sys
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 REQUIRED = ["TWITTER_API_KEY","TWITTER_API_SECRET","TWITTER_ACCESS_TOKEN","TWITTER_ACCESS_TOKEN_SECRET"]
 missing = [k for k in REQUIRED if not os.getenv(k)]
 
@@ -18,15 +20,23 @@ if missing:
     print("ツイート候補:\n", tweet_text)
     sys.exit(0)
 
-# ここから実投稿
-import tweepy
-api_key = os.getenv("TWITTER_API_KEY")
-api_secret = os.getenv("TWITTER_API_SECRET")
-access_token = os.getenv("TWITTER_ACCESS_TOKEN")
-access_secret = os.getenv("TWITTER_ACCESS_TOKEN_SECRET")
+# ここから実投稿（X API v2。送信箱に入れてから投稿し、失敗しても次回の実行で再送する）
+# TWITTER_* の認証情報で投稿するので、x_ai_smart_post.py（X_*）とは別のアカウントとして送信箱に入れる
+from post_outbox import PostWorker, get_outbox
+from x_api import TWITTER_ACCOUNT
 
-auth = tweepy.OAuth1UserHandler(api_key, api_secret, access_token, access_secret)
-api = tweepy.API(auth)
+outbox = get_outbox()
+post_id, previous = outbox.enqueue(tweet_text, account=TWITTER_ACCOUNT, source="scripts/post_tweet.py")
+if previous == "posted":
+    print("⚠️ 同じ内容のツイートがすでに投稿済みのため、投稿をスキップします。")
+    sys.exit(0)
+PostWorker(outbox, TWITTER_ACCOUNT).drain()
 
-resp = api.update_status(status=tweet_text)
-print("✅ 投稿完了:", resp.id)
+post = outbox.get(post_id)
+if post["status"] == "posted":
+    print("✅ 投稿完了:", post["tweet_id"] or "（同じ内容が投稿済みと返されました）")
+    sys.exit(0)
+print("❌ 投稿できませんでした:", post["last_error"])
+if post["status"] == "pending":
+    print("送信箱に残しました（次回の実行で再送します）")
+sys.exit(1)
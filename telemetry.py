@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+実行テレメトリ
+段階ごとの所要時間（スパン）、LLMのトークン使用量、リトライ・キャッシュヒット数を集計し、
+機械可読なJSONとGITHUB_OUTPUTに書き出す
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+RUN_METRICS_FILE = os.getenv('RUN_METRICS_FILE', 'run_metrics.json')
+
+
+class RunMetrics:
+    """1回の実行で集めるメトリクス（スレッドセーフ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started_at = datetime.now(timezone.utc)
+            self._origin = time.perf_counter()
+            self.spans = []
+            self.counters = {}
+            self.llm_calls = []
+
+    def add_span(self, name: str, started: float, duration: float, ok: bool, attrs: dict) -> None:
+        with self._lock:
+            self.spans.append({
+                'name': name,
+                'start_ms': round((started - self._origin) * 1000, 1),
+                'duration_ms': round(duration * 1000, 1),
+                'ok': ok,
+                **({'attrs': attrs} if attrs else {}),
+            })
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_llm_call(self, model: str, usage: dict, cached: bool, duration: float) -> None:
+        with self._lock:
+            self.llm_calls.append({
+                'model': model,
+                'cached': cached,
+                'duration_ms': round(duration * 1000, 1),
+                'prompt_tokens': usage.get('prompt_tokens', 0),
+                'completion_tokens': usage.get('completion_tokens', 0),
+                'total_tokens': usage.get('total_tokens', 0),
+            })
+
+    def summary(self) -> dict:
+        """集計結果を辞書で返す"""
+        with self._lock:
+            stages = {}
+            for span_record in self.spans:
+                stage = stages.setdefault(span_record['name'], {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'errors': 0})
+                stage['count'] += 1
+                stage['total_ms'] = round(stage['total_ms'] + span_record['duration_ms'], 1)
+                stage['max_ms'] = max(stage['max_ms'], span_record['duration_ms'])
+                stage['errors'] += 0 if span_record['ok'] else 1
+            tokens = {
+                key: sum(call[key] for call in self.llm_calls)
+                for key in ('prompt_tokens', 'completion_tokens', 'total_tokens')
+            }
+            return {
+                'started_at': self.started_at.isoformat(),
+                'duration_ms': round((time.perf_counter() - self._origin) * 1000, 1),
+                'stages': stages,
+                'counters': dict(self.counters),
+                'llm': {
+                    'calls': len(self.llm_calls),
+                    'cached_calls': sum(1 for call in self.llm_calls if call['cached']),
+                    **tokens,
+                    'by_call': list(self.llm_calls),
+                },
+                'spans': list(self.spans),
+            }
+
+
+# 現在の実行のメトリクス（start_metrics で設定する。設定していなければプロセス共通のものを使う）
+_current = contextvars.ContextVar('run_metrics', default=None)
+_default = RunMetrics()
+
+
+def start_metrics() -> RunMetrics:
+    """
+    現在の実行のメトリクスを新しく始める
+
+    メトリクスはコンテキストごとに持つので、常駐モードのバックグラウンドジョブ（事前リサーチ）と
+    実行枠のジョブが同時に動いても、互いの記録が混ざったり途中で消えたりしない。
+
+    Returns:
+        RunMetrics: 新しいメトリクス
+    """
+    run_metrics = RunMetrics()
+    _current.set(run_metrics)
+    return run_metrics
+
+
+def current_metrics() -> RunMetrics:
+    """現在の実行のメトリクス"""
+    return _current.get() or _default
+
+
+class _CurrentMetrics:
+    """現在の実行のメトリクス（current_metrics()）に処理を渡す"""
+
+    def __getattr__(self, name):
+        return getattr(current_metrics(), name)
+
+
+metrics = _CurrentMetrics()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    処理の所要時間を記録するコンテキストマネージャ
+
+    Args:
+        name: 段階名
+        **attrs: スパンに付ける属性（クエリ名など）
+    """
+    started = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        current_metrics().add_span(name, started, time.perf_counter() - started, ok, attrs)
+
+
+def traced(name: str = None):
+    """関数全体をスパンとして記録するデコレータ"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def increment(name: str, value: int = 1) -> None:
+    """カウンターを加算する（リトライ数・キャッシュヒット数など）"""
+    current_metrics().increment(name, value)
+
+
+def record_llm_call(model: str, usage: dict, cached: bool, duration: float) -> None:
+    """LLM呼び出し1回分のトークン使用量と所要時間を記録する"""
+    current_metrics().add_llm_call(model, usage or {}, cached, duration)
+
+
+def write_metrics(path: str = None) -> dict:
+    """
+    メトリクスをJSONファイルに書き出す
+
+    Args:
+        path: 出力先（Noneなら環境変数RUN_METRICS_FILE）
+
+    Returns:
+        dict: 書き出したメトリクス
+    """
+    path = path or RUN_METRICS_FILE
+    summary = current_metrics().summary()
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        logger.info(f"実行メトリクスを書き出しました: {path}")
+    except OSError as e:
+        logger.warning(f"実行メトリクスの書き出しに失敗しました: {e}")
+    return summary
+
+
+def write_github_output(summary: dict = None) -> None:
+    """主要な数値をGITHUB_OUTPUTに書き出す（GitHub Actions以外では何もしない）"""
+    output_path = os.getenv('GITHUB_OUTPUT')
+    if not output_path:
+        return
+    summary = summary or current_metrics().summary()
+    counters = summary['counters']
+    with open(output_path, 'a', encoding='utf-8') as f:
+        f.write(f"run_duration_ms={summary['duration_ms']}\n")
+        f.write(f"llm_calls={summary['llm']['calls']}\n")
+        f.write(f"llm_total_tokens={summary['llm']['total_tokens']}\n")
+        f.write(f"llm_retries={counters.get('llm.retries', 0)}\n")
+        f.write(f"cache_hits={counters.get('http.cache_hits', 0) + counters.get('llm.cache_hits', 0)}\n")
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+急上昇トピックの検出
+記事タイトルの語を時間バケットつきのCount-Min Sketchで数え、直近の出現ペースが過去より急に伸びた語を検索クエリに加える
+"""
+
+import logging
+import math
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# 検出の設定（環境変数で上書き可能）
+TREND_STATE_FILE = os.getenv('TREND_STATE_FILE', os.path.join('.cache', 'trends.npz'))
+TREND_MAX_QUERIES = int(os.getenv('TREND_MAX_QUERIES', '2'))
+# 直近の窓で最低限必要な出現記事数
+TREND_MIN_COUNT = int(os.getenv('TREND_MIN_COUNT', '3'))
+# 直近のペースが過去のペースの何倍なら急上昇とみなすか
+TREND_MIN_VELOCITY = float(os.getenv('TREND_MIN_VELOCITY', '2.0'))
+
+BUCKET_SECONDS = 3600
+BUCKET_COUNT = 48          # 48時間分を保持する
+RECENT_BUCKETS = 6         # 直近6時間を「直近の窓」とする
+SKETCH_DEPTH = 4
+SKETCH_WIDTH = 2048
+MAX_CANDIDATES = 500       # 候補として名前を覚えておく語の上限
+MAX_SEEN_TITLES = 5000     # 同じ記事を何度も数えないために覚えておくタイトル数
+
+_TERM = re.compile(r'[A-Za-z][A-Za-z0-9.+\-]*[A-Za-z0-9]|[ァ-ヴー]{3,}')
+# どの記事にも出てくる語や、話題にならない語
+_STOPWORDS = {
+    'ai', 'news', 'the', 'and', 'for', 'with', 'new', 'how', 'what', 'why', 'from', 'this', 'that',
+    'is', 'are', 'to', 'of', 'in', 'on', 'by', 'an', 'at', 'it', 'its', 'as', 'be', 'or',
+    'google', 'openai', 'chatgpt', 'gemini', 'anthropic', 'claude', 'generative', 'genai',
+    'ニュース', 'サービス', 'テクノロジー', 'ビジネス', 'ユーザー', 'データ', 'システム',
+}
+
+
+def extract_terms(text: str) -> set:
+    """
+    タイトルから急上昇の候補になる語を取り出す（英数字の製品名・カタカナ語）
+
+    Args:
+        text: 記事タイトル
+
+    Returns:
+        set: 候補語（英字は小文字化）の集合
+    """
+    terms = set()
+    for match in _TERM.findall(text or ''):
+        term = match.lower() if match.isascii() else match
+        if term not in _STOPWORDS and len(term) >= 2:
+            terms.add(term)
+    return terms
+
+
+class TrendDetector:
+    """
+    時間バケットつきCount-Min Sketchによる急上昇語の検出
+
+    メモリは (バケット数 × 深さ × 幅) の固定サイズで、語の種類が増えても増えない。
+    語の名前は推定出現数の多い上位MAX_CANDIDATES件だけを覚えておく。
+
+    Args:
+        path: 状態を保存するファイル（.npz）
+        bucket_seconds: 1バケットの長さ（秒）
+    """
+
+    def __init__(self, path: str = TREND_STATE_FILE, bucket_seconds: int = BUCKET_SECONDS):
+        self.path = path
+        self.bucket_seconds = bucket_seconds
+        self._lock = threading.Lock()
+        self._sketch = np.zeros((BUCKET_COUNT, SKETCH_DEPTH, SKETCH_WIDTH), dtype=np.int32)
+        self._head = None  # 最新バケットの通し番号
+        self._candidates = {}
+        self._seen = {}
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if data['sketch'].shape != self._sketch.shape or int(data['bucket_seconds']) != self.bucket_seconds:
+                    logger.warning("急上昇トピックの保存形式が異なるため、集計をやり直します")
+                    return
+                self._sketch = data['sketch'].astype(np.int32)
+                self._head = int(data['head'])
+                self._candidates = dict.fromkeys(data['candidates'].tolist(), 0)
+                self._seen = dict.fromkeys(data['seen'].tolist())
+        except (OSError, KeyError, ValueError):
+            pass
+
+    def save(self) -> None:
+        """状態をファイルに保存する"""
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp.npz"
+            np.savez_compressed(
+                tmp_path,
+                sketch=self._sketch,
+                head=np.int64(self._head if self._head is not None else -1),
+                bucket_seconds=np.int64(self.bucket_seconds),
+                candidates=np.array(list(self._candidates), dtype=str),
+                seen=np.array(list(self._seen), dtype=np.int64),
+            )
+            os.replace(tmp_path, self.path)
+
+    def _columns(self, term: str) -> np.ndarray:
+        """深さごとのハッシュ列（行ごとに異なる初期値のCRC32）"""
+        data = term.encode('utf-8')
+        return np.array([zlib.crc32(data, seed) % SKETCH_WIDTH for seed in range(1, SKETCH_DEPTH + 1)])
+
+    def _advance(self, now: float) -> int:
+        """現在時刻のバケットまで進め、通り過ぎたバケットを空にする。現在のバケット番号を返す"""
+        bucket = int(now // self.bucket_seconds)
+        if self._head is None or self._head < 0:
+            self._head = bucket
+        elif bucket > self._head:
+            for epoch in range(self._head + 1, min(bucket, self._head + BUCKET_COUNT) + 1):
+                self._sketch[epoch % BUCKET_COUNT] = 0
+            self._head = bucket
+        return self._head
+
+    def _estimate(self, term: str, buckets: np.ndarray) -> int:
+        columns = self._columns(term)
+        counts = self._sketch[buckets][:, np.arange(SKETCH_DEPTH), columns].sum(axis=0)
+        return int(counts.min())
+
+    def observe(self, articles: list, now: float = None) -> int:
+        """
+        記事タイトルの語を現在のバケットに数える（同じタイトルは1回だけ）
+
+        Args:
+            articles: ニュース記事のリスト
+            now: 現在時刻（UNIX秒、Noneなら現在）
+
+        Returns:
+            int: 新しく数えた記事数
+        """
+        now = time.time() if now is None else now
+        counted = 0
+        with self._lock:
+            head = self._advance(now)
+            slot = head % BUCKET_COUNT
+            for article in articles:
+                title = article.get('title') or ''
+                key = zlib.crc32(title.encode('utf-8'))
+                if not title or key in self._seen:
+                    continue
+                self._seen[key] = None
+                counted += 1
+                for term in extract_terms(title):
+                    self._sketch[slot, np.arange(SKETCH_DEPTH), self._columns(term)] += 1
+                    self._candidates[term] = self._candidates.get(term, 0) + 1
+            # 覚えておく語とタイトルの数を上限までに抑える
+            while len(self._seen) > MAX_SEEN_TITLES:
+                self._seen.pop(next(iter(self._seen)))
+            if len(self._candidates) > MAX_CANDIDATES:
+                all_buckets = np.arange(BUCKET_COUNT)
+                ranked = sorted(self._candidates, key=lambda t: self._estimate(t, all_buckets), reverse=True)
+                self._candidates = {term: self._candidates[term] for term in ranked[:MAX_CANDIDATES]}
+        return counted
+
+    def trending(self, limit: int = TREND_MAX_QUERIES, now: float = None) -> list:
+        """
+        急上昇中の語を返す
+
+        直近RECENT_BUCKETSの出現ペースと、それ以前のペースの比（速度）で判定し、
+        速度 × log(1 + 直近の出現数) の高い順に並べる。
+
+        Args:
+            limit: 返す最大件数
+            now: 現在時刻（UNIX秒、Noneなら現在）
+
+        Returns:
+            list: [{"term", "recent", "baseline", "velocity"}, ...]
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._head is None or self._head < 0 or not self._candidates:
+                return []
+            head = self._advance(now)
+            recent = np.array([(head - i) % BUCKET_COUNT for i in range(RECENT_BUCKETS)])
+            baseline = np.array([(head - i) % BUCKET_COUNT for i in range(RECENT_BUCKETS, BUCKET_COUNT)])
+            # 過去の窓にまだ何も記録がない（集計を始めたばかり）なら、比べようがないので判定しない
+            if not self._sketch[baseline].any():
+                return []
+            results = []
+            for term in self._candidates:
+                recent_count = self._estimate(term, recent)
+                if recent_count < TREND_MIN_COUNT:
+                    continue
+                baseline_count = self._estimate(term, baseline)
+                # 1時間あたりのペースの比（ゼロ割りを避けるため過去側に0.5件分を足す）
+                velocity = (recent_count / len(recent)) / ((baseline_count + 0.5) / len(baseline))
+                if velocity >= TREND_MIN_VELOCITY:
+                    results.append({
+                        "term": term,
+                        "recent": recent_count,
+                        "baseline": baseline_count,
+                        "velocity": round(velocity, 2),
+                    })
+        results.sort(key=lambda r: r['velocity'] * math.log1p(r['recent']), reverse=True)
+        return results[:limit]
+
+
+def trend_queries(detector: 'TrendDetector', existing: list, limit: int = TREND_MAX_QUERIES) -> list:
+    """
+    急上昇中の語から追加の検索クエリを作る（既存のクエリに含まれる語は除く）
+
+    Args:
+        detector: 急上昇トピックの検出器
+        existing: 既存の検索クエリ
+        limit: 追加する最大件数
+
+    Returns:
+        list: 追加の検索クエリ
+    """
+    if limit <= 0:
+        return []
+    existing_text = ' '.join(existing).lower()
+    queries = []
+    for trend in detector.trending(limit=limit * 3):
+        term = trend['term']
+        if term.lower() in existing_text:
+            continue
+        logger.info(f"急上昇トピック: {term}（直近{trend['recent']}件、速度{trend['velocity']}倍）")
+        queries.append(f"{term} AI")
+        if len(queries) >= limit:
+            break
+    return queries
+
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def get_detector() -> TrendDetector:
+    """プロセス内で共有する検出器を返す"""
+    global _detector
+    with _detector_lock:
+        if _detector is None:
+            _detector = TrendDetector()
+        return _detector
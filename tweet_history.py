@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+生成・投稿したツイートの履歴ストア
+SQLiteに文字bigramの転置インデックスを持ち、過去ツイートとの類似度を高速に調べる
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from dedup import normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+# 履歴の設定（環境変数で上書き可能）
+TWEET_HISTORY_DB = os.getenv('TWEET_HISTORY_DB', os.path.join('.cache', 'tweet_history.sqlite3'))
+TWEET_SIMILARITY_THRESHOLD = float(os.getenv('TWEET_SIMILARITY_THRESHOLD', '0.5'))
+TWEET_HISTORY_MAX_AGE_DAYS = float(os.getenv('TWEET_HISTORY_MAX_AGE_DAYS', '90'))
+# 古い履歴を削除する間隔（時間）。常駐モードでは追加のたびにこの間隔を過ぎていれば削除する
+TWEET_HISTORY_PRUNE_HOURS = float(os.getenv('TWEET_HISTORY_PRUNE_HOURS', '24'))
+TWEET_MAX_REGENERATE = int(os.getenv('TWEET_MAX_REGENERATE', '2'))
+
+NGRAM_SIZE = 2
+
+_HASHTAG = re.compile(r'[#＃]\S+')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tweets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    text TEXT NOT NULL,
+    status TEXT NOT NULL,
+    source TEXT NOT NULL DEFAULT '',
+    gram_count INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS grams (
+    gram TEXT NOT NULL,
+    tweet_id INTEGER NOT NULL REFERENCES tweets(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_grams_gram ON grams(gram);
+CREATE INDEX IF NOT EXISTS idx_grams_tweet ON grams(tweet_id);
+CREATE INDEX IF NOT EXISTS idx_tweets_created ON tweets(created_at);
+"""
+
+
+def tweet_ngrams(text: str, size: int = NGRAM_SIZE) -> set:
+    """
+    類似度計算用の文字n-gram集合を作る
+
+    どのツイートにも付くハッシュタグと、記号・絵文字・空白は除外する。
+
+    Args:
+        text: ツイート本文
+        size: n-gramの長さ
+
+    Returns:
+        set: 文字n-gramの集合
+    """
+    body = normalize_text(_HASHTAG.sub('', text or ''))
+    if len(body) <= size:
+        return {body} if body else set()
+    return {body[i:i + size] for i in range(len(body) - size + 1)}
+
+
+class TweetHistory:
+    """
+    ツイート履歴ストア
+
+    Args:
+        path: SQLiteファイルのパス
+        max_age_days: これより古い履歴はprune()で削除する
+        prune_hours: add() で前回の削除からこの時間が過ぎていれば prune() する
+    """
+
+    def __init__(self, path: str = TWEET_HISTORY_DB, max_age_days: float = TWEET_HISTORY_MAX_AGE_DAYS,
+                 prune_hours: float = TWEET_HISTORY_PRUNE_HOURS):
+        self.path = path
+        self.max_age_days = max_age_days
+        self.prune_hours = prune_hours
+        self._pruned_at = time.time()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA foreign_keys = ON')
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def add(self, text: str, status: str = 'generated', source: str = '') -> int:
+        """
+        ツイートを履歴に追加する
+
+        Args:
+            text: ツイート本文
+            status: 'generated' または 'posted'
+            source: 生成元（スクリプト名など）
+
+        Returns:
+            int: 追加した履歴のID
+        """
+        grams = tweet_ngrams(text)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'INSERT INTO tweets (text, status, source, gram_count, created_at) VALUES (?, ?, ?, ?, ?)',
+                (text, status, source, len(grams), time.time())
+            )
+            tweet_id = cursor.lastrowid
+            self._conn.executemany(
+                'INSERT INTO grams (gram, tweet_id) VALUES (?, ?)',
+                [(gram, tweet_id) for gram in grams]
+            )
+        # 常駐モードではプロセスが何日も動き続けるので、一定間隔で古い履歴を削除する
+        if self.prune_hours > 0 and time.time() - self._pruned_at >= self.prune_hours * 3600:
+            self.prune()
+        return tweet_id
+
+    def mark_posted(self, text: str) -> None:
+        """同じ本文の最新の履歴を投稿済みに更新する（履歴になければ追加する）"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE tweets SET status = 'posted' "
+                "WHERE id = (SELECT MAX(id) FROM tweets WHERE text = ?)",
+                (text,)
+            )
+        if not cursor.rowcount:
+            self.add(text, status='posted')
+
+    def most_similar(self, text: str) -> tuple:
+        """
+        最も似ている過去ツイートを探す
+
+        転置インデックスで共通n-gramを持つツイートだけを集計し、Jaccard係数を計算する。
+
+        Args:
+            text: 候補のツイート本文
+
+        Returns:
+            tuple: (類似度, 過去ツイート本文)。履歴が空なら(0.0, None)
+        """
+        grams = tweet_ngrams(text)
+        if not grams:
+            return 0.0, None
+        placeholders = ','.join('?' * len(grams))
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT t.id, t.text, t.gram_count, COUNT(*) AS shared
+                FROM grams g JOIN tweets t ON t.id = g.tweet_id
+                WHERE g.gram IN ({placeholders})
+                GROUP BY t.id
+                """,
+                list(grams)
+            ).fetchall()
+        best_score, best_text = 0.0, None
+        for _, past_text, gram_count, shared in rows:
+            score = shared / (len(grams) + gram_count - shared)
+            if score > best_score:
+                best_score, best_text = score, past_text
+        return best_score, best_text
+
+    def recent_texts(self, limit: int = 50) -> list:
+        """新しい順に最大limit件の過去ツイート本文を返す"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT text FROM tweets ORDER BY created_at DESC LIMIT ?', (limit,)
+            ).fetchall()
+        return [text for (text,) in rows]
+
+    def recent(self, limit: int = 1, source: str = None) -> list:
+        """
+        新しい順に最大limit件の履歴を返す
+
+        Args:
+            limit: 件数
+            source: 生成元で絞り込む（Noneならすべて）
+
+        Returns:
+            list: [{"id", "text", "status", "source", "created_at"}, ...]
+        """
+        query = 'SELECT id, text, status, source, created_at FROM tweets'
+        params = []
+        if source:
+            query += ' WHERE source = ?'
+            params.append(source)
+        query += ' ORDER BY created_at DESC LIMIT ?'
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [
+            {"id": row[0], "text": row[1], "status": row[2], "source": row[3], "created_at": row[4]}
+            for row in rows
+        ]
+
+    def is_duplicate(self, text: str, threshold: float = TWEET_SIMILARITY_THRESHOLD) -> bool:
+        """過去ツイートとの類似度がthreshold以上ならTrue"""
+        score, past_text = self.most_similar(text)
+        if score >= threshold:
+            logger.warning(f"過去のツイートと類似しています（類似度{score:.2f}）: {past_text}")
+            return True
+        return False
+
+    def prune(self, max_age_days: float = None) -> int:
+        """
+        古い履歴を削除する
+
+        Args:
+            max_age_days: 保持日数（Noneなら初期化時の値）
+
+        Returns:
+            int: 削除した件数
+        """
+        max_age_days = self.max_age_days if max_age_days is None else max_age_days
+        self._pruned_at = time.time()
+        cutoff = self._pruned_at - max_age_days * 86400
+        with self._lock, self._conn:
+            cursor = self._conn.execute('DELETE FROM tweets WHERE created_at < ?', (cutoff,))
+        if cursor.rowcount:
+            logger.info(f"ツイート履歴を{cursor.rowcount}件削除しました")
+        return cursor.rowcount
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_history() -> TweetHistory:
+    """
+    プロセス内で共有する履歴ストアを返す（初回に古い履歴を削除する）
+
+    Returns:
+        TweetHistory: 履歴ストア
+    """
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = TweetHistory()
+            _history.prune()
+        return _history
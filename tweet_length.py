@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+X（Twitter）の重み付き文字数カウントと、上限に収めるための調整
+twitter-text v3 の数え方（CJK・絵文字は2、URLは23）に合わせる
+"""
+
+import re
+import unicodedata
+
+
+MAX_WEIGHTED_LENGTH = 280
+URL_LENGTH = 23
+
+# 重み1（半角扱い）になるコードポイント範囲。それ以外は重み2
+_LIGHT_RANGES = (
+    (0x0000, 0x10FF),
+    (0x2000, 0x200D),
+    (0x2010, 0x201F),
+    (0x2032, 0x2037),
+)
+
+_URL = re.compile(r'https?://[^\s　]+')
+_TRAILING_HASHTAGS = re.compile(r'(?:\s*[#＃][^\s#＃]+)+\s*$')
+_SENTENCE_END = re.compile(r'[。！？!?\n]+')
+
+_ZWJ = 0x200D
+_KEYCAP = 0x20E3
+
+
+def _is_extender(cp: int) -> bool:
+    """直前の文字と同じ書記素クラスタに属するコードポイントか"""
+    return (
+        0xFE00 <= cp <= 0xFE0F          # 異体字セレクタ
+        or 0x1F3FB <= cp <= 0x1F3FF     # 肌の色修飾子
+        or 0xE0020 <= cp <= 0xE007F     # タグ文字（旗）
+        or cp == _KEYCAP
+        or cp == _ZWJ
+        or unicodedata.category(chr(cp)) in ('Mn', 'Me', 'Mc')
+    )
+
+
+def _is_regional_indicator(cp: int) -> bool:
+    return 0x1F1E6 <= cp <= 0x1F1FF
+
+
+def _is_emoji(cp: int) -> bool:
+    return (
+        0x1F000 <= cp <= 0x1FAFF
+        or 0x2600 <= cp <= 0x27BF
+        or 0x2300 <= cp <= 0x23FF
+        or 0x2B00 <= cp <= 0x2BFF
+        or cp in (0x00A9, 0x00AE, 0x203C, 0x2049, 0x2122, 0x2139, 0x3030, 0x303D, 0x3297, 0x3299)
+    )
+
+
+def graphemes(text: str) -> list:
+    """
+    テキストを書記素クラスタ（見た目の1文字）に分割する
+
+    結合文字・異体字セレクタ・ZWJ連結・肌の色・国旗のペアをまとめて1文字として扱う。
+
+    Args:
+        text: 分割するテキスト
+
+    Returns:
+        list: 書記素クラスタのリスト
+    """
+    clusters = []
+    join_next = False
+    for ch in text:
+        cp = ord(ch)
+        if clusters and (join_next or _is_extender(cp)):
+            clusters[-1] += ch
+            join_next = cp == _ZWJ
+            continue
+        if clusters and _is_regional_indicator(cp):
+            last = clusters[-1]
+            if len(last) == 1 and _is_regional_indicator(ord(last)):
+                clusters[-1] += ch
+                continue
+        clusters.append(ch)
+        join_next = False
+    return clusters
+
+
+def _cluster_weight(cluster: str) -> int:
+    codepoints = [ord(ch) for ch in cluster]
+    if any(_is_emoji(cp) for cp in codepoints) or 0xFE0F in codepoints or _ZWJ in codepoints:
+        return 2
+    weight = 0
+    for cp in codepoints:
+        weight += 1 if any(low <= cp <= high for low, high in _LIGHT_RANGES) else 2
+    return weight
+
+
+def weighted_length(text: str) -> int:
+    """
+    Xの数え方でツイートの長さを数える
+
+    CJK文字・全角記号・絵文字は2、ラテン文字などは1、URLは長さに関係なく23として数える。
+
+    Args:
+        text: ツイート本文
+
+    Returns:
+        int: 重み付き文字数（上限は280）
+    """
+    text = unicodedata.normalize('NFC', text or '')
+    total = 0
+    position = 0
+    for match in _URL.finditer(text):
+        total += sum(_cluster_weight(c) for c in graphemes(text[position:match.start()]))
+        total += URL_LENGTH
+        position = match.end()
+    total += sum(_cluster_weight(c) for c in graphemes(text[position:]))
+    return total
+
+
+def remaining_length(text: str, limit: int = MAX_WEIGHTED_LENGTH) -> int:
+    """上限までの残り（負なら超過分）"""
+    return limit - weighted_length(text)
+
+
+def is_within_limit(text: str, limit: int = MAX_WEIGHTED_LENGTH) -> bool:
+    """ツイートが上限に収まっているか"""
+    return weighted_length(text) <= limit
+
+
+def _trim_to(text: str, budget: int, ellipsis: str = '…') -> str:
+    """書記素単位で、末尾に省略記号を付けてbudgetに収める"""
+    budget -= weighted_length(ellipsis)
+    used = 0
+    kept = []
+    for cluster in graphemes(text):
+        weight = _cluster_weight(cluster)
+        if used + weight > budget:
+            break
+        kept.append(cluster)
+        used += weight
+    return ''.join(kept).rstrip() + ellipsis
+
+
+def fit_tweet(text: str, limit: int = MAX_WEIGHTED_LENGTH) -> str:
+    """
+    ツイートを上限に収める
+
+    末尾のハッシュタグは残したまま本文を短くする。まず文の区切りで切り、
+    それでも収まらない場合は書記素単位で切って「…」を付ける。
+    ハッシュタグだけで上限を超える場合は、末尾のタグから削る。
+
+    Args:
+        text: ツイート本文
+        limit: 重み付き文字数の上限
+
+    Returns:
+        str: 上限に収まるツイート本文
+    """
+    text = unicodedata.normalize('NFC', text.strip())
+    if weighted_length(text) <= limit:
+        return text
+
+    match = _TRAILING_HASHTAGS.search(text)
+    body = text[:match.start()].rstrip() if match else text
+    tags = match.group().split() if match else []
+
+    while tags and weighted_length(' '.join(tags)) + 1 > limit // 2:
+        tags.pop()
+    tail = (' ' + ' '.join(tags)) if tags else ''
+    budget = limit - weighted_length(tail)
+
+    # 文の区切りで切れる位置を後ろから探す（本文が半分以下になる切り方はしない）
+    cut_points = [m.end() for m in _SENTENCE_END.finditer(body)]
+    for end in reversed(cut_points):
+        candidate = body[:end].rstrip()
+        length = weighted_length(candidate)
+        if length <= budget:
+            if length >= budget // 2:
+                return candidate + tail
+            break
+
+    return _trim_to(body, budget) + tail
+
+
+def shorten_request(text: str, limit: int = MAX_WEIGHTED_LENGTH) -> str:
+    """
+    上限を超えたツイートを書き直してもらうための指示文を作る
+
+    Args:
+        text: 上限を超えたツイート本文
+        limit: 重み付き文字数の上限
+
+    Returns:
+        str: 正確な超過分を伝える指示文
+    """
+    length = weighted_length(text)
+    over = length - limit
+    return (
+        f"このツイートはXの文字数換算で{length}あり、上限{limit}を{over}超えています"
+        f"（日本語・全角記号・絵文字は1文字で2、半角英数字は1として数えます）。"
+        f"ハッシュタグと口調は保ったまま、{over}以上短くして書き直してください。"
+        f"ツイート本文のみを出力してください。"
+    )
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+ツイート候補のローカル評価
+文字数・ハッシュタグ・🐻・「クマ」の語尾・過去ツイートとの新規性で候補に点数を付ける
+"""
+
+import logging
+import re
+
+from tweet_length import MAX_WEIGHTED_LENGTH, weighted_length
+
+logger = logging.getLogger(__name__)
+
+
+# 評価項目の重み
+CANDIDATE_WEIGHTS = {
+    'length': 0.25,
+    'hashtags': 0.25,
+    'bear': 0.1,
+    'kuma_ending': 0.15,
+    'novelty': 0.25,
+}
+
+REQUIRED_HASHTAGS = ('#生成AI', '#AI')
+# この範囲（Xの重み付き文字数）に収まっていれば文字数の点数は満点
+IDEAL_LENGTH = (160, 260)
+
+_SENTENCE_END = re.compile(r'[。！？!?\n]+')
+_KUMA_ENDING = re.compile(r'クマ[よねなぁ〜ー～…✨🐻💡🌟🎨🔥🚀\s]*$')
+
+
+def has_hashtag(text: str, tag: str) -> bool:
+    """ハッシュタグが独立したタグとして含まれているか（#AIが#AIxxにマッチしないようにする）"""
+    return re.search(re.escape(tag) + r'(?![\w])', text) is not None
+
+
+def length_score(text: str, max_length: int = MAX_WEIGHTED_LENGTH, ideal: tuple = IDEAL_LENGTH) -> float:
+    """重み付き文字数の点数（理想範囲で1.0、上限超過で0.0）"""
+    length = weighted_length(text)
+    if length > max_length:
+        return 0.0
+    low, high = ideal
+    if length < low:
+        return length / low
+    if length > high:
+        return 1.0 - 0.5 * (length - high) / (max_length - high)
+    return 1.0
+
+
+def kuma_ending_score(text: str) -> float:
+    """「〜クマ」で終わる文の割合（2文以上あれば満点）"""
+    sentences = [s.strip() for s in _SENTENCE_END.split(text) if s.strip() and not s.strip().startswith('#')]
+    if not sentences:
+        return 0.0
+    endings = sum(1 for s in sentences if _KUMA_ENDING.search(s))
+    return min(endings / 2, 1.0)
+
+
+def score_tweet_candidate(text: str, history=None, weights: dict = None, hashtags: tuple = REQUIRED_HASHTAGS) -> dict:
+    """
+    ツイート候補に点数を付ける
+
+    Args:
+        text: 候補のツイート本文
+        history: 新規性の判定に使うTweetHistory（Noneなら新規性は満点扱い）
+        weights: 評価項目の重み（Noneなら CANDIDATE_WEIGHTS。キャラクターごとに変える）
+        hashtags: 必須のハッシュタグ
+
+    Returns:
+        dict: {"text", "total", "scores": {項目: 点数}, "similarity", "past_tweet"}
+    """
+    similarity, past_tweet = history.most_similar(text) if history else (0.0, None)
+    scores = {
+        'length': length_score(text),
+        'hashtags': sum(has_hashtag(text, tag) for tag in hashtags) / len(hashtags) if hashtags else 1.0,
+        'bear': 1.0 if '🐻' in text else 0.0,
+        'kuma_ending': kuma_ending_score(text),
+        'novelty': 1.0 - similarity,
+    }
+    weights = weights or CANDIDATE_WEIGHTS
+    total = sum(weights.get(name, 0.0) * value for name, value in scores.items())
+    return {
+        'text': text,
+        'total': total,
+        'scores': scores,
+        'similarity': similarity,
+        'past_tweet': past_tweet,
+    }
+
+
+def rank_candidates(candidates: list, history=None, weights: dict = None,
+                    hashtags: tuple = REQUIRED_HASHTAGS) -> list:
+    """
+    候補を点数の高い順に並べる
+
+    Args:
+        candidates: 候補のツイート本文のリスト
+        history: 新規性の判定に使うTweetHistory
+        weights: 評価項目の重み（Noneなら CANDIDATE_WEIGHTS）
+        hashtags: 必須のハッシュタグ
+
+    Returns:
+        list: score_tweet_candidateの結果を点数の高い順に並べたリスト
+    """
+    ranked = sorted(
+        (score_tweet_candidate(text, history, weights, hashtags) for text in candidates),
+        key=lambda result: result['total'],
+        reverse=True
+    )
+    for i, result in enumerate(ranked):
+        details = ', '.join(f"{name}={value:.2f}" for name, value in result['scores'].items())
+        logger.debug(f"候補{i + 1}: {result['total']:.2f}点（{details}）")
+    return ranked
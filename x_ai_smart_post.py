@@ -7,68 +7,58 @@ X (Twitter) 生成AI情報自動投稿スクリプト (GitHub Actions版)
 
 import os
 import logging
+import sqlite3
 import sys
+import time
 from datetime import datetime
 
-try:
-    import tweepy
-except ImportError:
-    print("エラー: tweepyライブラリがインストールされていません")
-    sys.exit(1)
-
-try:
-    from openai import OpenAI
-except ImportError:
-    print("エラー: openaiライブラリがインストールされていません")
-    sys.exit(1)
+from article_queue import get_queue
+from llm_client import LLM_CACHE_MODE, complete
+from personas import (
+    enabled_personas, enqueue_persona_tweets, fan_out, generate_persona_tweet, get_persona, record_history
+)
+from pipeline import Pipeline, Stage, StageError
+from post_outbox import drain_outbox, get_outbox
+from resilience import start_deadline
+from run_archive import archive_failed_run, get_archive
+from run_snapshots import capture_exchanges, new_run_id, save_snapshot
+from tweet_history import get_history
+from telemetry import metrics, start_metrics, traced, write_github_output, write_metrics
+from tweet_length import MAX_WEIGHTED_LENGTH, is_within_limit, weighted_length
+from x_api import DEFAULT_ACCOUNT, get_x_client, load_credentials
 
 
-# ログ設定
+# ログ設定（ハンドラはエントリーポイントでsetup_loggingが設定する）
 LOG_FILE = "x_ai_smart_post.log"
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 
-# 文字数制限
-MAX_TWEET_LENGTH = 280
+# 文字数制限（Xの重み付き文字数）
+MAX_TWEET_LENGTH = MAX_WEIGHTED_LENGTH
+
+# トレンドのリサーチに使うモデル
+RESEARCH_MODEL = os.getenv('RESEARCH_MODEL', 'gpt-4o-mini')
+
+# このスクリプトの主キャラクター（X_API_KEY などのアカウントに投稿する）。ほかは TWEET_PERSONAS で追加する
+PRIMARY_PERSONA = 'soft'
 
 
 def load_config_from_env() -> dict:
-    """環境変数から認証情報を読み込む"""
-    config = {
-        'api_key': os.getenv('X_API_KEY'),
-        'api_secret': os.getenv('X_API_SECRET'),
-        'access_token': os.getenv('X_ACCESS_TOKEN'),
-        'access_token_secret': os.getenv('X_ACCESS_TOKEN_SECRET')
-    }
-    
-    # 必須項目のチェック
-    missing_keys = [key for key, value in config.items() if not value]
-    
-    if missing_keys:
-        raise ValueError(f"環境変数が設定されていません: {', '.join(missing_keys)}")
-    
-    return config
+    """環境変数から認証情報を読み込む（X_API_KEY / X_API_SECRET / X_ACCESS_TOKEN / X_ACCESS_TOKEN_SECRET）"""
+    return load_credentials(DEFAULT_ACCOUNT)
 
 
-def create_api_client(config: dict) -> tweepy.Client:
-    """X API v2クライアントを作成"""
-    client = tweepy.Client(
-        consumer_key=config['api_key'],
-        consumer_secret=config['api_secret'],
-        access_token=config['access_token'],
-        access_token_secret=config['access_token_secret']
-    )
-    return client
+def warm_up() -> None:
+    """常駐モードの起動時に、HTTP・LLMクライアントとツイート履歴を用意しておく"""
+    from llm_client import get_client
+    get_client()
+    get_history()
+    get_queue()
+    get_outbox()
+    get_x_client(DEFAULT_ACCOUNT)
 
 
+@traced()
 def research_ai_trends() -> str:
     """
     LLMを使用して生成AI最新トレンドをリサーチ
@@ -80,11 +70,9 @@ def research_ai_trends() -> str:
     
     # OpenAI APIキーを環境変数から取得
     api_key = os.getenv('OPENAI_API_KEY')
-    if not api_key:
+    if not api_key and LLM_CACHE_MODE != 'replay':
         raise ValueError("OPENAI_API_KEY環境変数が設定されていません")
     
-    client = OpenAI(api_key=api_key)
-    
     # 現在の日付を取得
     current_date = datetime.now().strftime('%Y年%m月%d日')
     
@@ -100,8 +88,8 @@ def research_ai_trends() -> str:
 300文字程度で、ポイントを絞って説明してください。"""
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+        research_result = complete(
+            model=RESEARCH_MODEL,
             messages=[
                 {"role": "system", "content": "あなたは生成AI技術の最新動向に詳しい専門家です。"},
                 {"role": "user", "content": prompt}
@@ -110,7 +98,6 @@ def research_ai_trends() -> str:
             temperature=0.7
         )
         
-        research_result = response.choices[0].message.content.strip()
         logger.info(f"リサーチ完了: {len(research_result)}文字")
         return research_result
         
@@ -119,6 +106,7 @@ def research_ai_trends() -> str:
         return "生成AI分野は日々進化しており、ChatGPT、Claude、Geminiなどの大規模言語モデルが注目を集めています。"
 
 
+@traced()
 def generate_tweet_with_insight(research_data: str) -> str:
     """
     リサーチ結果から所感付きツイートを生成（くーたん博士風）
@@ -129,137 +117,219 @@ def generate_tweet_with_insight(research_data: str) -> str:
     Returns:
         str: 生成されたツイート本文
     """
-    logger.info("所感付きツイートを生成中（くーたん博士風）...")
-    
-    api_key = os.getenv('OPENAI_API_KEY')
-    client = OpenAI(api_key=api_key)
+    return generate_persona_tweet(get_persona(PRIMARY_PERSONA), research_data, source='x_ai_smart_post')
+
+
+def _mark_posted(text: str) -> None:
+    get_history().mark_posted(text)
+
+
+def post_tweet(text: str) -> bool:
+    """
+    ツイートを送信箱に入れてから投稿する
+
+    前回までに投稿できずに残っているツイートがあれば、それも古い順に投稿する。
+    投稿できなかったツイートは送信箱に残り、次回の実行で再送される。
+
+    Returns:
+        bool: このツイートを投稿できたか
+    """
+    if not is_within_limit(text, MAX_TWEET_LENGTH):
+        logger.error(f"ツイートが長すぎます（X換算{weighted_length(text)} > {MAX_TWEET_LENGTH}）")
+        return False
     
-    prompt = f"""以下の生成AI最新トレンド情報をもとに、魅力的なツイートを作成してください。
-
-【最新トレンド情報】
-{research_data}
-
-【要件】
-- 280文字以内の日本語で作成
-- 「くーたん博士」というキャラクターとして投稿
-- 親しみやすく、かわいい口調を使用（「〜だよ」「〜なの」「〜だね」「わくわく」「すごい」「びっくり」など）
-- 最新トレンドのポイントを簡潔に紹介
-- くーたん博士としての所感や考察を必ず含める
-- 読者に語りかけるような親しみやすい表現
-- ハッシュタグを1〜2個含める（#生成AI #AI #ChatGPT #Claude など）
-- かわいい絵文字を2〜3個使用（🤖✨💡🎨🌟😊🚀など）
-- ポジティブで前向きなトーン
-- 専門的な内容も分かりやすく説明
-
-【くーたん博士の口調例】
-- 「〜だよ！」「〜なんだよね」「〜だと思うの」
-- 「すごいね！」「わくわくするね！」「びっくりだよ！」
-- 「みんなも〜してみてね」「一緒に〜しよう」
-
-ツイート本文のみを出力してください。説明や前置きは不要です。"""
+    outbox = get_outbox()
+    post_id, previous = outbox.enqueue(text, account=DEFAULT_ACCOUNT, source='x_ai_smart_post')
+    if previous == 'failed':
+        logger.info(f"以前に投稿できなかった同じ内容のツイートを、送信箱で投稿待ちに戻しました: ID={post_id}")
+    # 送信箱に残っているほかのアカウントのツイートも並行して投稿する
+    drain_outbox(outbox, accounts=sorted(set(outbox.accounts_with_pending()) | {DEFAULT_ACCOUNT}),
+                 on_posted=_mark_posted)
     
+    if previous == 'posted':
+        # 同じ本文は投稿済み（定型のフォールバック文など）。重複投稿になるので、このツイートは投稿していない
+        logger.warning(f"同じ内容のツイートがすでに投稿済みのため、投稿しませんでした: {text}")
+        return False
+    post = outbox.get(post_id)
+    if post['status'] == 'posted':
+        logger.info(f"投稿内容: {text}")
+        return True
+    if post['status'] == 'failed':
+        logger.error(f"ツイート投稿失敗: {post['last_error']}")
+    else:
+        logger.warning(f"ツイートを送信箱に残しました（次回の実行で再送します）: {post['last_error']}")
+    return False
+
+
+def _check_credentials() -> str:
+    """環境変数から認証情報を読み込み、投稿先のクライアントを用意する"""
+    logger.info("環境変数から認証情報を読み込み中...")
+    load_config_from_env()
+    get_x_client(DEFAULT_ACCOUNT)
+    logger.info("認証情報読み込み完了")
+    return DEFAULT_ACCOUNT
+
+
+def _research() -> str:
+    """事前リサーチ済みの素材があれば使い、なければ生成AI最新トレンドをリサーチ"""
+    prefetched = get_queue().take('x_ai_smart_post')
+    if prefetched:
+        logger.info(f"事前リサーチ結果を使用します（{prefetched['age_seconds'] / 60:.0f}分前）")
+        metrics.increment('research.prefetched')
+        return prefetched['summary']
+    return research_ai_trends()
+
+
+def _generate_tweets(personas: list, research_data: str) -> dict:
+    """所感付きツイートを生成（くーたん博士風）。追加のキャラクターも同じリサーチ結果から並行して生成する"""
+    return fan_out(personas, lambda persona: (
+        generate_tweet_with_insight(research_data) if persona.name == PRIMARY_PERSONA
+        else generate_persona_tweet(persona, research_data, source='x_ai_smart_post')
+    ))
+
+
+def _post(personas: list, tweets: dict, account: str) -> bool:
+    # 追加のキャラクターのツイートはそれぞれのアカウントの送信箱に入れる（主キャラクターの投稿でまとめて送る）
+    enqueue_persona_tweets(tweets, personas[1:], source='x_ai_smart_post')
+    logger.info("ツイート投稿中...")
+    return post_tweet(tweets[PRIMARY_PERSONA])
+
+
+def build_pipeline(dry_run: bool = False) -> Pipeline:
+    """
+    投稿の段階グラフ（認証情報の確認とリサーチは並行して行う）
+
+    personas（生成するキャラクターのリスト）は実行時に初期値として渡す。
+    認証情報と投稿結果はチェックポイントに残さない。
+
+    Args:
+        dry_run: ツイートの生成までで止める（認証情報の確認と投稿の段階を含めない）
+    """
+    stages = [
+        Stage('research_data', _research),
+        Stage('tweets', _generate_tweets, inputs=('personas', 'research_data')),
+    ]
+    if dry_run:
+        # 本番の実行のチェックポイントを消さないように別の名前にする
+        return Pipeline('x_ai_smart_post_dry_run', stages)
+    return Pipeline('x_ai_smart_post', [Stage('account', _check_credentials, memoize=False)] + stages + [
+        Stage('posted', _post, inputs=('personas', 'tweets', 'account'), memoize=False),
+    ])
+
+
+def save_run_snapshot(run_id: str, values: dict, exchanges: list) -> None:
+    """実行のスナップショット（リサーチ結果・LLMとのやり取り・ツイート）を保存する。失敗しても実行は続ける"""
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "あなたは『くーたん博士』という生成AI技術に詳しいキャラクターです。親しみやすく、かわいい口調で、専門的な内容を分かりやすく楽しく伝えるのが得意です。"},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=500,
-            temperature=0.9
-        )
-        
-        tweet_text = response.choices[0].message.content.strip()
-        
-        # 引用符を削除（もしあれば）
-        tweet_text = tweet_text.strip('"').strip("'")
-        
-        # 文字数チェック
-        if len(tweet_text) > MAX_TWEET_LENGTH:
-            logger.warning(f"生成されたツイートが長すぎます（{len(tweet_text)}文字）。切り詰めます。")
-            tweet_text = tweet_text[:MAX_TWEET_LENGTH-3] + "..."
-        
-        logger.info(f"ツイート生成完了: {len(tweet_text)}文字")
-        logger.info(f"生成内容: {tweet_text}")
-        return tweet_text
-        
-    except Exception as e:
-        logger.error(f"ツイート生成エラー: {e}")
-        return "生成AIの世界、今日もすごい進化してるよ🤖✨ 新しい技術がどんどん出てきてワクワクが止まらないの！みんなも一緒に楽しもうね💡 #生成AI #AI"
+        save_snapshot('x_ai_smart_post', {
+            'personas': [persona.name for persona in values['personas']],
+            'research_data': values['research_data'],
+            # 重複の評価に使うので、この実行で生成したツイートは除く
+            'recent_tweets': [text for text in get_history().recent_texts() if text not in values['tweets'].values()],
+            'tweets': values['tweets'],
+            'exchanges': exchanges,
+            'metrics': metrics.summary(),
+        }, run_id=run_id)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"スナップショットの保存に失敗しました: {e}")
 
 
-def post_tweet(client: tweepy.Client, text: str) -> bool:
-    """ツイートを投稿"""
+def archive_run(run_id: str, values: dict) -> None:
+    """実行記録（リサーチ結果・ツイート・投稿結果・メトリクス）をアーカイブに追記する。失敗しても実行は続ける"""
     try:
-        if len(text) > MAX_TWEET_LENGTH:
-            logger.error(f"ツイートが長すぎます（{len(text)}文字 > {MAX_TWEET_LENGTH}文字）")
-            return False
-        
-        response = client.create_tweet(text=text)
-        
-        if response.data:
-            tweet_id = response.data['id']
-            logger.info(f"ツイート投稿成功: ID={tweet_id}")
-            logger.info(f"投稿内容: {text}")
-            return True
-        else:
-            logger.error("ツイート投稿失敗: レスポンスが空です")
-            return False
-            
-    except tweepy.TweepyException as e:
-        logger.error(f"ツイート投稿失敗: {e}")
-        return False
-    except Exception as e:
-        logger.error(f"予期しないエラー: {e}")
-        return False
+        get_archive().append({
+            'run_id': run_id,
+            'script': 'x_ai_smart_post',
+            'created_at': time.time(),
+            'articles': [],
+            'summary': values['research_data'],
+            'tweet': values['tweets'][PRIMARY_PERSONA],
+            'tweets': values['tweets'],
+            'posted': values['posted'],
+            'metrics': metrics.summary(),
+        })
+    except (OSError, TypeError, ValueError, sqlite3.Error) as e:
+        logger.warning(f"実行記録のアーカイブに失敗しました: {e}")
 
 
-def main():
-    """メイン処理"""
+def _archive_failure(error: BaseException, dry_run: bool) -> None:
+    """途中で止まった実行もエラーとメトリクスをアーカイブに残す（ドライランは残さない）"""
+    if not dry_run:
+        archive_failed_run(new_run_id('x_ai_smart_post'), 'x_ai_smart_post', error, metrics.summary())
+
+
+def main(resume: bool = True, dry_run: bool = False) -> int:
+    """
+    メイン処理（終了コードを返す）
+    
+    Args:
+        resume: 前回失敗した実行の途中結果（リサーチ・生成したツイート）から再開するか
+        dry_run: ツイートを生成して表示するだけで投稿しない（X APIの認証情報は不要）
+    """
     logger.info("=" * 60)
     logger.info("X 生成AI情報自動投稿スクリプト開始（くーたん博士モード）")
     logger.info("=" * 60)
+    start_metrics()
+    start_deadline()
     
     try:
-        # 環境変数から認証情報を読み込み
-        logger.info("環境変数から認証情報を読み込み中...")
-        config = load_config_from_env()
-        logger.info("認証情報読み込み完了")
-        
-        # APIクライアント作成
-        logger.info("APIクライアント作成中...")
-        client = create_api_client(config)
-        logger.info("APIクライアント作成完了")
-        
-        # 生成AI最新トレンドをリサーチ
-        research_data = research_ai_trends()
-        
-        # 所感付きツイートを生成（くーたん博士風）
-        tweet_text = generate_tweet_with_insight(research_data)
-        
-        # ツイート投稿
-        logger.info("ツイート投稿中...")
-        if post_tweet(client, tweet_text):
+        # ドライランで生成したツイートは投稿しないので履歴に残さない
+        with capture_exchanges() as exchanges, record_history(not dry_run):
+            values = build_pipeline(dry_run).run(resume=resume, personas=enabled_personas(PRIMARY_PERSONA))
+        run_id = new_run_id('x_ai_smart_post')
+        save_run_snapshot(run_id, values, exchanges)
+        if dry_run:
+            for name, text in values['tweets'].items():
+                print(f"[{name}] {text}")
+            logger.info("✓ ツイートを生成しました（投稿はしていません）")
+            return 0
+        archive_run(run_id, values)
+        if values['posted']:
             logger.info("✓ ツイート投稿が正常に完了しました")
-            sys.exit(0)
+            return 0
         else:
             logger.error("✗ ツイート投稿に失敗しました")
-            sys.exit(1)
+            return 1
             
+    except StageError as e:
+        _archive_failure(e.cause, dry_run)
+        if isinstance(e.cause, ValueError):
+            logger.error(f"設定エラー: {e.cause}")
+            return 1
+        logger.error(f"予期しないエラー: {e}")
+        import traceback
+        logger.error(''.join(traceback.format_exception(type(e.cause), e.cause, e.cause.__traceback__)))
+        return 1
     except ValueError as e:
+        _archive_failure(e, dry_run)
         logger.error(f"設定エラー: {e}")
-        sys.exit(1)
+        return 1
     except Exception as e:
+        _archive_failure(e, dry_run)
         logger.error(f"予期しないエラー: {e}")
         import traceback
         logger.error(traceback.format_exc())
-        sys.exit(1)
+        return 1
     finally:
+        # 実行メトリクス（段階別の所要時間・トークン数）
+        write_github_output(write_metrics())
         logger.info("=" * 60)
         logger.info("X 生成AI情報自動投稿スクリプト終了")
         logger.info("=" * 60)
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    from log_setup import setup_logging
+    setup_logging(LOG_FILE)
+    parser = argparse.ArgumentParser(description="X 生成AI情報自動投稿スクリプト")
+    parser.add_argument('--daemon', action='store_true', help="常駐してJSTの実行枠ごとに投稿する")
+    parser.add_argument('--no-resume', action='store_true', help="前回失敗した実行の途中結果を使わずに最初から実行する")
+    parser.add_argument('--dry-run', action='store_true', help="ツイートを生成して表示するだけで投稿しない")
+    args = parser.parse_args()
+    if args.daemon:
+        from scheduler import run_daemon
+        # 事前リサーチはニュース検索を使う generate_tweet の処理をバックグラウンドで回す
+        from generate_tweet import prefetch_research
+        sys.exit(run_daemon(main, 'x_ai_smart_post', warmup=warm_up, background=prefetch_research))
+    sys.exit(main(resume=not args.no_resume, dry_run=args.dry_run))
 
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+X API v2 クライアント
+ツイート投稿（POST /2/tweets）をOAuth 1.0aで呼び出し、レスポンスのレート制限ヘッダーを読み取る
+"""
+
+import logging
+import os
+import threading
+import time
+
+import requests
+
+from http_cache import get_session
+
+logger = logging.getLogger(__name__)
+
+
+# X APIの設定（環境変数で上書き可能）
+# X_API_BASE_URL: 接続先（ローカルのモックサーバーで試すときに変える）
+X_API_BASE_URL = os.getenv('X_API_BASE_URL', 'https://api.x.com')
+X_API_TIMEOUT = float(os.getenv('X_API_TIMEOUT', '15'))
+# 投稿先のアカウント（カンマ区切り）。default 以外は X_<名前>_API_KEY などの認証情報を使う
+X_ACCOUNTS = os.getenv('X_ACCOUNTS', 'default')
+
+DEFAULT_ACCOUNT = 'default'
+# scripts/post_tweet.py の投稿先（TWITTER_API_KEY などの認証情報を使う）
+TWITTER_ACCOUNT = 'twitter'
+
+# レート制限ヘッダーの組（15分窓のエンドポイント制限と、24時間のユーザー・アプリ単位の上限）
+_RATE_LIMIT_HEADERS = (
+    ('x-rate-limit-remaining', 'x-rate-limit-reset', 'x-rate-limit-limit'),
+    ('x-user-limit-24hour-remaining', 'x-user-limit-24hour-reset', 'x-user-limit-24hour-limit'),
+    ('x-app-limit-24hour-remaining', 'x-app-limit-24hour-reset', 'x-app-limit-24hour-limit'),
+)
+_CREDENTIAL_KEYS = ('api_key', 'api_secret', 'access_token', 'access_token_secret')
+
+
+class RateLimit:
+    """
+    レスポンスヘッダーから読んだレート制限
+
+    複数の制限があるときは、残り回数が最も少ない（同じならリセットが遅い）ものを採る。
+
+    Args:
+        limit: 窓あたりの上限（不明ならNone）
+        remaining: 残り回数（不明ならNone）
+        reset_at: 窓がリセットされる時刻（UNIX秒、不明ならNone）
+    """
+
+    def __init__(self, limit: int = None, remaining: int = None, reset_at: float = None):
+        self.limit = limit
+        self.remaining = remaining
+        self.reset_at = reset_at
+
+    @classmethod
+    def from_headers(cls, headers) -> 'RateLimit':
+        tightest = cls()
+        for remaining_key, reset_key, limit_key in _RATE_LIMIT_HEADERS:
+            try:
+                remaining = int(headers[remaining_key])
+                reset_at = float(headers[reset_key])
+            except (KeyError, TypeError, ValueError):
+                continue
+            limit = headers.get(limit_key)
+            candidate = cls(int(limit) if limit and limit.isdigit() else None, remaining, reset_at)
+            if tightest.remaining is None or (remaining, -reset_at) < (tightest.remaining, -tightest.reset_at):
+                tightest = candidate
+        return tightest
+
+    def wait_seconds(self, now: float = None) -> float:
+        """次のリクエストまでに待つべき秒数（残り回数があれば0）"""
+        if self.remaining is None or self.remaining > 0 or self.reset_at is None:
+            return 0.0
+        now = time.time() if now is None else now
+        return max(self.reset_at - now, 0.0)
+
+    def __repr__(self) -> str:
+        return f"RateLimit(limit={self.limit}, remaining={self.remaining}, reset_at={self.reset_at})"
+
+
+class XApiError(Exception):
+    """
+    X APIの呼び出しに失敗した
+
+    Args:
+        message: エラー内容
+        status_code: HTTPステータス（通信エラーならNone）
+        rate_limit: レスポンスのレート制限
+        retry_after: Retry-Afterヘッダーの秒数
+    """
+
+    def __init__(self, message: str, status_code: int = None, rate_limit: RateLimit = None,
+                 retry_after: float = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.rate_limit = rate_limit or RateLimit()
+        self.retry_after = retry_after
+
+    @property
+    def rate_limited(self) -> bool:
+        return self.status_code == 429
+
+    @property
+    def duplicate(self) -> bool:
+        """同じ内容のツイートがすでに投稿されている（前回の試行が実は成功していた）"""
+        return self.status_code == 403 and 'duplicate' in str(self).lower()
+
+    @property
+    def retryable(self) -> bool:
+        """時間をおけば成功しうる（通信エラー・429・5xx）"""
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+
+def account_names() -> list:
+    """投稿先のアカウント名のリスト（X_ACCOUNTS）"""
+    return [name.strip() for name in X_ACCOUNTS.split(',') if name.strip()] or [DEFAULT_ACCOUNT]
+
+
+def load_credentials(account: str = DEFAULT_ACCOUNT) -> dict:
+    """
+    アカウントの認証情報を環境変数から読み込む
+
+    default は X_API_KEY / X_API_SECRET / X_ACCESS_TOKEN / X_ACCESS_TOKEN_SECRET、
+    twitter は TWITTER_API_KEY など、それ以外は X_<名前>_API_KEY のように名前を挟んだ環境変数を使う。
+
+    Raises:
+        ValueError: 環境変数が設定されていない
+    """
+    if account == DEFAULT_ACCOUNT:
+        prefix = 'X_'
+    elif account == TWITTER_ACCOUNT:
+        prefix = 'TWITTER_'
+    else:
+        prefix = f"X_{account.upper()}_"
+    names = {key: f"{prefix}{key.upper()}" for key in _CREDENTIAL_KEYS}
+    credentials = {key: os.getenv(name) for key, name in names.items()}
+    missing = [names[key] for key, value in credentials.items() if not value]
+    if missing:
+        raise ValueError(f"環境変数が設定されていません: {', '.join(missing)}")
+    return credentials
+
+
+class XApiClient:
+    """
+    X API v2 のツイート投稿クライアント
+
+    Args:
+        credentials: 認証情報（api_key, api_secret, access_token, access_token_secret）
+        base_url: 接続先
+        timeout: 1リクエストのタイムアウト（秒）
+    """
+
+    def __init__(self, credentials: dict, base_url: str = None, timeout: float = X_API_TIMEOUT):
+        self.base_url = (base_url or X_API_BASE_URL).rstrip('/')
+        self.timeout = timeout
+        # requests_oauthlib は投稿するときだけ必要なので、クライアントを作るときに読み込む
+        from requests_oauthlib import OAuth1
+        self._auth = OAuth1(
+            credentials['api_key'],
+            client_secret=credentials['api_secret'],
+            resource_owner_key=credentials['access_token'],
+            resource_owner_secret=credentials['access_token_secret'],
+        )
+
+    def create_tweet(self, text: str) -> tuple:
+        """
+        ツイートを投稿する
+
+        Args:
+            text: ツイート本文
+
+        Returns:
+            tuple: (ツイートID, RateLimit)
+
+        Raises:
+            XApiError: 投稿に失敗した
+        """
+        try:
+            response = get_session().post(
+                f"{self.base_url}/2/tweets", json={'text': text}, auth=self._auth, timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            raise XApiError(f"通信エラー: {e}") from e
+
+        rate_limit = RateLimit.from_headers(response.headers)
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {}
+        if response.status_code in (200, 201) and (payload.get('data') or {}).get('id'):
+            return payload['data']['id'], rate_limit
+
+        detail = payload.get('detail') or payload.get('title') or response.text[:200]
+        retry_after = response.headers.get('retry-after')
+        raise XApiError(
+            f"HTTP {response.status_code}: {detail}",
+            status_code=response.status_code,
+            rate_limit=rate_limit,
+            retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+        )
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_x_client(account: str = DEFAULT_ACCOUNT) -> XApiClient:
+    """
+    プロセス内で共有するアカウントごとのクライアントを返す
+
+    Raises:
+        ValueError: 認証情報の環境変数が設定されていない
+    """
+    with _clients_lock:
+        if account not in _clients:
+            _clients[account] = XApiClient(load_credentials(account))
+        return _clients[account]